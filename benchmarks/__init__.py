@@ -0,0 +1,3 @@
+"""Performance benchmarks for the OpenBBS server. These are not run as
+part of the test suite, see the docstring of each module for usage.
+"""
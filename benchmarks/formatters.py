@@ -0,0 +1,135 @@
+"""Measures the cost of rendering large listings with the streaming
+formatters, against the string concatenation they replaced.
+
+    $ python -m benchmarks.formatters --posts 5000
+
+Both renderers are checked to produce identical output before timing.
+"""
+
+import argparse
+import random
+import textwrap
+import time
+import tracemalloc
+
+from openbbs.formatters import (box_posts, box_thread, iter_posts,
+                                iter_thread, scrub_input)
+
+
+def concatenated_posts(posts):
+    """The thread listing formatter as it was before streaming."""
+    string = "+=============================================================" \
+             "=================+\r\n|                                THREAD " \
+             "LISTING                                |\r\n+=================" \
+             "=============================================================+" \
+             "\r\n"
+
+    for post_id, pub_time, poster, subject, _ in posts:
+        poster = poster[:16] + "..." if len(poster) > 19 else poster
+        subject = subject[:24] + "..." if len(subject) > 27 else subject
+        time_text = time.strftime("%m/%d/%y %H:%M:%S",
+                                  time.localtime(pub_time))
+        string += "| #%-6d| %.17s | %-19s| %-27s|\r\n+======================" \
+                  "========================================================+" \
+                  "\r\n" % (post_id, time_text, scrub_input(poster),
+                            scrub_input(subject.strip()))
+
+    return string
+
+
+def concatenated_thread(posts):
+    """The thread formatter as it was before streaming."""
+    title = scrub_input(posts[0][3])
+    title = title[:73] + "..." if len(title) > 76 else title
+    if len(title) % 2 == 1:
+        title += " "
+
+    string = "+=============================================================" \
+             "=================+\r\n| " + ((76 - len(title)) // 2) * " " \
+             + "%s" % title + ((76 - len(title)) // 2) * " " + " |\r\n+=====" \
+             "==============================================================" \
+             "===========+\r\n"
+
+    for post_id, post_time, name, _, body in posts:
+        body = scrub_input(body)
+        name = name[:23] + "..." if len(name) > 26 else name
+        string += "| #%-9d | %-26s posted on %-26s |\r\n+===================="\
+                  "=========================================================="\
+                  "+\r\n" % (post_id, scrub_input(name), time.ctime(post_time))
+
+        for line in textwrap.wrap(body, width=76):
+            string += "| %-76s |\r\n" % line
+        string += "+========================================================" \
+                  "======================+\r\n"
+
+    return string
+
+
+def make_posts(count):
+    """Returns a synthetic thread of the given number of posts, made a
+    few at a time as replies tend to be.
+    """
+    generator = random.Random(1337)
+    words = ("lorem", "ipsum", "dolor", "sit", "amet", "consectetur",
+             "adipiscing", "elit", "sed", "do", "eiusmod", "tempor")
+    now = time.time()
+    return [(post_id, now - count + post_id // 4, "user%d" %
+             generator.randrange(100), "Subject %d" % post_id,
+             " ".join(generator.choice(words)
+                      for _ in range(generator.randint(5, 120))))
+            for post_id in range(1, count + 1)]
+
+
+def measure(function, repeat):
+    """Returns the mean time taken by function, in milliseconds."""
+    started = time.time()
+    for _ in range(repeat):
+        function()
+    return (time.time() - started) / repeat * 1000
+
+
+def peak_memory(function):
+    """Returns the peak memory allocated while running function, in
+    kilobytes.
+    """
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def drain(chunks):
+    """Consumes a stream of chunks the way a session sends them."""
+    for _ in chunks:
+        pass
+
+
+def main():
+    """Prints the cost of each renderer."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    arguments = parser.parse_args()
+
+    posts = make_posts(arguments.posts)
+    assert concatenated_posts(posts) == box_posts(posts)
+    assert concatenated_thread(posts) == box_thread(posts)
+
+    benchmarks = (
+        ("concatenated posts", lambda: concatenated_posts(posts).encode()),
+        ("box_posts", lambda: box_posts(posts).encode()),
+        ("iter_posts", lambda: drain(iter_posts(posts))),
+        ("concatenated thread", lambda: concatenated_thread(posts).encode()),
+        ("box_thread", lambda: box_thread(posts).encode()),
+        ("iter_thread", lambda: drain(iter_thread(posts))),
+    )
+    print("Rendering %d posts." % arguments.posts)
+    for name, function in benchmarks:
+        print("%-22s %10.3f ms %10.1f KiB peak" % (
+            name, measure(function, arguments.repeat), peak_memory(function)
+        ))
+
+
+if __name__ == "__main__":
+    main()
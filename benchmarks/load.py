@@ -0,0 +1,438 @@
+"""Drives a server with many concurrent telnet clients running scripted
+sessions, and reports its throughput and command latencies.
+
+    $ python -m benchmarks.load --clients 50 --duration 30
+
+A server is started on a temporary database seeded with synthetic
+boards, threads, replies, users and private messages. Every client
+repeatedly connects, runs a session picked from the --mix of scripts
+below, then quits. Pass --json to write the results, along with the
+server's own timings, for comparison across versions.
+
+The clients share this process, so their own overhead is included in the
+latencies. Passwords are hashed with --hash-iterations, which is kept low
+by default so that logins do not hide the cost of everything else.
+"""
+
+import argparse
+import collections
+import configparser
+import glob
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.queries import BOARDS, seed, set_passwords
+from openbbs import __version__
+from openbbs.config import load_config
+from openbbs.database import Database
+
+PASSWORD = "benchmark"
+MENU_PROMPT = b"--> "
+PROMPT = b"]$ "
+WORDS = ("subject", "body", "post")
+
+_clock = getattr(time, "perf_counter", time.time)
+
+
+class Refused(Exception):
+    """Raised when the server sends a client back to the login menu."""
+
+
+class Client(object):
+    """A telnet-style connection, which sends lines and waits for the
+    prompts that follow them.
+    """
+    def __init__(self, address, timeout):
+        self.socket = socket.create_connection(address, timeout)
+        self.buffer = b""
+
+    def send(self, line):
+        """Sends a line of input."""
+        self.socket.sendall(line.encode() + b"\r\n")
+
+    def expect(self, prompt):
+        """Reads output up to and including the given prompt. Anything
+        else the server pushes, such as notices, is skipped over. Raises
+        Refused if the login menu is shown instead.
+        """
+        while True:
+            index = self.buffer.find(prompt)
+            if index != -1:
+                self.buffer = self.buffer[index + len(prompt):]
+                return
+            if prompt != MENU_PROMPT and MENU_PROMPT in self.buffer:
+                raise Refused(self.buffer.splitlines()[-2].decode())
+            data = self.socket.recv(65536)
+            if not data:
+                raise EOFError("Connection closed while waiting for %r." %
+                               prompt)
+            self.buffer += data
+
+    def close(self):
+        """Closes the connection."""
+        self.socket.close()
+
+
+class Results(object):
+    """Latencies of every step run by the clients, in seconds, and the
+    errors they ran into.
+    """
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)
+        self.errors = collections.Counter()
+        self.lock = threading.Lock()
+
+    def record(self, step, seconds):
+        """Records the latency of a single step."""
+        with self.lock:
+            self.latencies[step].append(seconds)
+
+    def error(self, error):
+        """Records an error which ended a session."""
+        with self.lock:
+            self.errors[type(error).__name__] += 1
+
+
+class Session(object):
+    """A single client session running one script."""
+    def __init__(self, client, results, dataset, generator):
+        self.client = client
+        self.results = results
+        self.dataset = dataset
+        self.generator = generator
+
+    def run(self, step, *exchanges):
+        """Sends each (line, prompt) pair in turn, waiting for the prompt
+        after each line, and records the time taken as the given step.
+        """
+        started = _clock()
+        for line, prompt in exchanges:
+            self.client.send(line)
+            self.client.expect(prompt)
+        self.results.record(step, _clock() - started)
+
+    def login(self):
+        """Logs in as a random seeded user."""
+        self.run("login", ("l", b"USERNAME: "),
+                 ("user%d" % self.generator.randrange(self.dataset.users),
+                  b"PASSWORD: "), (PASSWORD, PROMPT))
+
+    def board(self):
+        """Changes to a random board, returning it."""
+        board = self.generator.choice(BOARDS)
+        self.run("board", ("board %s" % board, PROMPT))
+        return board
+
+    def thread(self, board):
+        """Opens a random thread on the given board."""
+        thread = self.generator.choice(self.dataset.threads[board])
+        self.run("thread", ("thread %d" % thread, PROMPT))
+
+
+def browse(session):
+    """An anonymous reader, paging through a board and its threads."""
+    session.run("anonymous", ("a", PROMPT))
+    board = session.board()
+    session.run("next", ("next", PROMPT))
+    for _ in range(3):
+        session.thread(board)
+    session.run("refresh", ("refresh", PROMPT))
+
+
+def read(session):
+    """A user catching up on their inbox and a board, and searching."""
+    session.login()
+    session.run("inbox", ("inbox", PROMPT))
+    board = session.board()
+    for _ in range(2):
+        session.thread(board)
+    session.run("search", ("search %s" % session.generator.choice(WORDS),
+                           PROMPT))
+
+
+def post(session):
+    """A user starting a thread, then replying to another."""
+    session.login()
+    board = session.board()
+    session.run("post", ("post", b"SUBJECT: "),
+                ("Benchmark thread", b"BODY: "),
+                ("Posted by the load generator.", PROMPT))
+    session.thread(board)
+    session.run("reply", ("post", b"REPLY: "),
+                ("Replied to by the load generator.", PROMPT))
+
+
+def message(session):
+    """A user sending a private message, then reading their inbox."""
+    session.login()
+    session.run("send", ("send user%d" %
+                         session.generator.randrange(session.dataset.users),
+                         b"MESSAGE: "), ("Hello from the load generator.",
+                                         PROMPT))
+    session.run("inbox", ("inbox", PROMPT))
+
+
+SCRIPTS = {"browse": browse, "read": read, "post": post, "message": message}
+
+Dataset = collections.namedtuple("Dataset", ("users", "threads"))
+
+
+def parse_mix(text):
+    """Parses a mix such as "browse=6,read=2" into (scripts, weights)."""
+    scripts, weights = [], []
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCRIPTS:
+            raise argparse.ArgumentTypeError("Unknown script \"%s\"." % name)
+        scripts.append(SCRIPTS[name])
+        weights.append(float(weight or 1))
+    return (scripts, weights)
+
+
+def prepare(directory, arguments):
+    """Writes the server's configuration and seeds its database, returning
+    the configuration file's path, the server's address and the dataset.
+    """
+    probe = socket.socket()
+    probe.bind(("127.0.0.1", 0))
+    address = probe.getsockname()
+    probe.close()
+
+    options = {
+        "host": address[0], "port": address[1],
+        "engine": arguments.engine, "workers": arguments.workers,
+        "max_sessions": arguments.clients + 16,
+        "database": os.path.join(directory, "benchmark.db"),
+        "logfile": os.path.join(directory, "openbbs.log"),
+        "boards": ",".join("%s:Synthetic board." % board
+                           for board in BOARDS),
+        "kdf": "pbkdf2_sha512",
+        "hash_iterations": arguments.hash_iterations,
+        # Every client shares an address, which would otherwise limit
+        # them to two logins at a time.
+        "hash_client_limit": arguments.clients,
+        "hash_queue_limit": arguments.clients,
+        "metrics_file": os.path.join(directory, "metrics.json"),
+        "metrics_format": "json", "metrics_interval": 1,
+        "max_message_age": 0
+    }
+    for kind in ("connection", "login", "command", "listing", "post"):
+        options["%s_rate" % kind] = 0
+    path = os.path.join(directory, "config.ini")
+    config_file = configparser.ConfigParser()
+    config_file["server"] = dict((option, str(value))
+                                 for option, value in options.items())
+    with open(path, "w") as output:
+        config_file.write(output)
+
+    config = dict(load_config("inexistent.ini"))
+    config.update(options)
+    database = Database(config)
+    seed(database, arguments.posts, arguments.users, arguments.messages,
+         arguments.bans)
+    set_passwords(database, config, PASSWORD)
+    threads = dict((board, []) for board in BOARDS)
+    database.cursor.execute("SELECT post_id, board FROM posts WHERE reply "
+                            "IS NULL;")
+    for post_id, board in database.cursor.fetchall():
+        threads[board].append(post_id)
+    database.close()
+    return (path, address, Dataset(arguments.users, threads))
+
+
+def start_server(path, address, timeout=30):
+    """Starts the server with the given configuration file, and waits
+    until it accepts connections.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment = dict(os.environ)
+    environment["PYTHONPATH"] = os.pathsep.join(
+        filter(None, (root, environment.get("PYTHONPATH")))
+    )
+    server = subprocess.Popen([sys.executable, "-m", "openbbs", "-c", path],
+                              cwd=root, env=environment)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            Client(address, 1).close()
+            return server
+        except (OSError, socket.error):
+            if server.poll() is not None:
+                break
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("The server did not start, see its log.")
+
+
+def stop_server(server, workers):
+    """Stops the server, giving it a chance to write its metrics."""
+    if workers > 1:
+        # Workers only write metrics periodically, so wait for a last one.
+        time.sleep(1.5)
+        server.terminate()
+    else:
+        server.send_signal(signal.SIGINT)
+    try:
+        server.wait(10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def drive(address, dataset, mix, deadline, results, timeout, seed_number):
+    """Runs sessions against the server until the deadline passes."""
+    generator = random.Random(seed_number)
+    scripts, weights = mix
+    while time.time() < deadline:
+        script = generator.choices(scripts, weights)[0]
+        client = None
+        try:
+            started = _clock()
+            client = Client(address, timeout)
+            client.expect(MENU_PROMPT)
+            results.record("connect", _clock() - started)
+            script(Session(client, results, dataset, generator))
+            client.send("quit")
+        except (OSError, socket.error, EOFError, Refused) as error:
+            results.error(error)
+        finally:
+            if client is not None:
+                client.close()
+
+
+def percentile(ordered, fraction):
+    """Returns the given fraction's percentile of a sorted list."""
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def summarize(results, elapsed):
+    """Returns the results as a dictionary, with latencies in
+    milliseconds.
+    """
+    latency = {}
+    for step, values in results.latencies.items():
+        values = sorted(values)
+        latency[step] = {
+            "count": len(values),
+            "mean": sum(values) / len(values) * 1000,
+            "p50": percentile(values, 0.5) * 1000,
+            "p95": percentile(values, 0.95) * 1000,
+            "p99": percentile(values, 0.99) * 1000,
+            "max": values[-1] * 1000
+        }
+    connections = len(results.latencies["connect"])
+    commands = sum(len(values) for step, values
+                   in results.latencies.items() if step != "connect")
+    return {
+        "elapsed": elapsed,
+        "connections": connections,
+        "connections_per_second": connections / elapsed,
+        "commands": commands,
+        "commands_per_second": commands / elapsed,
+        "errors": dict(results.errors),
+        "latency": latency
+    }
+
+
+def report(summary, heading):
+    """Prints the summarized results under the given heading."""
+    print(heading)
+    print("Connections: %d (%.1f/s)" % (summary["connections"],
+                                        summary["connections_per_second"]))
+    print("Commands:    %d (%.1f/s)" % (summary["commands"],
+                                        summary["commands_per_second"]))
+    if summary["errors"]:
+        print("Errors:      %s" % ", ".join(
+            "%s %d" % error for error in sorted(summary["errors"].items())
+        ))
+    print("")
+    print("%-12s %8s %8s %8s %8s %8s %8s" % ("LATENCY (MS)", "COUNT", "MEAN",
+                                              "P50", "P95", "P99", "MAX"))
+    for step, latency in sorted(summary["latency"].items()):
+        print("%-12s %8d %8.1f %8.1f %8.1f %8.1f %8.1f" % (
+            step, latency["count"], latency["mean"], latency["p50"],
+            latency["p95"], latency["p99"], latency["max"]
+        ))
+
+
+def main():
+    """Starts and seeds a server, drives it, and reports the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--mix", type=parse_mix,
+                        default="browse=5,read=3,post=1,message=1")
+    parser.add_argument("--engine", choices=("threaded", "async"),
+                        default="threaded")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--posts", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--bans", type=int, default=100)
+    parser.add_argument("--hash-iterations", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--json", metavar="PATH",
+                        help="Write the results as JSON to PATH, or to "
+                             "stdout if PATH is \"-\".")
+    arguments = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        path, address, dataset = prepare(directory, arguments)
+        server = start_server(path, address)
+        results = Results()
+        try:
+            started = time.time()
+            clients = [threading.Thread(target=drive, args=(
+                address, dataset, arguments.mix,
+                started + arguments.duration, results, arguments.timeout,
+                number
+            )) for number in range(arguments.clients)]
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+            elapsed = time.time() - started
+        finally:
+            stop_server(server, arguments.workers)
+
+        summary = summarize(results, elapsed)
+        summary["version"] = __version__
+        summary["settings"] = dict(
+            (option, value) for option, value in vars(arguments).items()
+            if option not in ("mix", "json")
+        )
+        summary["settings"]["mix"] = dict(
+            (script.__name__, weight) for script, weight
+            in zip(*arguments.mix)
+        )
+        summary["server"] = []
+        for metrics_path in sorted(glob.glob(os.path.join(directory,
+                                                          "metrics.json*"))):
+            with open(metrics_path) as metrics_file:
+                summary["server"].append(json.load(metrics_file))
+
+        if arguments.json == "-":
+            print(json.dumps(summary, indent=2, sort_keys=True))
+        else:
+            report(summary, "%d clients for %.1fs on the %s engine with %d "
+                   "worker(s)." % (arguments.clients, summary["elapsed"],
+                                   arguments.engine, arguments.workers))
+            if arguments.json:
+                with open(arguments.json, "w") as output:
+                    json.dump(summary, output, indent=2, sort_keys=True)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
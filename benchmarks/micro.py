@@ -0,0 +1,205 @@
+"""Times each hot database method and formatter over datasets of several
+sizes, and compares the results against a saved baseline.
+
+    $ python -m benchmarks.micro --sizes 1000,10000 --save baseline.json
+    $ python -m benchmarks.micro --sizes 1000,10000 --compare baseline.json
+
+A size is the number of posts and private messages in the database, or
+of rows given to a formatter. Every benchmark is called repeatedly for
+at least --min-time seconds, and its median call time is kept. When
+comparing, the exit status is 1 if any benchmark's median grew by more
+than --threshold, so that a run can gate a change like a failing test.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.formatters import make_posts
+from benchmarks.queries import BOARDS, seed, set_passwords
+from openbbs import __version__
+from openbbs.config import load_config
+from openbbs.database import Database
+from openbbs.formatters import box_inbox, box_posts, box_thread, scrub_input
+
+PASSWORD = "benchmark"
+
+_clock = getattr(time, "perf_counter", time.time)
+
+
+def formatter_benchmarks(size):
+    """Returns (name, function) pairs timing the formatters over the given
+    number of rows.
+    """
+    posts = make_posts(size)
+    messages = [(post_id, name, body, post_time, post_id % 3)
+                for post_id, post_time, name, _, body in posts]
+    bodies = [body for _, _, _, _, body in posts]
+    return (
+        ("box_posts", lambda: box_posts(posts)),
+        ("box_thread", lambda: box_thread(posts)),
+        ("box_inbox", lambda: box_inbox(messages)),
+        ("scrub_input", lambda: [scrub_input(body) for body in bodies]),
+    )
+
+
+def database_benchmarks(database, size, page_size):
+    """Returns (name, function) pairs timing the database's hot methods
+    over a dataset of the given size. Arguments are picked at random for
+    every call.
+    """
+    generator = random.Random(42)
+    users = max(size // 100, 10)
+    database.cursor.execute("SELECT board, post_id FROM posts WHERE reply IS "
+                            "NULL;")
+    threads = database.cursor.fetchall()
+
+    def user():
+        return "user%d" % generator.randrange(users)
+
+    def make_reply(thread):
+        board, post_id = thread
+        return database.make_post(user(), None, "Benchmark reply.", board,
+                                  post_id)
+
+    return (
+        ("get_posts(board)", lambda: database.get_posts(
+            generator.choice(BOARDS), limit=page_size
+        )),
+        ("get_posts(thread)", lambda: database.get_posts(
+            *generator.choice(threads), limit=page_size
+        )),
+        ("get_pms", lambda: database.get_pms(user())),
+        ("attempt_login", lambda: database.attempt_login(
+            user(), PASSWORD.encode()
+        )),
+        ("make_post", lambda: make_reply(generator.choice(threads))),
+        ("check_banned", lambda: database.check_banned(
+            user(), "10.1.%d.%d" % (generator.randrange(256),
+                                    generator.randrange(256))
+        )),
+    )
+
+
+def measure(function, min_time, min_calls=5):
+    """Calls function for at least min_time seconds and min_calls times,
+    returning the median, minimum and number of calls, in milliseconds.
+    """
+    durations = []
+    deadline = _clock() + min_time
+    while len(durations) < min_calls or _clock() < deadline:
+        started = _clock()
+        function()
+        durations.append(_clock() - started)
+    durations.sort()
+    return {"median": durations[len(durations) // 2] * 1000,
+            "min": durations[0] * 1000, "calls": len(durations)}
+
+
+def run(sizes, min_time, only, hash_iterations):
+    """Runs every benchmark whose name contains one of the only strings,
+    if any are given, at each size. Yields (key, result) pairs, where the
+    key is the benchmark's name and size.
+    """
+    config = dict(load_config("inexistent.ini"))
+    config["max_message_age"] = 0
+    config["hash_iterations"] = hash_iterations
+    config["kdf"] = "pbkdf2_sha512"
+    page_size = int(config.get("page_size"))
+
+    for size in sizes:
+        directory = tempfile.mkdtemp()
+        config["database"] = os.path.join(directory, "benchmark.db")
+        try:
+            database = Database(config)
+            seed(database, size, max(size // 100, 10), size, size // 100)
+            set_passwords(database, config, PASSWORD)
+            benchmarks = formatter_benchmarks(size) + \
+                database_benchmarks(database, size, page_size)
+            for name, function in benchmarks:
+                if only and not any(part in name for part in only):
+                    continue
+                yield ("%s/%d" % (name, size), measure(function, min_time))
+            database.close()
+        finally:
+            shutil.rmtree(directory)
+
+
+def compare(results, baseline, threshold):
+    """Returns (key, ratio) pairs of the benchmarks whose median grew by
+    more than threshold over the baseline's.
+    """
+    return [(key, result["median"] / baseline[key]["median"])
+            for key, result in results
+            if key in baseline and
+            result["median"] > baseline[key]["median"] * (1 + threshold)]
+
+
+def main():
+    """Runs the benchmarks, then saves or compares their results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        type=lambda text: [int(size)
+                                           for size in text.split(",")])
+    parser.add_argument("--min-time", type=float, default=0.5)
+    parser.add_argument("--only", type=lambda text: text.split(","),
+                        help="Only run benchmarks whose names contain one "
+                             "of these comma separated strings.")
+    parser.add_argument("--hash-iterations", type=int, default=1000)
+    parser.add_argument("--save", metavar="PATH",
+                        help="Save the results as a baseline to PATH.")
+    parser.add_argument("--compare", metavar="PATH",
+                        help="Compare the results against the baseline "
+                             "saved to PATH.")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Largest allowed slowdown when comparing, as "
+                             "a fraction of the baseline's median.")
+    arguments = parser.parse_args()
+
+    baseline = {}
+    if arguments.compare:
+        with open(arguments.compare) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+
+    print("%-28s %10s %10s %7s %8s" % ("BENCHMARK", "MEDIAN MS", "MIN MS",
+                                        "CALLS", "CHANGE"))
+    results = []
+    for key, result in run(arguments.sizes, arguments.min_time,
+                           arguments.only, arguments.hash_iterations):
+        results.append((key, result))
+        change = ""
+        if key in baseline:
+            change = "%+.0f%%" % ((result["median"] /
+                                   baseline[key]["median"] - 1) * 100)
+        print("%-28s %10.3f %10.3f %7d %8s" % (key, result["median"],
+                                                 result["min"],
+                                                 result["calls"], change))
+
+    if arguments.save:
+        with open(arguments.save, "w") as output:
+            json.dump({"version": __version__,
+                       "python": platform.python_version(),
+                       "settings": {"min_time": arguments.min_time,
+                                    "hash_iterations":
+                                        arguments.hash_iterations},
+                       "results": dict(results)},
+                      output, indent=2, sort_keys=True)
+
+    if arguments.compare:
+        regressions = compare(results, baseline, arguments.threshold)
+        for key, ratio in regressions:
+            print("REGRESSION: %s is %.2fx slower than the baseline." %
+                  (key, ratio))
+        if regressions:
+            sys.exit(1)
+        print("No regressions beyond %.0f%%." % (arguments.threshold * 100))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Measures the cost of the database's hot queries over a large synthetic
+dataset, alongside the query plan SQLite chose for each of them. Plans
+are taken from the SQL the database actually ran, so they cannot drift
+from the queries being timed.
+
+    $ python -m benchmarks.queries --posts 1000000
+
+Pass --unindexed to drop every secondary index before building the
+dataset, for comparison.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from openbbs.config import load_config
+from openbbs.database import Database, generate_salt
+from openbbs.hashing import derive, policy
+
+BOARDS = ("random", "technology", "games", "music", "politics", "science",
+          "anime", "sports", "cooking", "meta")
+
+
+def seed(database, posts, users, messages, bans):
+    """Fills the database with random boards, threads, replies, users,
+    private messages and bans.
+    """
+    generator = random.Random(1337)
+    now = time.time()
+    names = ["user%d" % number for number in range(users)]
+    cursor = database.cursor
+
+    cursor.executemany("INSERT INTO users (username, user_status, password, "
+                       "salt, last_login) VALUES (?, 'user', 'x', 'x', ?);",
+                       ((name, now) for name in names))
+
+    def make_posts():
+        threads = []
+        for post_id in range(1, posts + 1):
+            board = generator.choice(BOARDS)
+            reply = None
+            if threads and generator.random() < 0.9:
+                reply, board = generator.choice(threads)
+            else:
+                threads.append((post_id, board))
+            yield (post_id, now - posts + post_id, board,
+                   generator.choice(names), "Subject %d" % post_id,
+                   "Body of post %d." % post_id, reply)
+
+    cursor.executemany("INSERT INTO posts (post_id, time, board, name, "
+                       "subject, body, reply) VALUES (?, ?, ?, ?, ?, ?, ?);",
+                       make_posts())
+    cursor.executemany("INSERT INTO pms (sender, receiver, message, time, "
+                       "read) VALUES (?, ?, 'Hello!', ?, ?);",
+                       ((generator.choice(names), generator.choice(names),
+                         now - number, generator.random() < 0.8)
+                        for number in range(messages)))
+    cursor.executemany("INSERT INTO bans (username, ip, reason) VALUES "
+                       "(?, ?, 'Spam.');",
+                       (("banned%d" % number, "10.0.%d.%d" %
+                         (number // 256, number % 256))
+                        for number in range(bans)))
+    database.connection.commit()
+
+
+def set_passwords(database, config, password):
+    """Gives every seeded user the given password, hashed once under the
+    configured KDF policy, so that they can log in.
+    """
+    salt = generate_salt(int(config.get("salt_length")))
+    parameters = policy(config)
+    database.cursor.execute("UPDATE users SET password = ?, salt = ?, kdf = "
+                            "?;", (derive(password.encode(), salt,
+                                          parameters), salt, parameters))
+    database.connection.commit()
+
+
+def measure(function, arguments, repeat):
+    """Returns the mean time taken by function, in milliseconds, over the
+    given number of calls with randomly chosen arguments.
+    """
+    started = time.time()
+    for _ in range(repeat):
+        function(*arguments())
+    return (time.time() - started) / repeat * 1000
+
+
+def explain(database, function, arguments):
+    """Calls function with the given arguments, and returns SQLite's plan
+    for every query it ran on the database's connection as a string.
+    """
+    queries = []
+    database.connection.set_trace_callback(lambda query:
+                                           queries.append(query))
+    try:
+        function(*arguments)
+    finally:
+        database.connection.set_trace_callback(None)
+
+    plans = []
+    for query in queries:
+        # Traced queries have their parameters filled in.
+        if query.lstrip().upper().startswith("SELECT"):
+            database.cursor.execute("EXPLAIN QUERY PLAN " + query)
+            plans.append("; ".join(row[-1]
+                                   for row in database.cursor.fetchall()))
+    return " | ".join(plans)
+
+
+def main():
+    """Builds the dataset and prints the cost of each query."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--bans", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--unindexed", action="store_true")
+    arguments = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    config = dict(load_config("inexistent.ini"))
+    config["database"] = os.path.join(directory, "benchmark.db")
+    config["max_message_age"] = 0
+
+    try:
+        database = Database(config)
+        if arguments.unindexed:
+            database.cursor.execute("SELECT name FROM sqlite_master WHERE "
+                                    "type = 'index' AND sql IS NOT NULL;")
+            for (index,) in database.cursor.fetchall():
+                database.cursor.execute("DROP INDEX %s;" % index)
+        started = time.time()
+        seed(database, arguments.posts, arguments.users, arguments.messages,
+             arguments.bans)
+        print("Seeded %d posts in %.1fs." % (arguments.posts,
+                                             time.time() - started))
+
+        generator = random.Random(42)
+        database.cursor.execute("SELECT board, post_id FROM posts WHERE "
+                                "reply IS NULL;")
+        threads = database.cursor.fetchall()
+        users = arguments.users
+        benchmarks = (
+            ("get_posts(board)", database.get_posts,
+             lambda: (generator.choice(BOARDS),)),
+            ("get_posts(board, thread)", database.get_posts,
+             lambda: generator.choice(threads)),
+            ("get_post_count(last_login)", database.get_post_count,
+             lambda: (time.time() - 60,)),
+            ("get_pm_count", database.get_pm_count,
+             lambda: ("user%d" % generator.randrange(users),)),
+            ("check_banned", database.check_banned,
+             lambda: ("user%d" % generator.randrange(users), "10.1.1.1")),
+            ("username lookup", lambda name: database.cursor.execute(
+                "SELECT salt FROM users WHERE username = ?;", (name,)
+            ).fetchone(), lambda: ("user%d" % generator.randrange(users),)),
+        )
+
+        for name, function, parameters in benchmarks:
+            print("%-28s %10.3f ms   %s" % (
+                name, measure(function, parameters, arguments.repeat),
+                explain(database, function, parameters())
+            ))
+        database.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""Replays sessions recorded by a server's record_file against a test
+server, at their recorded pace or faster, and reports its latencies.
+
+    $ python -m benchmarks.replay sessions.log --address 127.0.0.1:1337
+
+Each recorded session connects at its recorded time, divided by --speed,
+and types each of its lines no sooner than it did in the recording, and
+never before the server has answered the line before. A part of the
+recording, such as an evening rush, is picked with --skip and
+--duration, in seconds of recorded time.
+
+Passwords are not recorded, so --password is typed in their place. Pass
+--reset-passwords with the test server's database to give every user
+that password first. Only ever replay against a copy of a database, as
+recorded posts and messages are made again.
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+
+from benchmarks.load import Client, Results, report, summarize
+from benchmarks.queries import set_passwords
+from openbbs import __version__
+from openbbs.config import load_config
+from openbbs.database import Database
+
+# Output ending with one of these is waiting for the user to type.
+PROMPTS = (b"]$ ", b"--> ", b": ")
+# A prompt at the end of the output, perhaps followed by notices pushed
+# while the server was waiting.
+PROMPT_PATTERN = re.compile(b"(%s)(\r\n\\* [^\r\n]*\r\n)*\\Z" %
+                            b"|".join(re.escape(prompt) for prompt in PROMPTS))
+
+_clock = getattr(time, "perf_counter", time.time)
+
+
+def load_sessions(paths):
+    """Reads the given recordings, returning a list of (start, lines)
+    pairs ordered by start time, where lines are (offset, text) pairs.
+    """
+    sessions = []
+    for index, path in enumerate(paths):
+        # Session numbers start over whenever the server restarts, so a
+        # number refers to the last session opened with it.
+        opened = {}
+        with open(path) as records:
+            for text in records:
+                try:
+                    record = json.loads(text)
+                except ValueError:
+                    # Cut short by the server stopping.
+                    continue
+                if record[0] == "open":
+                    opened[record[1]] = (record[2], [])
+                    sessions.append(opened[record[1]])
+                elif record[0] == "line" and record[1] in opened:
+                    opened[record[1]][1].append((record[2], record[3]))
+    sessions.sort(key=lambda session: session[0])
+    return sessions
+
+
+def read_response(client):
+    """Reads output until it ends with a prompt, and returns the prompt.
+    Notices pushed by the server are read along with it.
+    """
+    while True:
+        match = PROMPT_PATTERN.search(client.buffer)
+        if match:
+            client.buffer = b""
+            return match.group(1)
+        data = client.socket.recv(65536)
+        if not data:
+            raise EOFError("Connection closed while waiting for a prompt.")
+        client.buffer += data
+
+
+def step_name(prompt, text):
+    """Names the step that typing text at the given prompt takes."""
+    if prompt == PROMPTS[1]:
+        return "menu"
+    if prompt == PROMPTS[0] and text:
+        return text.split(" ")[0].lower()
+    return "input"
+
+
+def replay(address, lines, speed, password, timeout, results):
+    """Replays a single session's lines, recording the time the server
+    took to answer each of them.
+    """
+    client = None
+    try:
+        started = _clock()
+        client = Client(address, timeout)
+        prompt = read_response(client)
+        results.record("connect", _clock() - started)
+        for number, (offset, text) in enumerate(lines):
+            delay = started + offset / speed - _clock()
+            if delay > 0:
+                time.sleep(delay)
+            step = step_name(prompt, text)
+            sent = _clock()
+            client.send(password if text is None else text)
+            try:
+                prompt = read_response(client)
+            except EOFError:
+                if number == len(lines) - 1:
+                    # The session ended by quitting.
+                    break
+                raise
+            results.record(step, _clock() - sent)
+    except (OSError, EOFError) as error:
+        results.error(error)
+    finally:
+        if client is not None:
+            client.close()
+
+
+def reset_passwords(config_path, database_path, password):
+    """Gives every user in the given database the given password."""
+    config = dict(load_config(config_path))
+    config["database"] = database_path
+    database = Database(config)
+    set_passwords(database, config, password)
+    database.close()
+
+
+def main():
+    """Replays the recorded sessions and reports the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("recordings", nargs="+", metavar="RECORDING")
+    parser.add_argument("--address", default="127.0.0.1:1337",
+                        type=lambda text: (text.rpartition(":")[0],
+                                           int(text.rpartition(":")[2])))
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--skip", type=float, default=0.0)
+    parser.add_argument("--duration", type=float)
+    parser.add_argument("--password", default="replay")
+    parser.add_argument("--reset-passwords", metavar="DATABASE")
+    parser.add_argument("--config", default="./config.ini")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--json", metavar="PATH",
+                        help="Write the results as JSON to PATH, or to "
+                             "stdout if PATH is \"-\".")
+    arguments = parser.parse_args()
+
+    sessions = load_sessions(arguments.recordings)
+    if not sessions:
+        parser.error("The recordings contain no sessions.")
+    first = sessions[0][0] + arguments.skip
+    sessions = [(start - first, lines) for start, lines in sessions
+                if start >= first and (arguments.duration is None or
+                                       start - first < arguments.duration)]
+    if arguments.reset_passwords:
+        reset_passwords(arguments.config, arguments.reset_passwords,
+                        arguments.password)
+
+    results = Results()
+    threads = []
+    started = time.time()
+    for start, lines in sessions:
+        delay = started + start / arguments.speed - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        thread = threading.Thread(target=replay, args=(
+            arguments.address, lines, arguments.speed, arguments.password,
+            arguments.timeout, results
+        ))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    summary = summarize(results, time.time() - started)
+    summary["version"] = __version__
+    summary["sessions"] = len(sessions)
+    summary["speed"] = arguments.speed
+
+    if arguments.json == "-":
+        print(json.dumps(summary, indent=2, sort_keys=True))
+    else:
+        report(summary, "Replayed %d sessions in %.1fs at %gx speed." % (
+            len(sessions), summary["elapsed"], arguments.speed
+        ))
+        if arguments.json:
+            with open(arguments.json, "w") as output:
+                json.dump(summary, output, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
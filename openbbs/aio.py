@@ -0,0 +1,428 @@
+"""Asynchronous connection engine. Serves every client from a single
+asyncio event loop, so that an idle connection costs a coroutine rather
+than an operating system thread. Blocking work, such as database access
+and password hashing, is handed off to a bounded thread pool.
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import logging
+import socket
+import time
+
+from openbbs import bans, notifications, ratelimit, recorder, stats
+from openbbs.database import Database
+from openbbs.login import (LOGIN, MENU, REGISTRATION, check_login,
+                           create_account)
+from openbbs.shell import (check_rate, create_interpreter, follow_topics,
+                           send_greeting, send_prompt)
+from openbbs.telnet import LineReader
+
+
+class SessionClosed(Exception):
+    """Raised to unwind a session once its connection has been closed."""
+
+
+class AsyncUserSession(object):
+    """Coroutine counterpart to session.UserSession. All input is
+    awaited on the event loop, so that no executor thread is held by a
+    client that has yet to answer, while output may be sent from any
+    thread. Output queued during one pass of the event loop is written
+    out together.
+    """
+    def __init__(self, reader, writer, ip_address, config, executor, pool):
+        self.reader = reader
+        self.writer = writer
+        self.ip_address = ip_address
+        self.config = config
+        self.executor = executor
+        self.pool = pool
+        self.timeout = float(config.get("input_timeout"))
+        self.input = LineReader(int(config.get("max_line_length")))
+        self.output_limit = int(config.get("output_limit"))
+        self.output = []
+        self.loop = asyncio.get_running_loop()
+        self.database = None
+        self.waiting = False
+        self.subscriber = notifications.Subscriber(
+            int(config.get("notice_queue_size")),
+            lambda: self.loop.call_soon_threadsafe(self._notify)
+        )
+        self.recording = recorder.session()
+        try:
+            # Listening sockets made by core.bind_server are not known to
+            # be TCP, so asyncio leaves Nagle enabled on their clients.
+            writer.get_extra_info("socket").setsockopt(
+                socket.IPPROTO_TCP, socket.TCP_NODELAY, 1
+            )
+        except (AttributeError, OSError):
+            pass
+
+        self.name = ""
+        self.status = ""
+
+        self.current_board = "main"
+        self.current_thread = None
+        self.thread_title = None
+        self.page = None
+        self.search = None
+        self.latest = None
+        self.following = None
+
+    def send(self, message, end="\r\n"):
+        """Queues a message to be written by the event loop. Safe to call
+        from any thread, and preserves the order of messages.
+        """
+        self.loop.call_soon_threadsafe(self._write, (message + end).encode())
+
+    def write(self, data):
+        """Queues already encoded data, such as a cached screen, to be
+        written by the event loop.
+        """
+        self.loop.call_soon_threadsafe(self._write, data)
+
+    def stream(self, chunks, end="\r\n"):
+        """Queues a screen to be written by the event loop as it is
+        generated, one encoded chunk at a time.
+        """
+        for chunk in chunks:
+            self.loop.call_soon_threadsafe(self._write, chunk)
+        self.send("", end)
+
+    def _write(self, data):
+        if not self.output:
+            self.loop.call_soon(self._flush)
+        self.output.append(data)
+
+    def _flush(self):
+        """Writes all queued output at once. Clients that let more than
+        output_limit bytes of it pile up unsent have stopped reading, and
+        are dropped.
+        """
+        output, self.output = self.output, []
+        if self.writer.is_closing():
+            return
+        stats.increment("socket.bytes_sent", sum(len(data) for data in output))
+        self.writer.writelines(output)
+        if self.writer.transport.get_write_buffer_size() > self.output_limit:
+            stats.increment("sessions.stalled")
+            logging.warning("%s stopped reading, hanging up.",
+                            self.ip_address)
+            self.writer.transport.abort()
+
+    def _notify(self):
+        """Writes queued notices if the session is waiting for input, and
+        otherwise leaves them until it is.
+        """
+        if self.waiting:
+            notices = self.subscriber.pop_all()
+            if notices:
+                self._write(notifications.encode(notices, self.following))
+                # Replies shown in full are not sent again on "refresh".
+                newest = notifications.newest_post(notices, self.following)
+                if newest is not None:
+                    self.latest = max(self.latest or 0, newest)
+
+    def hang_up(self):
+        """Writes any queued output, then closes the connection."""
+        self._flush()
+        self.writer.close()
+
+    async def receive_async(self, secret=False):
+        """Awaits a line of input from the client. Lines that arrived
+        together are queued, and secret lines left out of the session's
+        recording, as in UserSession.receive.
+        """
+        while not self.input.lines:
+            self.waiting = True
+            self._notify()
+            try:
+                data = await self.reader.read(4096)
+            except OSError:
+                logging.warning("Client connection has been interrupted.")
+                raise SessionClosed()
+            finally:
+                self.waiting = False
+            if not data:
+                line = self.input.finish()
+                if line is not None:
+                    return self._record(line.strip(), secret)
+                logging.info("%s has disconnected.", self.ip_address)
+                raise SessionClosed()
+            stats.increment("socket.bytes_received", len(data))
+            replies = self.input.feed(data)
+            if replies:
+                self._write(replies)
+        return self._record(self.input.readline().strip(), secret)
+
+    def _record(self, line, secret):
+        if self.recording is not None:
+            self.recording.line(None if secret else line)
+        return line
+
+    async def receive_answer(self, secret=False):
+        """Awaits the answer to a prompt made partway through a command,
+        hanging up if none arrives within input_timeout seconds.
+        """
+        try:
+            return await asyncio.wait_for(self.receive_async(secret),
+                                          self.timeout)
+        except asyncio.TimeoutError:
+            logging.warning("%s timed out while waiting for input.",
+                            self.ip_address)
+            raise SessionClosed()
+
+    def close(self):
+        """Hangs up the client's connection and unwinds the caller."""
+        self.loop.call_soon_threadsafe(self.hang_up)
+        raise SessionClosed()
+
+    async def run(self, function, *args):
+        """Runs a blocking function in the executor and awaits its
+        result. A database connection is borrowed from the pool for the
+        duration of the call, so idle sessions do not hold one.
+        """
+        return await self.loop.run_in_executor(self.executor, self._call,
+                                               function, args)
+
+    def _call(self, function, args):
+        self.database = Database(self.config, pool=self.pool,
+                                 client=self.ip_address,
+                                 subscriber=self.subscriber)
+        try:
+            return function(*args)
+        finally:
+            self.database.close()
+            self.database = None
+
+
+class Admission(object):
+    """Asynchronous counterpart to pool.SessionPool's admission control.
+    At most max_sessions clients are served at once, a few more wait in
+    line and the rest are turned away.
+    """
+    def __init__(self, config):
+        self.max_sessions = int(config.get("max_sessions"))
+        self.queue_size = int(config.get("queue_size"))
+        self.active = 0
+        self.waiting = collections.deque()
+
+    async def acquire(self, user):
+        """Waits for a free session slot, raising SessionClosed if the
+        client has been rejected.
+        """
+        position = self.active + len(self.waiting) + 1 - self.max_sessions
+        if position > self.queue_size:
+            stats.increment("sessions.rejected")
+            logging.warning("Rejected %s, the server is full.",
+                            user.ip_address)
+            user.send("The server is full, please try again later.")
+            raise SessionClosed()
+        elif position > 0:
+            logging.info("Queued %s at position %d.", user.ip_address,
+                         position)
+            user.send("The server is busy, you are #%d in line." % position)
+            turn = user.loop.create_future()
+            self.waiting.append(turn)
+            self._update_stats()
+            try:
+                await turn
+            except asyncio.CancelledError:
+                if turn in self.waiting:
+                    self.waiting.remove(turn)
+                    self._update_stats()
+                elif not turn.cancelled():
+                    # The slot was handed over just before cancellation.
+                    self.release()
+                raise
+        else:
+            self.active += 1
+            self._update_stats()
+
+    def release(self):
+        """Hands the caller's session slot to the next client in line,
+        skipping any whose wait has been cancelled but who have yet to
+        leave the line.
+        """
+        while self.waiting:
+            turn = self.waiting.popleft()
+            if not turn.done():
+                turn.set_result(None)
+                break
+        else:
+            self.active -= 1
+        self._update_stats()
+
+    def _update_stats(self):
+        stats.set_value("sessions.active", self.active)
+        stats.set_value("sessions.queued", len(self.waiting))
+
+
+async def ask(user, questions):
+    """Coroutine version of login.ask."""
+    answers = []
+    for question, secret in questions:
+        user.send(question, end="")
+        answers.append(await user.receive_answer(secret))
+    return answers
+
+
+async def prompt(user):
+    """Coroutine version of login.prompt. The client's answers are
+    awaited on the event loop, and only checking them is left to the
+    executor.
+    """
+    user.send(MENU)
+    while True:
+        user.send("--> ", end="")
+        command = (await user.receive_async()).lower()
+        if command == "login" or command == "l":
+            result = await user.run(check_login, user,
+                                    *(await ask(user, LOGIN)))
+        elif command == "register" or command == "r":
+            result = await user.run(create_account, user,
+                                    *(await ask(user, REGISTRATION)))
+        elif command == "anonymous" or command == "a":
+            result = ("Anonymous", "coward")
+            user.send("Don't make trouble...")
+        elif command == "quit" or command == "q":
+            raise SessionClosed()
+        else:
+            result = None
+            user.send("Invalid command \"%s\"." % command)
+        if result:
+            return result
+
+
+def _step(steps, answer):
+    """Runs an interactive command up to its next prompt. Returns whether
+    the command is still waiting for an answer, and the time taken.
+    """
+    started = time.perf_counter()
+    try:
+        steps.send(answer)
+        return True, time.perf_counter() - started
+    except StopIteration:
+        return False, time.perf_counter() - started
+
+
+async def run_command(user, command_interpreter, command):
+    """Runs a shell command in the executor. Commands that ask for input
+    are run a step at a time, with each answer awaited on the event loop
+    in between, and are timed without the time spent waiting.
+    """
+    function, arguments, timer = command_interpreter.lookup(command)
+    if not hasattr(function, "steps"):
+        await user.run(command_interpreter.call, command)
+        return
+    steps = function.steps(*arguments)
+    answer = None
+    elapsed = 0.0
+    try:
+        while True:
+            waiting, seconds = await user.run(_step, steps, answer)
+            elapsed += seconds
+            if not waiting:
+                break
+            answer = await user.receive_answer()
+    finally:
+        stats.record(timer, elapsed)
+
+
+async def shell(user, config):
+    """Coroutine version of shell.shell. Waits for commands on the event
+    loop and executes them in the executor.
+    """
+    command_interpreter = create_interpreter(user, config)
+    send_greeting(user, config)
+
+    while True:
+        follow_topics(user)
+        send_prompt(user, config)
+        command = (await user.receive_async()).lower().split(" ")
+        logging.info("\"%s\" command received from %s.", " ".join(command),
+                     user.name)
+        if command[0] == "quit" or command[0] == "q":
+            break
+        elif check_rate(user, command[0]):
+            await run_command(user, command_interpreter, command)
+
+    user.send(config.get("quit"))
+
+
+async def handle(reader, writer, config, executor, pool, admission=None):
+    """Coroutine version of session.handle."""
+    ip_address = writer.get_extra_info("peername")[0]
+    logging.info("Connection received from %s.", ip_address)
+    stats.increment("sessions.accepted")
+    user = AsyncUserSession(reader, writer, ip_address, config, executor,
+                            pool)
+    admitted = False
+
+    try:
+        reason = bans.check_address(ip_address)
+        if reason is not None:
+            logging.info("Refused connection from banned address %s.",
+                         ip_address)
+            user.send("%s Reason: %s" % (config.get("banned"), reason))
+            raise SessionClosed()
+        if not ratelimit.allow("connection", ip_address):
+            logging.info("Refused connection from throttled address %s.",
+                         ip_address)
+            user.send(ratelimit.CONNECTIONS)
+            raise SessionClosed()
+        if admission is not None:
+            await admission.acquire(user)
+            admitted = True
+        user.send(config.get("motd"))
+        user.send("There are currently %d posts." %
+                  (await user.run(lambda: user.database.get_post_count())))
+        user.name, user.status = await prompt(user)
+
+        banned = await user.run(
+            lambda: user.database.check_banned(user.name, ip_address)
+        )
+        if banned:
+            user.send("%s Reason: %s" % (config.get("banned"), banned))
+            logging.info("%s attempted to login, but is banned.", user.name)
+        else:
+            logging.info("%s logged in as %s.", ip_address, user.name)
+            await shell(user, config)
+    except SessionClosed:
+        pass
+    finally:
+        notifications.unfollow(user.subscriber)
+        if user.recording is not None:
+            user.recording.close()
+        if admitted:
+            admission.release()
+        # Scheduled rather than called so that queued messages go first.
+        user.loop.call_soon(user.hang_up)
+        logging.info("Connection to %s has been closed.", ip_address)
+
+
+def serve(server, config, pool):
+    """Accepts connections on the given bound socket and serves them
+    from an asyncio event loop until interrupted. Database connections
+    are borrowed from the given connection pool.
+    """
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=int(config.get("executor_threads"))
+    )
+
+    async def run_server():
+        admission = Admission(config)
+        async_server = await asyncio.start_server(
+            lambda reader, writer: handle(reader, writer, config, executor,
+                                          pool, admission),
+            sock=server,
+            backlog=int(config.get("backlog"))
+        )
+        async with async_server:
+            await async_server.serve_forever()
+
+    try:
+        asyncio.run(run_server())
+    finally:
+        executor.shutdown(wait=False)
@@ -0,0 +1,190 @@
+"""Process-wide registry of bans, so that banned addresses can be turned
+away as soon as they connect, before a session, database connection or
+password hash is spent on them. Bans may name a user, an exact address
+or a CIDR range such as "10.0.0.0/8".
+
+Every change to the bans table bumps a version counter in the database,
+so each process notices bans made by other worker processes and reloads.
+"""
+
+import ipaddress
+import logging
+import threading
+import time
+
+from openbbs import stats
+
+# How often (in seconds) connecting addresses may trigger a check for
+# bans made by other processes.
+REFRESH_INTERVAL = 1
+
+_registry = None
+_connection = None
+_lock = threading.Lock()
+_refreshed = 0
+
+
+def as_text(address):
+    """Returns an address as text, which is what the ipaddress module
+    parses. On Python 2, its backport takes a str to be a packed address.
+    """
+    if isinstance(address, bytes):
+        return address.decode("ascii")
+    return address
+
+
+class BanRegistry(object):
+    """In-memory copy of the bans table. Names and exact addresses are
+    kept in dictionaries, and ranges in a binary prefix tree per address
+    family, so a check costs at most one step per bit of the address.
+    """
+    def __init__(self):
+        self.version = None
+        self.names = {}
+        self.addresses = {}
+        self.networks = {4: {}, 6: {}}
+
+    def update(self, cursor):
+        """Reloads the bans through the given cursor if they have changed
+        since they were last loaded.
+        """
+        cursor.execute("SELECT value FROM counters WHERE name = 'bans';")
+        row = cursor.fetchone()
+        version = row[0] if row else 0
+        if version == self.version:
+            return
+
+        cursor.execute("SELECT username, ip, reason FROM bans;")
+        names = {}
+        addresses = {}
+        networks = {4: {}, 6: {}}
+        for name, ip_address, reason in cursor.fetchall():
+            if name:
+                names[name] = reason
+            if not ip_address:
+                continue
+            try:
+                network = ipaddress.ip_network(as_text(ip_address),
+                                               strict=False)
+            except ValueError:
+                addresses[ip_address] = reason
+                continue
+            if network.num_addresses == 1:
+                addresses[str(network.network_address)] = reason
+            else:
+                _insert(networks[network.version], network, reason)
+
+        # Replaced whole, so that concurrent checks see old or new bans.
+        self.names, self.addresses, self.networks = names, addresses, networks
+        self.version = version
+        logging.info("Loaded version %d of the ban list.", version)
+
+    def check(self, name=None, ip_address=None):
+        """Returns the reason the given name or address is banned, or None
+        if neither is.
+        """
+        if name and name in self.names:
+            return self.names[name]
+        if not ip_address:
+            return None
+        reason = self.addresses.get(ip_address)
+        if reason is not None:
+            return reason
+        try:
+            address = ipaddress.ip_address(as_text(ip_address))
+        except ValueError:
+            return None
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+            reason = self.addresses.get(str(address))
+            if reason is not None:
+                return reason
+        return _search(self.networks[address.version], address)
+
+
+def _insert(root, network, reason):
+    """Adds a network to the prefix tree rooted at root."""
+    value = int(network.network_address)
+    width = network.max_prefixlen
+    node = root
+    for bit in range(network.prefixlen):
+        node = node.setdefault((value >> (width - 1 - bit)) & 1, {})
+    node["reason"] = reason
+
+
+def _search(root, address):
+    """Returns the reason of the first network in the prefix tree rooted
+    at root which contains the given address, or None.
+    """
+    value = int(address)
+    width = address.max_prefixlen
+    node = root
+    for bit in range(width):
+        if "reason" in node:
+            return node["reason"]
+        node = node.get((value >> (width - 1 - bit)) & 1)
+        if node is None:
+            return None
+    return node.get("reason")
+
+
+def start(connection):
+    """Loads the process's ban registry through the given database
+    connection, which is kept to check for new bans. Until it is started,
+    addresses are not checked when they connect.
+    """
+    global _registry, _connection, _refreshed
+    registry = BanRegistry()
+    registry.update(connection.cursor())
+    with _lock:
+        _registry = registry
+        _connection = connection
+        _refreshed = time.time()
+
+
+def stop():
+    """Discards the process's ban registry and closes its connection."""
+    global _registry, _connection
+    with _lock:
+        if _connection is not None:
+            _connection.close()
+        _registry = None
+        _connection = None
+
+
+def active():
+    """Returns whether the process has a ban registry."""
+    return _registry is not None
+
+
+def update(cursor):
+    """Reloads the registry through the given cursor if bans have changed,
+    such as right after a ban has been made.
+    """
+    if _registry is not None:
+        with _lock:
+            _registry.update(cursor)
+
+
+def check(name=None, ip_address=None):
+    """Returns the reason the given name or address is banned, or None."""
+    if _registry is None:
+        return None
+    return _registry.check(name, ip_address)
+
+
+def check_address(ip_address):
+    """Checks a newly connected address, first looking for bans made by
+    other processes if that has not been done recently.
+    """
+    global _refreshed
+    if _registry is None:
+        return None
+    with _lock:
+        if time.time() - _refreshed >= REFRESH_INTERVAL:
+            _refreshed = time.time()
+            _registry.update(_connection.cursor())
+    reason = _registry.check(ip_address=ip_address)
+    if reason is not None:
+        stats.increment("sessions.banned")
+    return reason
@@ -0,0 +1,88 @@
+"""Process-wide cache of rendered screens. Listings are stored as encoded
+bytes under keys that include their board's version, so a new post or
+deletion simply stops old screens from being found, and they are evicted
+in least recently used order once the cache exceeds its memory cap.
+"""
+
+import collections
+import threading
+
+from openbbs import stats
+
+_cache = None
+
+
+class RenderCache(object):
+    """Least recently used mapping of keys to values, capped by the total
+    size of the values rather than their number.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the value stored under the given key, or None."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                stats.increment("cache.misses")
+                return None
+            # Reinserted rather than moved, which Python 2 cannot do.
+            self.entries[key] = self.entries.pop(key)
+        stats.increment("cache.hits")
+        return entry[0]
+
+    def put(self, key, value, size):
+        """Stores a value of the given size, in bytes, under the given key
+        and evicts the least recently used values beyond the cap.
+        """
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= evicted
+                stats.increment("cache.evictions")
+            stats.set_value("cache.bytes", self.size)
+
+
+def start(config):
+    """Creates the process's render cache according to the configuration.
+    Until it is started, or if its size is 0, nothing is cached.
+    """
+    global _cache
+    max_bytes = int(config.get("cache_size"))
+    _cache = RenderCache(max_bytes) if max_bytes else None
+
+
+def stop():
+    """Discards the process's render cache."""
+    global _cache
+    _cache = None
+
+
+def enabled():
+    """Returns whether the process has a render cache."""
+    return _cache is not None
+
+
+def get(key):
+    """Returns the value cached under the given key, or None."""
+    if _cache is None:
+        return None
+    return _cache.get(key)
+
+
+def put(key, value, size):
+    """Caches a value of the given size under the given key, if there is
+    a cache.
+    """
+    if _cache is not None:
+        _cache.put(key, value, size)
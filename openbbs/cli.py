@@ -58,3 +58,40 @@ server_opts.add_argument(
     default="./config.ini",
     help="Specify an alternate path for the config.ini file.\n\n"
 )
+server_opts.add_argument(
+    "-e",
+    "--engine",
+    choices=("threaded", "async"),
+    help="Select the connection engine, overriding the configuration.\n"
+         "\"threaded\" uses a thread per connection, \"async\" serves\n"
+         "every connection from a single asyncio event loop.\n\n"
+)
+server_opts.add_argument(
+    "-w",
+    "--workers",
+    metavar="N",
+    type=int,
+    help="Fork N worker processes to accept connections, overriding the\n"
+         "configuration. Dead workers are restarted automatically.\n\n"
+)
+
+maintenance_opts = parser.add_argument_group("Maintenance Options")
+maintenance_opts.add_argument(
+    "--calibrate-kdf",
+    metavar="MS",
+    type=float,
+    help="Print password hashing settings for the configured kdf that\n"
+         "take roughly MS milliseconds on this machine, then exit.\n\n"
+)
+maintenance_opts.add_argument(
+    "--rebuild-counters",
+    action="store_true",
+    help="Recount the post and unread message counters from scratch,\n"
+         "print any that were wrong, then exit.\n\n"
+)
+maintenance_opts.add_argument(
+    "--rebuild-search",
+    action="store_true",
+    help="Create the post search index if it is missing and reindex\n"
+         "every post, then exit.\n\n"
+)
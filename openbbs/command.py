@@ -1,13 +1,41 @@
 """Basic command interpreter for use in the BBS shell."""
 
+import functools
+
+from openbbs import stats
+
+
+def interactive(function):
+    """Decorator for commands that ask the client for input. Such a
+    command is written as a generator, which sends its prompt and then
+    yields to be sent the client's answer. Called normally, the command
+    reads each answer with user.receive, but the generator function is
+    kept as its "steps" attribute, for engines that collect the answers
+    themselves.
+    """
+    @functools.wraps(function)
+    def command(user, *args):
+        steps = function(user, *args)
+        answer = None
+        while True:
+            try:
+                steps.send(answer)
+            except StopIteration:
+                return
+            answer = user.receive()
+    command.steps = function
+    return command
+
 
 class CommandInterpreter(object):
     """Command interpreter class, which maintains a table of command
-    aliases and their corresponding functions/parameters.
+    aliases and their corresponding functions/parameters. Every call is
+    timed as "command.<name>", under the command's first alias.
     """
     def __init__(self, default_function, default_arguments, base_arguments):
         self.base_arguments = base_arguments
         self.commands = {"DEFAULT": (default_function, default_arguments)}
+        self.timers = {"DEFAULT": "command.unknown"}
 
     def add(self, aliases, function, arguments):
         """Appends the given function and its arguments to the
@@ -19,15 +47,26 @@ class CommandInterpreter(object):
             raise TypeError("\"Function\" argument must be callable.")
         elif not hasattr(arguments, "__iter__"):
             raise TypeError("\"Arguments\" argument must be iterable.")
+        aliases = tuple(aliases)
         for name in aliases:
             self.commands[name] = (function, arguments)
+            self.timers[name] = "command.%s" % aliases[0]
+
+    def lookup(self, command):
+        """Finds the function associated with the given alias. Returns
+        the function, the full arguments it is to be called with and the
+        name of its timer.
+        """
+        name = command[0] if command[0] in self.commands else "DEFAULT"
+        function, arguments = self.commands[name]
+        arguments = self.base_arguments + (command,) + arguments
+        return function, arguments, self.timers[name]
 
     # Return value is typically unused, but kept for testing purposes.
     def call(self, command):
         """Finds the function and arguments associated with the given
         alias, calls the function and returns its value.
         """
-        name = command[0]
-        function, arguments = self.commands.get(name, self.commands["DEFAULT"])
-        arguments = self.base_arguments + (command,) + arguments
-        return function(*arguments)
+        function, arguments, timer = self.lookup(command)
+        with stats.timer(timer):
+            return function(*arguments)
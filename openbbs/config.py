@@ -14,13 +14,54 @@ DEFAULTS = {
     "host": "",
     "port": 1337,
     "backlog": 5,
+    "engine": "threaded",
+    "executor_threads": 16,
+    "input_timeout": 300,
+    "output_timeout": 30,
+    "max_line_length": 4096,
+    "output_limit": 1048576,
+    "workers": 1,
+    "reuse_port": False,
+    "max_sessions": 256,
+    "queue_size": 16,
     "database": "./database.db",
+    "database_timeout": 5,
+    "commit_interval": 0,
+    "commit_batch_size": 64,
     "logfile": None,
+    "metrics_file": "",
+    "metrics_interval": 60,
+    "metrics_format": "prometheus",
+    "record_file": "",
+    "profile_directory": ".",
+    "profile_duration": 30,
+    "profile_interval": 0.01,
     "boards": "Random:Posts without a home.,Technology:Install Gentoo.",
     "operators": "",
+    "kdf": "pbkdf2_sha512",
     "hash_iterations": 500000,
+    "scrypt_n": 16384,
+    "scrypt_r": 8,
+    "scrypt_p": 1,
     "salt_length": 64,
-    "max_message_age": 604800
+    "hash_threads": 0,
+    "hash_queue_limit": 64,
+    "hash_client_limit": 2,
+    "max_message_age": 604800,
+    "purge_interval": 3600,
+    "page_size": 20,
+    "cache_size": 8388608,
+    "notice_queue_size": 16,
+    "connection_rate": 1,
+    "connection_burst": 10,
+    "login_rate": 0.2,
+    "login_burst": 5,
+    "command_rate": 5,
+    "command_burst": 20,
+    "listing_rate": 2,
+    "listing_burst": 10,
+    "post_rate": 0.1,
+    "post_burst": 5
 }
 
 
@@ -39,3 +80,13 @@ def load_config(path):
             config[option] = config_file.get(section, option)
 
     return config
+
+
+def get_boolean(config, option):
+    """Interprets the given option as a boolean, accepting the same
+    values as configparser's getboolean.
+    """
+    value = config.get(option)
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "yes", "true", "on")
@@ -3,29 +3,45 @@ from the given configuration file and command-line arguments, and
 initializes the server.
 """
 
+import functools
 import logging
 import os
+import signal
 import socket
 import sys
 import threading
+import time
 
 import daemon
 
+from openbbs import (bans, cache, hashing, metrics, profiler, ratelimit,
+                     recorder, stats)
 from openbbs.cli import parser
-from openbbs.config import load_config
+from openbbs.config import get_boolean, load_config
+from openbbs.database import (ConnectionPool, connect, initialize_database,
+                              rebuild_search_index, repair_counters)
+from openbbs.pool import SessionPool
 from openbbs.session import handle
+from openbbs.shell import render_screens
 
 
-def spawn_server(config, debug=False):
-    """Initializes the server according to the given configuration, and
-    spawns threads to handle incoming connections.
+# Minimum lifetime of a worker process before it is restarted without delay.
+RESTART_DELAY = 1
+
+
+def bind_server(config, reuse_port=False):
+    """Creates a socket bound to the configured host and port, exiting
+    if the address is unavailable. If reuse_port is set, several sockets
+    may be bound to the same address and the kernel will balance
+    connections between them.
     """
-    backlog = int(config.get("backlog"))
     port = int(config.get("port"))
     host = config.get("host") or socket.gethostbyname(socket.gethostname())
 
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
 
     try:
         server.bind((host, port))
@@ -36,25 +52,186 @@ def spawn_server(config, debug=False):
     else:
         logging.info("Server successfully bound to %s:%s.", host, port)
 
+    return server
+
+
+def refuse_banned(client, ip_address, reason, config):
+    """Tells a client from a banned address why, and hangs up."""
+    logging.info("Refused connection from banned address %s.", ip_address)
+    try:
+        client.sendall(("%s Reason: %s\r\n" % (config.get("banned"),
+                                                reason)).encode())
+    except (OSError, socket.error):
+        pass
+    client.close()
+
+
+def refuse_throttled(client, ip_address):
+    """Tells a client from an address which is connecting too often to
+    slow down, and hangs up.
+    """
+    logging.info("Refused connection from throttled address %s.", ip_address)
+    try:
+        client.sendall((ratelimit.CONNECTIONS + "\r\n").encode())
+    except (OSError, socket.error):
+        pass
+    client.close()
+
+
+def serve(server, config, debug=False):
+    """Accepts connections on the given bound socket, handing each of
+    them to the configured connection engine.
+    """
+    backlog = int(config.get("backlog"))
+    hashing.start(config)
+    cache.start(config)
+    bans.start(connect(config, check_same_thread=False))
+    ratelimit.start(config)
+    metrics.start(config)
+    recorder.start(config)
+    profiler.handle_signal(config)
+    render_screens(config)
+
+    if config.get("engine") == "async":
+        if sys.version_info < (3, 7):
+            logging.critical("The async engine requires Python 3.7 or "
+                             "later.")
+            sys.exit(1)
+        # Imported here, as it cannot be compiled by older versions.
+        from openbbs import aio
+        connection_pool = ConnectionPool(config,
+                                         int(config.get("executor_threads")))
+        try:
+            aio.serve(server, config, connection_pool)
+        except KeyboardInterrupt:
+            server.close()
+            logging.info("Server shutting down...")
+        connection_pool.close()
+        hashing.stop()
+        cache.stop()
+        bans.stop()
+        ratelimit.stop()
+        metrics.stop()
+        recorder.stop()
+        return
+
+    # Threaded sessions hold a connection for their lifetime.
+    connection_pool = ConnectionPool(config, int(config.get("max_sessions")))
+    pool = SessionPool(functools.partial(handle, pool=connection_pool),
+                       config)
     try:
         server.listen(backlog)
         while True:
             client, address = server.accept()
             ip_address = address[0]
             logging.info("Connection received from %s.", ip_address)
-            connection_thread = threading.Thread(
-                target=handle,
-                args=(client, ip_address, config)
-            )
-            connection_thread.daemon = True
-            connection_thread.start()
+            stats.increment("sessions.accepted")
+            reason = bans.check_address(ip_address)
+            if reason is not None:
+                refuse_banned(client, ip_address, reason, config)
+                continue
+            if not ratelimit.allow("connection", ip_address):
+                refuse_throttled(client, ip_address)
+                continue
             if debug:
+                connection_thread = threading.Thread(
+                    target=handle,
+                    args=(client, ip_address, config, connection_pool)
+                )
+                connection_thread.daemon = True
+                connection_thread.start()
                 connection_thread.join()
                 server.close()
                 break
+            pool.submit(client, ip_address)
     except KeyboardInterrupt:
         server.close()
         logging.info("Server shutting down...")
+    connection_pool.close()
+    hashing.stop()
+    cache.stop()
+    bans.stop()
+    ratelimit.stop()
+    metrics.stop()
+    recorder.stop()
+
+
+def spawn_workers(config, count):
+    """Forks the given number of worker processes, each of which runs its
+    own accept loop, then supervises them and restarts any that die.
+    Workers either share a socket bound by the master, or bind their own
+    with SO_REUSEPORT.
+    """
+    reuse_port = get_boolean(config, "reuse_port")
+    server = None if reuse_port else bind_server(config)
+    workers = {}
+
+    def signal_workers(number):
+        for pid in list(workers):
+            try:
+                os.kill(pid, number)
+            except OSError:
+                pass
+
+    def fork_worker():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGUSR2, signal.SIG_IGN)
+            code = 1
+            try:
+                serve(server or bind_server(config, reuse_port=True), config)
+                code = 0
+            except Exception:
+                logging.exception("Worker process %d crashed.", os.getpid())
+            finally:
+                os._exit(code)
+        workers[pid] = time.time()
+        logging.info("Started worker process %d.", pid)
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    # The master only supervises, so profiling it profiles its workers.
+    signal.signal(signal.SIGUSR2, lambda *_: signal_workers(signal.SIGUSR2))
+    for _ in range(count):
+        fork_worker()
+
+    try:
+        while True:
+            pid, status = os.wait()
+            started = workers.pop(pid, None)
+            if started is None:
+                continue
+            logging.warning("Worker process %d exited with status %d, "
+                            "restarting.", pid, status)
+            # Avoids a fork loop when workers die on startup.
+            if time.time() - started < RESTART_DELAY:
+                time.sleep(RESTART_DELAY)
+            fork_worker()
+    except (KeyboardInterrupt, SystemExit):
+        logging.info("Stopping %d worker processes...", len(workers))
+        signal_workers(signal.SIGTERM)
+        for pid in workers:
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        if server is not None:
+            server.close()
+        logging.info("Server shutting down...")
+
+
+def spawn_server(config, debug=False):
+    """Initializes the server according to the given configuration, and
+    spawns threads to handle incoming connections, or worker processes
+    if more than one is configured.
+    """
+    initialize_database(config)
+
+    workers = int(config.get("workers"))
+    if workers > 1 and not debug:
+        spawn_workers(config, workers)
+    else:
+        serve(bind_server(config), config, debug)
 
 
 def main():
@@ -63,6 +240,10 @@ def main():
     """
     arguments = parser.parse_args()
     config = load_config(arguments.config)
+    if arguments.engine:
+        config["engine"] = arguments.engine
+    if arguments.workers:
+        config["workers"] = arguments.workers
     logging.basicConfig(
         format="[%(asctime)s] %(levelname)s: %(message)s",
         datefmt="%H:%M:%S",
@@ -70,6 +251,31 @@ def main():
         filename=config.get("logfile")
     )
 
+    if arguments.calibrate_kdf:
+        settings = hashing.calibrate(config.get("kdf"),
+                                     arguments.calibrate_kdf / 1000)
+        print("[security]")
+        for option, value in settings:
+            print("%s = %s" % (option, value))
+        return
+
+    if arguments.rebuild_counters:
+        initialize_database(config)
+        stale = repair_counters(config)
+        for counter, stored, actual in stale:
+            print("%s was %s, should be %s." % (counter, stored, actual))
+        print("Rebuilt counters, %d were wrong." % len(stale))
+        return
+
+    if arguments.rebuild_search:
+        initialize_database(config)
+        indexed = rebuild_search_index(config)
+        if indexed is None:
+            print("Posts cannot be searched, SQLite lacks FTS5.")
+        else:
+            print("Rebuilt the search index of %d posts." % indexed)
+        return
+
     if arguments.daemonize:
         context = daemon.DaemonContext()
         context.files_preseve = [arguments.config, config.get("database")]
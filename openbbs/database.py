@@ -1,13 +1,21 @@
 """Absctracted interfaces for the BBS database model."""
 
-import binascii
-import hashlib
+import hmac
+import logging
 import os
 import random
 import string
 import sqlite3
+import threading
 import time
 
+from openbbs import bans, hashing, notifications, stats
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
 CHARS = string.printable
 
 
@@ -17,50 +25,509 @@ def generate_salt(salt_length):
     return "".join(source.choice(CHARS) for _ in range(salt_length)).encode()
 
 
-def hash_password(password, salt, hash_iterations):
-    """Hashes a given password with the given salt over a specified
-    number of hash iterations.
+def _record_legacy_kdf(cursor, config):
+    """Records the KDF parameters that passwords hashed before they were
+    stored per user were hashed with.
+    """
+    parameters = "pbkdf2_sha512$%d" % int(config.get("hash_iterations"))
+    cursor.execute("UPDATE users SET kdf = ? WHERE kdf IS NULL;",
+                   (parameters,))
+
+
+# The ID of the newest post ever made, whether or not it still exists.
+_LAST_POST_ID = "IFNULL((SELECT seq FROM sqlite_sequence WHERE name = " \
+               "'posts'), 0)"
+
+
+def _record_seen_posts(cursor, config):
+    """Marks every user as having seen the posts made before their last
+    login.
     """
-    key = hashlib.pbkdf2_hmac("sha512", password, salt, hash_iterations)
-    return binascii.hexlify(key)
+    cursor.execute("UPDATE users SET seen_post = (SELECT IFNULL(MAX("
+                   "post_id), 0) FROM posts WHERE time <= "
+                   "users.last_login);")
+
+
+def rebuild_counters(cursor, config=None):
+    """Recounts the post and unread message counters from scratch.
+    Returns a list of (counter, stored, actual) for every counter that
+    had drifted from the data it counts.
+    """
+    cursor.execute("SELECT COUNT(*) FROM posts;")
+    posts = cursor.fetchone()[0]
+    cursor.execute("SELECT receiver, COUNT(*) FROM pms WHERE read = 0 GROUP "
+                   "BY receiver;")
+    unread = dict(cursor.fetchall())
+
+    cursor.execute("SELECT value FROM counters WHERE name = 'posts';")
+    row = cursor.fetchone()
+    stale = []
+    if row is None or row[0] != posts:
+        stale.append(("posts", row[0] if row else None, posts))
+    cursor.execute("SELECT receiver, count FROM unread;")
+    stored = dict(cursor.fetchall())
+    for receiver in sorted(set(unread) | set(stored)):
+        if stored.get(receiver, 0) != unread.get(receiver, 0):
+            stale.append(("unread:%s" % receiver, stored.get(receiver, 0),
+                          unread.get(receiver, 0)))
+
+    cursor.execute("INSERT OR REPLACE INTO counters (name, value) VALUES "
+                   "('posts', ?);", (posts,))
+    cursor.execute("DELETE FROM unread;")
+    cursor.executemany("INSERT INTO unread (receiver, count) VALUES (?, ?);",
+                       sorted(unread.items()))
+    return stale
+
+
+class SearchUnavailable(Exception):
+    """Raised when posts are searched on a database without a search
+    index, because its SQLite library lacks FTS5.
+    """
+
+
+def create_search_index(cursor, config=None):
+    """Creates the full-text index of post subjects and bodies, and the
+    triggers which keep it in sync with the posts table, then indexes
+    every existing post. Returns False, leaving search unavailable, if
+    SQLite was built without FTS5.
+    """
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS posts_search "
+                       "USING fts5(subject, body, content='posts', "
+                       "content_rowid='post_id');")
+    except sqlite3.OperationalError as error:
+        if "fts5" not in str(error):
+            raise
+        logging.warning("SQLite lacks FTS5, posts cannot be searched.")
+        return False
+    cursor.execute("CREATE TRIGGER IF NOT EXISTS posts_insert_search AFTER "
+                   "INSERT ON posts BEGIN INSERT INTO posts_search (rowid, "
+                   "subject, body) VALUES (NEW.post_id, NEW.subject, "
+                   "NEW.body); END;")
+    cursor.execute("CREATE TRIGGER IF NOT EXISTS posts_delete_search AFTER "
+                   "DELETE ON posts BEGIN INSERT INTO posts_search "
+                   "(posts_search, rowid, subject, body) VALUES ('delete', "
+                   "OLD.post_id, OLD.subject, OLD.body); END;")
+    cursor.execute("CREATE TRIGGER IF NOT EXISTS posts_update_search AFTER "
+                   "UPDATE OF subject, body ON posts BEGIN INSERT INTO "
+                   "posts_search (posts_search, rowid, subject, body) VALUES "
+                   "('delete', OLD.post_id, OLD.subject, OLD.body); INSERT "
+                   "INTO posts_search (rowid, subject, body) VALUES "
+                   "(NEW.post_id, NEW.subject, NEW.body); END;")
+    cursor.execute("INSERT INTO posts_search (posts_search) VALUES "
+                   "('rebuild');")
+    return True
+
+
+def _search_query(terms):
+    """Turns what a user typed into an FTS5 query matching posts which
+    contain every word, so that no input is a syntax error.
+    """
+    return " ".join('"%s"' % word.replace('"', '""')
+                    for word in terms.split())
+
+
+# Schema migrations, where the Nth entry upgrades a database from
+# user_version N - 1 to N. Each step is either an SQL statement or a
+# function taking a cursor and the configuration. Entries must never be
+# changed once released.
+MIGRATIONS = (
+    # Indexes for every hot query, and unique usernames. Duplicate
+    # accounts could only be created by racing registrations, and all but
+    # the first were unreachable anyway.
+    ("DELETE FROM users WHERE user_id NOT IN (SELECT MIN(user_id) FROM "
+     "users GROUP BY username);",
+     "CREATE UNIQUE INDEX IF NOT EXISTS users_username ON users "
+     "(username);",
+     "CREATE INDEX IF NOT EXISTS posts_board ON posts (board, reply, "
+     "post_id);",
+     "CREATE INDEX IF NOT EXISTS posts_reply ON posts (reply, post_id);",
+     "CREATE INDEX IF NOT EXISTS posts_time ON posts (time);",
+     "CREATE INDEX IF NOT EXISTS pms_receiver ON pms (receiver, read, "
+     "time);",
+     "CREATE INDEX IF NOT EXISTS bans_username ON bans (username);",
+     "CREATE INDEX IF NOT EXISTS bans_ip ON bans (ip);"),
+    # Per-user KDF parameters, see the hashing module.
+    ("ALTER TABLE users ADD COLUMN kdf TEXT;",
+     _record_legacy_kdf),
+    # Per-board version counters, bumped in the same transaction as every
+    # change to a board, so that rendered listings can be cached.
+    ("CREATE TABLE IF NOT EXISTS board_versions (board TEXT PRIMARY KEY "
+     "NOT NULL, version INTEGER NOT NULL);",
+     "CREATE TRIGGER IF NOT EXISTS posts_insert_version AFTER INSERT ON "
+     "posts BEGIN INSERT OR IGNORE INTO board_versions VALUES (NEW.board, "
+     "0); UPDATE board_versions SET version = version + 1 WHERE board = "
+     "NEW.board; END;",
+     "CREATE TRIGGER IF NOT EXISTS posts_delete_version AFTER DELETE ON "
+     "posts BEGIN INSERT OR IGNORE INTO board_versions VALUES (OLD.board, "
+     "0); UPDATE board_versions SET version = version + 1 WHERE board = "
+     "OLD.board; END;"),
+    # Counters kept up to date by triggers, so that the post count and
+    # login summary are lookups rather than scans.
+    ("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY NOT NULL, "
+     "value INTEGER NOT NULL);",
+     "CREATE TABLE IF NOT EXISTS unread (receiver TEXT PRIMARY KEY NOT "
+     "NULL, count INTEGER NOT NULL);",
+     "ALTER TABLE users ADD COLUMN seen_post INTEGER NOT NULL DEFAULT 0;",
+     "CREATE TRIGGER IF NOT EXISTS posts_insert_count AFTER INSERT ON posts "
+     "BEGIN UPDATE counters SET value = value + 1 WHERE name = 'posts'; "
+     "END;",
+     "CREATE TRIGGER IF NOT EXISTS posts_delete_count AFTER DELETE ON posts "
+     "BEGIN UPDATE counters SET value = value - 1 WHERE name = 'posts'; "
+     "END;",
+     "CREATE TRIGGER IF NOT EXISTS pms_insert_count AFTER INSERT ON pms "
+     "WHEN NEW.read = 0 BEGIN INSERT OR IGNORE INTO unread VALUES "
+     "(NEW.receiver, 0); UPDATE unread SET count = count + 1 WHERE "
+     "receiver = NEW.receiver; END;",
+     "CREATE TRIGGER IF NOT EXISTS pms_read_count AFTER UPDATE OF read ON "
+     "pms WHEN OLD.read = 0 AND NEW.read != 0 BEGIN UPDATE unread SET "
+     "count = count - 1 WHERE receiver = OLD.receiver; END;",
+     "CREATE TRIGGER IF NOT EXISTS pms_delete_count AFTER DELETE ON pms "
+     "WHEN OLD.read = 0 BEGIN UPDATE unread SET count = count - 1 WHERE "
+     "receiver = OLD.receiver; END;",
+     _record_seen_posts,
+     rebuild_counters),
+    # Ban list version, see the bans module.
+    ("INSERT OR IGNORE INTO counters (name, value) VALUES ('bans', 0);",
+     "CREATE TRIGGER IF NOT EXISTS bans_insert_version AFTER INSERT ON bans "
+     "BEGIN UPDATE counters SET value = value + 1 WHERE name = 'bans'; "
+     "END;",
+     "CREATE TRIGGER IF NOT EXISTS bans_delete_version AFTER DELETE ON bans "
+     "BEGIN UPDATE counters SET value = value + 1 WHERE name = 'bans'; "
+     "END;"),
+    # Full-text search of posts, see Database.search_posts.
+    (create_search_index,),
+)
+
+
+def connect(config, check_same_thread=True):
+    """Opens and configures a connection to the configured database."""
+    connection = sqlite3.connect(config.get("database"),
+                                 timeout=float(config.get("database_timeout")),
+                                 check_same_thread=check_same_thread)
+    connection.execute("PRAGMA temp_store = MEMORY;")
+    return connection
+
+
+def initialize(connection, config):
+    """Creates the database schema if it does not already exist, and
+    purges private messages that have passed the configured age.
+    """
+    cursor = connection.cursor()
+    cursor.execute("CREATE TABLE IF NOT EXISTS posts (post_id "
+                   "INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, time "
+                   "INTEGER NOT NULL, board TEXT NOT NULL, name TEXT "
+                   "NOT NULL, subject TEXT, body TEXT NOT NULL, "
+                   "reply INTEGER);")
+    cursor.execute("CREATE TABLE IF NOT EXISTS users (user_id "
+                   "INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, "
+                   "username TEXT NOT NULL, user_status TEXT NOT "
+                   "NULL, password TEXT NOT NULL, salt TEXT NOT "
+                   "NULL, last_login INTEGER NOT NULL);")
+    cursor.execute("CREATE TABLE IF NOT EXISTS bans (ban_no "
+                   "INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, "
+                   "username TEXT, ip TEXT, reason TEXT NOT NULL);")
+    cursor.execute("CREATE TABLE IF NOT EXISTS pms (message_id "
+                   "INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, "
+                   "sender TEXT NOT NULL, receiver TEXT NOT NULL, "
+                   "message TEXT NOT NULL, time INTEGER NOT NULL, "
+                   "read INTEGER NOT NULL);")
+
+    connection.commit()
+    migrate(connection, config)
+    # Persistent, so readers on every connection stop blocking on writers.
+    cursor.execute("PRAGMA journal_mode = WAL;")
+
+    if config.get("max_message_age"):
+        purge_messages(cursor, float(config.get("max_message_age")))
+
+    connection.commit()
+
+
+def migrate(connection, config):
+    """Brings the schema up to date by applying, in order, each migration
+    newer than the database's user_version. Every migration is applied
+    in its own transaction.
+    """
+    # Before Python 3.6, sqlite3 commits before any DDL unless it is left
+    # to manage no transactions, which would split up a migration.
+    isolation_level = connection.isolation_level
+    connection.isolation_level = None
+    cursor = connection.cursor()
+    try:
+        cursor.execute("PRAGMA user_version;")
+        version = cursor.fetchone()[0]
+        for number, statements in enumerate(MIGRATIONS[version:],
+                                            version + 1):
+            cursor.execute("BEGIN;")
+            try:
+                for statement in statements:
+                    if callable(statement):
+                        statement(cursor, config)
+                    else:
+                        cursor.execute(statement)
+                cursor.execute("PRAGMA user_version = %d;" % number)
+            except sqlite3.Error:
+                cursor.execute("ROLLBACK;")
+                raise
+            cursor.execute("COMMIT;")
+    finally:
+        connection.isolation_level = isolation_level
+
+
+def initialize_database(config):
+    """Sets up the configured database once, at server start."""
+    connection = connect(config)
+    try:
+        initialize(connection, config)
+    finally:
+        connection.close()
+
+
+def repair_counters(config):
+    """Rebuilds the configured database's counters in one transaction,
+    returning those that were wrong as in rebuild_counters.
+    """
+    connection = connect(config)
+    try:
+        stale = rebuild_counters(connection.cursor())
+        connection.commit()
+    finally:
+        connection.close()
+    return stale
+
+
+def rebuild_search_index(config):
+    """Creates the configured database's search index if it is missing,
+    and reindexes every post. Returns the number of posts indexed, or None
+    if SQLite was built without FTS5.
+    """
+    connection = connect(config)
+    try:
+        cursor = connection.cursor()
+        if not create_search_index(cursor):
+            return None
+        connection.commit()
+        cursor.execute("SELECT COUNT(*) FROM posts_search;")
+        return cursor.fetchone()[0]
+    finally:
+        connection.close()
+
+
+def purge_messages(cursor, max_age):
+    """Deletes read private messages older than max_age seconds, and
+    returns how many were deleted.
+    """
+    cursor.execute("DELETE FROM pms WHERE time <= ? AND read;",
+                   (time.time() - max_age,))
+    return cursor.rowcount
+
+
+class Writer(object):
+    """Owns the process's only writing database connection. Writes are
+    submitted from any thread and applied on the writer's own thread,
+    where writes that arrive together are applied in one transaction and
+    made durable with a single commit. Every purge_interval seconds, old
+    read messages are purged along with the writes.
+    """
+    def __init__(self, config):
+        self.interval = float(config.get("commit_interval"))
+        self.batch_size = int(config.get("commit_batch_size"))
+        self.max_message_age = float(config.get("max_message_age") or 0)
+        self.purge_interval = float(config.get("purge_interval"))
+        self.next_purge = time.time() + self.purge_interval
+        self.jobs = queue.Queue()
+        self.connection = connect(config, check_same_thread=False)
+        # Transactions are managed explicitly by _commit_batch.
+        self.connection.isolation_level = None
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def execute(self, function, *args):
+        """Runs function(cursor, *args) on the writer thread and returns
+        its result once the write has been committed.
+        """
+        job = _WriteJob(function, args)
+        self.jobs.put(job)
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def close(self):
+        """Commits any pending writes and stops the writer thread."""
+        self.jobs.put(None)
+        self.thread.join()
+        self.connection.close()
+
+    def _run(self):
+        running = True
+        while running:
+            batch = []
+            try:
+                batch.append(self.jobs.get(timeout=self._until_purge()))
+            except queue.Empty:
+                pass
+            deadline = time.time() + self.interval
+            while batch and batch[-1] is not None and \
+                    len(batch) < self.batch_size:
+                try:
+                    batch.append(self.jobs.get(
+                        timeout=max(0, deadline - time.time())
+                    ))
+                except queue.Empty:
+                    break
+            if batch and batch[-1] is None:
+                running = False
+                batch.pop()
+            if self.max_message_age and time.time() >= self.next_purge:
+                self.next_purge = time.time() + self.purge_interval
+                batch.append(_WriteJob(purge_messages,
+                                       (self.max_message_age,)))
+            if batch:
+                self._commit_batch(batch)
+
+    def _until_purge(self):
+        """Returns how long the writer may wait for writes before old
+        messages are due to be purged, or None if they never are.
+        """
+        if not self.max_message_age:
+            return None
+        return max(0, self.next_purge - time.time())
+
+    def _commit_batch(self, batch):
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE;")
+            for job in batch:
+                # A failing job is rolled back without affecting the rest.
+                cursor.execute("SAVEPOINT job;")
+                try:
+                    job.result = job.function(cursor, *job.args)
+                except Exception as error:
+                    job.error = error
+                    cursor.execute("ROLLBACK TO job;")
+                cursor.execute("RELEASE job;")
+            cursor.execute("COMMIT;")
+            stats.increment("database.commits")
+            stats.increment("database.writes", len(batch))
+        except Exception as error:
+            # Anything but a database error is a bug, but failing the
+            # batch keeps the writer thread, and every later write, alive.
+            if not isinstance(error, sqlite3.Error):
+                logging.exception("Unexpected error in a batch of writes.")
+            try:
+                cursor.execute("ROLLBACK;")
+            except sqlite3.Error:
+                pass  # The transaction never began, or has already ended.
+            for job in batch:
+                job.error = error
+        finally:
+            cursor.close()
+            for job in batch:
+                job.done.set()
+
+
+class _WriteJob(object):
+    """A write waiting to be applied by the Writer."""
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class ConnectionPool(object):
+    """Process-wide pool of configured database connections, handed out
+    to sessions in place of opening a new connection for each of them.
+    At most size connections are opened, and callers wait for one to be
+    released once they are all in use. Pooled connections are only used
+    for reading, all writes go through the pool's Writer.
+    """
+    def __init__(self, config, size):
+        self.config = config
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.opened = 0
+        self.writer = Writer(config)
+
+    def acquire(self):
+        """Returns an idle connection, opening one if none are idle and
+        the pool is not yet full.
+        """
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if self.opened < self.size:
+                self.opened += 1
+                return connect(self.config, check_same_thread=False)
+        return self.idle.get()
+
+    def release(self, connection):
+        """Returns a connection to the pool, discarding any uncommitted
+        changes.
+        """
+        connection.rollback()
+        self.idle.put(connection)
+
+    def close(self):
+        """Closes every idle connection in the pool, and its writer."""
+        while True:
+            try:
+                connection = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            connection.close()
+            with self.lock:
+                self.opened -= 1
+        self.writer.close()
 
 
 class Database(object):
     """Class representation of the BBS database model, containing
     various methods to abstract from otherwise complicated SQL
-    transactions.
+    transactions. Connections are borrowed from the given pool if there
+    is one, otherwise a connection is opened and the schema is set up.
+    Passwords are hashed on the process's hashing pool on behalf of the
+    given client address, and the given notifications subscriber is not
+    notified of its own posts. Every query is timed under
+    "query.<method>", with logins timed once, as "query.authenticate".
     """
-    def __init__(self, config):
+    def __init__(self, config, pool=None, client=None, subscriber=None):
         self.config = config
-        self.connection = sqlite3.connect(config.get("database"))
+        self.pool = pool
+        self.client = client
+        self.subscriber = subscriber
+        if pool is not None:
+            self.connection = pool.acquire()
+            self.writer = pool.writer
+        else:
+            self.connection = connect(config)
+            self.writer = None
+            initialize(self.connection, config)
         self.cursor = self.connection.cursor()
 
-        self.cursor.execute("CREATE TABLE IF NOT EXISTS posts (post_id "
-                            "INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, time "
-                            "INTEGER NOT NULL, board TEXT NOT NULL, name TEXT "
-                            "NOT NULL, subject TEXT, body TEXT NOT NULL, "
-                            "reply INTEGER);")
-        self.cursor.execute("CREATE TABLE IF NOT EXISTS users (user_id "
-                            "INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, "
-                            "username TEXT NOT NULL, user_status TEXT NOT "
-                            "NULL, password TEXT NOT NULL, salt TEXT NOT "
-                            "NULL, last_login INTEGER NOT NULL);")
-        self.cursor.execute("CREATE TABLE IF NOT EXISTS bans (ban_no "
-                            "INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, "
-                            "username TEXT, ip TEXT, reason TEXT NOT NULL);")
-        self.cursor.execute("CREATE TABLE IF NOT EXISTS pms (message_id "
-                            "INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, "
-                            "sender TEXT NOT NULL, receiver TEXT NOT NULL, "
-                            "message TEXT NOT NULL, time INTEGER NOT NULL, "
-                            "read INTEGER NOT NULL);")
-
-        if config.get("max_message_age"):
-            age_max = time.time() - float(config.get("max_message_age"))
-            self.cursor.execute("DELETE FROM pms WHERE time <= ? AND read;",
-                                (age_max,))
-
+    def _write(self, function, *args):
+        """Applies function(cursor, *args) as a write transaction and
+        returns its result. Writes go through the pool's writer thread if
+        there is one, otherwise they are committed on this connection.
+        """
+        if self.writer is not None:
+            return self.writer.execute(function, *args)
+        try:
+            result = function(self.cursor, *args)
+        except Exception:
+            self.connection.rollback()
+            raise
         self.connection.commit()
+        return result
 
+    @stats.timed("query.create_user")
     def create_user(self, name, password):
         """Creates a database entry in the users table for the given
         user information, provided that it does not already exist.
@@ -70,17 +537,17 @@ class Database(object):
         if not self.cursor.fetchone():
             status = "sysop" if name in self.config.get("operators") else "user"
 
-            salt_length = int(self.config.get("salt_length"))
-            hash_iterations = int(self.config.get("hash_iterations"))
-
-            salt = generate_salt(salt_length)
-            hashed = hash_password(password, salt, hash_iterations)
-            self.cursor.execute("INSERT INTO users (username, user_status, "
-                                "password, salt, last_login) VALUES "
-                                "(?, ?, ?, ?, ?);",
-                                (name, status, hashed, salt, time.time()))
-
-            self.connection.commit()
+            salt, hashed, parameters = self._hash_new_password(password)
+            try:
+                self._write(lambda cursor: cursor.execute(
+                    "INSERT INTO users (username, user_status, password, "
+                    "salt, last_login, kdf, seen_post) VALUES (?, ?, ?, ?, "
+                    "?, ?, %s);" % _LAST_POST_ID,
+                    (name, status, hashed, salt, time.time(), parameters)
+                ))
+            except sqlite3.IntegrityError:
+                # Another session registered the same name meanwhile.
+                status = None
         else:
             status = None
 
@@ -90,141 +557,279 @@ class Database(object):
         """Return the user_status if the given username and password
         match, otherwise returns None.
         """
-        self.cursor.execute("SELECT salt FROM users WHERE username = ?;",
-                            (name,))
+        return self.authenticate(name, password)[:2]
+
+    @stats.timed("query.authenticate")
+    def authenticate(self, name, password):
+        """Checks the given username and password, returning the user's
+        status, their previous login time, the number of posts made since
+        then and their number of unread messages. Everything is None if
+        the credentials do not match. Passwords hashed with anything other
+        than the current KDF policy are rehashed after a successful login.
+        """
+        # Posts since the last login are counted by post ID, so posts
+        # deleted since then are included.
+        self.cursor.execute("SELECT salt, password, kdf, user_status, "
+                            "last_login, %s - seen_post, IFNULL((SELECT "
+                            "count FROM unread WHERE receiver = "
+                            "users.username), 0) FROM users WHERE username = "
+                            "?;" % _LAST_POST_ID, (name,))
         result = self.cursor.fetchone()
-        if result:
-            hash_iterations = int(self.config.get("hash_iterations"))
-            hashed = hash_password(password, result[0], hash_iterations)
-            self.cursor.execute("SELECT user_status, last_login FROM users "
-                                "WHERE username = ? AND password = ?;",
-                                (name, hashed))
-            result = self.cursor.fetchone()
-
-            if result:
-                status, last_login = result
-            else:
-                status = last_login = None
-            if status == "user" and name in self.config.get("operators"):
-                self.cursor.execute("UPDATE users SET user_status = 'sysop' "
-                                    "WHERE username = ?;", (name,))
-                self.connection.commit()
-                status = "sysop"
-            if status is not None:
-                self.cursor.execute("UPDATE users SET last_login = ? WHERE "
-                                    "username = ?;", (time.time(), name))
-                self.connection.commit()
-        else:
-            status = last_login = None
-
-        return (status, last_login)
+        if not result:
+            return (None, None, None, None)
+
+        salt, stored, parameters, status, last_login, posts, messages = result
+        # Salts and hashes are bytes, but SQLite returns those stored as
+        # text, as Python 2 stores every str, as unicode.
+        if not isinstance(salt, bytes):
+            salt = salt.encode("latin-1")
+        if not isinstance(stored, bytes):
+            stored = stored.encode("ascii")
+        hashed = hashing.run(hashing.derive, (password, salt, parameters),
+                             self.client)
+        if not hmac.compare_digest(hashed, stored):
+            return (None, None, None, None)
+
+        if status == "user" and name in self.config.get("operators"):
+            status = "sysop"
+        rehashed = None
+        if parameters != hashing.policy(self.config):
+            rehashed = self._hash_new_password(password)
+        self._write(_record_login, name, status, time.time(), rehashed)
+        return (status, last_login, posts, messages)
+
+    def _hash_new_password(self, password):
+        """Hashes a password under the current KDF policy with a fresh
+        salt, returning the salt, hash and KDF parameters.
+        """
+        parameters = hashing.policy(self.config)
+        salt = generate_salt(int(self.config.get("salt_length")))
+        hashed = hashing.run(hashing.derive, (password, salt, parameters),
+                             self.client)
+        return (salt, hashed, parameters)
 
+    @stats.timed("query.check_banned")
     def check_banned(self, name, ip_address):
         """Query the database to see if a given username or IP is banned, and
-        return the reason if it is.
+        return the reason if it is. Checked against the process's ban
+        registry if it has one, which also covers banned ranges.
         """
+        if bans.active():
+            bans.update(self.cursor)
+            return bans.check(name, ip_address)
         self.cursor.execute("SELECT reason FROM bans WHERE username = ? OR "
                             "ip = ?;", (name, ip_address))
         value = self.cursor.fetchone()
         return value[0] if value else None
 
+    @stats.timed("query.ban_user")
     def ban_user(self, reason, name=None, ip_address=None):
         """Adds a username/ip and ban reason to the bans table, returning true
-        if the operation was successful.
+        if the operation was successful. The ip may be a CIDR range.
         """
-        self.cursor.execute("INSERT INTO bans (username, ip, reason) VALUES "
-                            "(?, ?, ?);", (name, ip_address, reason))
-        self.connection.commit()
+        self._write(lambda cursor: cursor.execute(
+            "INSERT INTO bans (username, ip, reason) VALUES (?, ?, ?);",
+            (name, ip_address, reason)
+        ))
+        bans.update(self.cursor)
 
+    @stats.timed("query.unban_user")
     def unban_user(self, name=None, ip_address=None):
         """Removes a username/ip from the bans table, returning true if the
         operation was successful.
         """
-        self.cursor.execute("DELETE FROM bans WHERE username = ? OR ip = ?;",
-                            (name, ip_address))
-        self.connection.commit()
+        self._write(lambda cursor: cursor.execute(
+            "DELETE FROM bans WHERE username = ? OR ip = ?;",
+            (name, ip_address)
+        ))
+        bans.update(self.cursor)
 
+    @stats.timed("query.make_op")
     def make_op(self, name):
         """Promotes the given username to a status of sysop."""
-        self.cursor.execute("UPDATE users SET user_status = 'sysop' WHERE "
-                            "username = ?;", (name,))
-        self.connection.commit()
+        self._write(lambda cursor: cursor.execute(
+            "UPDATE users SET user_status = 'sysop' WHERE username = ?;",
+            (name,)
+        ))
 
+    @stats.timed("query.remove_op")
     def remove_op(self, name):
         """Makes the given user a standard user on the BBS."""
-        self.cursor.execute("UPDATE users SET user_status = 'user' WHERE "
-                            "username = ?;", (name,))
-        self.connection.commit()
+        self._write(lambda cursor: cursor.execute(
+            "UPDATE users SET user_status = 'user' WHERE username = ?;",
+            (name,)
+        ))
 
+    @stats.timed("query.delete_post")
     def delete_post(self, post_id):
         """Deletes the post located at the given ID."""
-        self.cursor.execute("DELETE FROM posts WHERE post_id = ?;", (post_id,))
-        self.connection.commit()
+        self._write(lambda cursor: cursor.execute(
+            "DELETE FROM posts WHERE post_id = ?;", (post_id,)
+        ))
+
+    @stats.timed("query.get_board_version")
+    def get_board_version(self, board):
+        """Returns a number which changes whenever a post is made on, or
+        deleted from, the given board.
+        """
+        self.cursor.execute("SELECT version FROM board_versions WHERE "
+                            "board = ?;", (board,))
+        row = self.cursor.fetchone()
+        return row[0] if row else 0
 
+    @stats.timed("query.get_post_count")
     def get_post_count(self, last_login=0):
-        """Returns the number of posts currently in the BBS's database if a
-        board is unspecified, otherwise returns the number of posts in that
-        board.
+        """Returns the number of posts currently in the BBS's database, or
+        the number made since the given time.
         """
-        self.cursor.execute("SELECT COUNT(post_id) FROM posts WHERE time > ?;",
-                            (last_login,))
+        if not last_login:
+            self.cursor.execute("SELECT value FROM counters WHERE name = "
+                                "'posts';")
+        else:
+            self.cursor.execute("SELECT COUNT(post_id) FROM posts WHERE "
+                                "time > ?;", (last_login,))
         result = self.cursor.fetchone()
         return result[0] if result else 0
 
-    def get_posts(self, board, thread=None):
-        """Returns a list of all posts on a given board, or a list of
-        replies in a thread if a thread number is specified.
+    @stats.timed("query.get_posts")
+    def get_posts(self, board, thread=None, limit=None, after=None,
+                  before=None, since=None):
+        """Returns a list of all posts on a given board, newest first, or a
+        list of replies in a thread, oldest first, if a thread number is
+        specified. Threads on other boards have no posts, so that every
+        listing changes along with its board's version. A listing can be
+        paged by giving a limit, along with the ID of the post that the
+        page should follow or precede. Given the ID of the newest post
+        already seen, only newer posts are returned, up to the limit of
+        the oldest of them.
         """
         if thread:
-            self.cursor.execute("SELECT post_id, time, name, subject, body "
-                                "FROM posts WHERE post_id = ? AND reply is "
-                                "NULL OR reply = ? ORDER BY post_id ASC;",
-                                (thread, thread))
-            posts = self.cursor.fetchall()
+            # The board is checked without its index, which would have
+            # the whole board scanned.
+            query = ("SELECT post_id, time, name, subject, body FROM posts "
+                     "WHERE (post_id = ? AND reply IS NULL OR reply = ?) "
+                     "AND +board = ?")
+            parameters = [thread, thread, board]
+            ascending = True
         else:
-            self.cursor.execute("SELECT post_id, time, name, subject, body "
-                                "FROM posts WHERE board = ? AND reply IS NULL "
-                                "ORDER BY post_id DESC;", (board,))
-            posts = self.cursor.fetchall()
+            query = ("SELECT post_id, time, name, subject, body FROM posts "
+                     "WHERE board = ? AND reply IS NULL")
+            parameters = [board]
+            ascending = False
+
+        if after is not None:
+            query += " AND post_id %s ?" % (">" if ascending else "<")
+            parameters.append(after)
+        if before is not None:
+            query += " AND post_id %s ?" % ("<" if ascending else ">")
+            parameters.append(before)
+            # Read backwards from the given post, then flip the page.
+            ascending = not ascending
+        if since is not None:
+            query += " AND post_id > ?"
+            parameters.append(since)
+            # Read forwards from the given post, in listing order.
+            ascending, flip = True, not ascending
+        else:
+            flip = before is not None
+        query += " ORDER BY post_id %s" % ("ASC" if ascending else "DESC")
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters.append(limit)
+
+        self.cursor.execute(query + ";", parameters)
+        posts = self.cursor.fetchall()
+        if flip:
+            posts.reverse()
         return posts
 
+    @stats.timed("query.search_posts")
+    def search_posts(self, terms, board=None, limit=None, offset=0):
+        """Returns the posts containing every word of the given terms, on
+        the given board or on all of them, best matches first. Each result
+        is a (thread, board, name, excerpt) tuple, where thread is the
+        post's thread number. Raises SearchUnavailable if there is no
+        search index.
+        """
+        query = _search_query(terms)
+        if not query:
+            return []
+        statement = ("SELECT IFNULL(posts.reply, posts.post_id), "
+                     "posts.board, posts.name, snippet(posts_search, -1, "
+                     "'', '', '...', 8) FROM posts_search JOIN posts ON "
+                     "posts.post_id = posts_search.rowid WHERE posts_search "
+                     "MATCH ?")
+        parameters = [query]
+        if board is not None:
+            statement += " AND posts.board = ?"
+            parameters.append(board)
+        statement += " ORDER BY rank LIMIT ? OFFSET ?;"
+        parameters.extend((-1 if limit is None else limit, offset))
+        try:
+            self.cursor.execute(statement, parameters)
+        except sqlite3.OperationalError as error:
+            if "no such table" in str(error):
+                raise SearchUnavailable()
+            raise
+        return self.cursor.fetchall()
+
+    @stats.timed("query.make_post")
     def make_post(self, name, subject, body, board, reply=None):
-        """Creates a database entry for the given post information."""
-        self.cursor.execute("INSERT INTO posts (time, name, board, subject, "
-                            "body, reply) VALUES (?, ?, ?, ?, ?, ?);",
-                            (time.time(), name, board, subject, body, reply))
-        self.connection.commit()
+        """Creates a database entry for the given post information, and
+        notifies the followers of its thread or board. Returns the new
+        post's ID.
+        """
+        post_time = time.time()
+        post_id = self._write(lambda cursor: cursor.execute(
+            "INSERT INTO posts (time, name, board, subject, body, reply) "
+            "VALUES (?, ?, ?, ?, ?, ?);",
+            (post_time, name, board, subject, body, reply)
+        ).lastrowid)
+        if reply:
+            notifications.publish(("thread", str(reply)), "New reply in #%s "
+                                  "by %s." % (reply, name), self.subscriber,
+                                  (post_id, post_time, name, subject, body))
+        else:
+            notifications.publish(("board", board), "New thread #%d on %s "
+                                  "by %s." % (post_id, board, name),
+                                  self.subscriber)
+        return post_id
 
+    @stats.timed("query.send_pm")
     def send_pm(self, sender, receiver, message):
         """Generate a database entry for a private message with the given
         sender, receiver and message if the receiver exists.
         """
-        self.cursor.execute("SELECT user_id FROM users WHERE username = ?;",
-                            (receiver,))
-        if self.cursor.fetchone():
-            self.cursor.execute("INSERT INTO pms (sender, receiver, message, "
-                                "time, read) VALUES (?, ?, ?, ?, 0);",
-                                (sender, receiver, message, time.time()))
-            self.connection.commit()
-            return True
-
+        sent = self._write(_insert_pm, sender, receiver, message,
+                           time.time())
+        if sent:
+            notifications.publish(("inbox", receiver),
+                                  "New message from %s." % sender)
+        return sent
+
+    @stats.timed("query.get_pm_count")
     def get_pm_count(self, receiver):
-        """Get the number of PM's in the receiver's inbox."""
-        self.cursor.execute("SELECT COUNT(*) FROM pms WHERE receiver = ? AND "
-                            "read = 0;", (receiver,))
-        return self.cursor.fetchone()[0]
+        """Get the number of unread PM's in the receiver's inbox."""
+        self.cursor.execute("SELECT count FROM unread WHERE receiver = ?;",
+                            (receiver,))
+        result = self.cursor.fetchone()
+        return result[0] if result else 0
 
+    @stats.timed("query.get_pms")
     def get_pms(self, receiver):
         """Get all of the PM's sent to the given receiver."""
         self.cursor.execute("SELECT message_id, sender, message, time, read "
                             "FROM pms WHERE receiver = ? ORDER BY time DESC;",
                             (receiver,))
         messages = self.cursor.fetchall()
-        self.cursor.execute("UPDATE pms SET read = 1 WHERE receiver = ?;",
-                            (receiver,))
-        self.connection.commit()
+        if any(not read for _, _, _, _, read in messages):
+            self._write(lambda cursor: cursor.execute(
+                "UPDATE pms SET read = 1 WHERE receiver = ? AND read = 0;",
+                (receiver,)
+            ))
         return messages
 
+    @stats.timed("query.get_specific_pm")
     def get_specific_pm(self, receiver, message_id):
         """Get the private message with the given ID, ensuring that the
         user has permission to read it.
@@ -232,11 +837,50 @@ class Database(object):
         self.cursor.execute("SELECT sender, message FROM pms WHERE receiver "
                             "= ? AND message_id = ?;", (receiver, message_id))
         message = self.cursor.fetchone()
-        self.cursor.execute("UPDATE pms SET read = 1 WHERE receiver = ? AND "
-                            "message_id = ?;", (receiver, message_id))
-        self.connection.commit()
+        if message:
+            self._write(lambda cursor: cursor.execute(
+                "UPDATE pms SET read = 1 WHERE receiver = ? AND message_id "
+                "= ?;", (receiver, message_id)
+            ))
         return message
 
     def close(self):
-        """Closes the current database."""
-        self.connection.close()
+        """Closes the current database, or returns its connection to the
+        pool that it was borrowed from.
+        """
+        self.cursor.close()
+        if self.pool is not None:
+            self.pool.release(self.connection)
+        else:
+            self.connection.close()
+
+
+def _record_login(cursor, name, status, login_time, rehashed=None):
+    """Stores a successful login's time and the newest post the user has
+    been told about, along with the user's status in case they have been
+    made an operator since, and their password if it has been rehashed
+    under a new KDF policy.
+    """
+    if rehashed is None:
+        cursor.execute("UPDATE users SET user_status = ?, last_login = ?, "
+                       "seen_post = %s WHERE username = ?;" % _LAST_POST_ID,
+                       (status, login_time, name))
+    else:
+        salt, hashed, parameters = rehashed
+        cursor.execute("UPDATE users SET user_status = ?, last_login = ?, "
+                       "seen_post = %s, salt = ?, password = ?, kdf = ? "
+                       "WHERE username = ?;" % _LAST_POST_ID,
+                       (status, login_time, salt, hashed, parameters, name))
+
+
+def _insert_pm(cursor, sender, receiver, message, sent_time):
+    """Stores a private message if the receiver exists, returning True if
+    it was stored.
+    """
+    cursor.execute("SELECT user_id FROM users WHERE username = ?;",
+                   (receiver,))
+    if cursor.fetchone():
+        cursor.execute("INSERT INTO pms (sender, receiver, message, time, "
+                       "read) VALUES (?, ?, ?, ?, 0);",
+                       (sender, receiver, message, sent_time))
+        return True
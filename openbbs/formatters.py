@@ -1,124 +1,231 @@
-"""General text formatters to be used as shell output."""
+"""General text formatters to be used as shell output.
+
+Each screen is built by a generator which yields it as encoded chunks,
+one row at a time, so that large listings can be streamed to a client
+without ever being held whole. The box_* functions join those chunks
+into a single string. Time spent rendering each kind of screen is
+recorded as "render.<kind>".
+"""
 
 import textwrap
 import time
 
+from openbbs import stats
+
 DISALLOWED_CHARACTERS = (7, 8, 12, 26, 27, 127)
 
+_DISALLOWED = "".join(chr(value) for value in DISALLOWED_CHARACTERS)
+_SEPARATOR = "+" + "=" * 78 + "+\r\n"
+_WRAPPER = textwrap.TextWrapper(width=76)
+
 
 def scrub_input(text):
     """Removes control-character injection from the given text."""
-    return text.strip("".join((chr(value) for value in DISALLOWED_CHARACTERS)))
+    return text.strip(_DISALLOWED)
 
 
-def box_boards(boards):
-    """Formats the given boards into a nice-looking listing."""
-    string = "+=============================================================" \
-             "=================+\r\n|                                BOARD L" \
-             "ISTING                                 |\r\n+=================" \
-             "=============================================================+" \
-             "\r\n"
+def _memoize_time(function):
+    """Returns a per-call cache around a function of a timestamp. Only
+    whole seconds are shown, so timestamps are cached by the second.
+    """
+    memo = {}
+
+    def format_time(timestamp):
+        second = int(timestamp)
+        text = memo.get(second)
+        if text is None:
+            text = memo[second] = function(timestamp)
+        return text
+    return format_time
+
+
+def _heading(title):
+    """Returns the boxed, centred title shared by posts and messages."""
+    title = title[:73] + "..." if len(title) > 76 else title
+    if len(title) % 2 == 1:
+        title += " "
+    padding = ((76 - len(title)) // 2) * " "
+    return (_SEPARATOR + "| " + padding + title + padding + " |\r\n" +
+            _SEPARATOR).encode()
+
+
+def _wrap(text):
+    """Wraps text exactly as textwrap.wrap(text, 76) would. Text made of
+    single-spaced words without hyphens, which is nearly all of it, is
+    packed directly rather than through textwrap's regular expressions.
+    """
+    if not text:
+        return []
+    words = text.split(" ")
+    if "-" in text or text != " ".join(text.split()) or \
+            max(len(word) for word in words) > 76:
+        return _WRAPPER.wrap(text)
+
+    lines = []
+    line = words[0]
+    for word in words[1:]:
+        if len(line) + len(word) < 76:
+            line += " " + word
+        else:
+            lines.append(line)
+            line = word
+    lines.append(line)
+    return lines
+
+
+def _body(text):
+    """Returns the given text wrapped into the rows of a box."""
+    lines = _wrap(scrub_input(text))
+    return ("".join("| %-76s |\r\n" % line for line in lines) +
+            _SEPARATOR).encode()
+
+
+@stats.timed("render.boards")
+def iter_boards(boards):
+    """Yields the given boards as a nice-looking listing."""
+    yield (_SEPARATOR + "|                                BOARD LISTING     "
+           "                            |\r\n" + _SEPARATOR).encode()
 
     for title, description in (board.split(":") for board in boards):
         title = title[:15] + "..." if len(title) > 18 else title
         description = description[:52] + "..." if len(description) > 55 else \
                       description
-        string += "| %-18s | %55s |\r\n+====================================" \
-                  "==========================================+\r\n" % \
-                  (scrub_input(title), scrub_input(description))
-
-    return string
-
-
-def box_posts(posts):
-    """Formats a list of threads into a nice-looking listing."""
-    string = "+=============================================================" \
-             "=================+\r\n|                                THREAD " \
-             "LISTING                                |\r\n+=================" \
-             "=============================================================+" \
-             "\r\n"
-
+        yield ("| %-18s | %55s |\r\n" % (scrub_input(title),
+                                          scrub_input(description)) +
+               _SEPARATOR).encode()
+
+
+@stats.timed("render.posts")
+def iter_posts(posts):
+    """Yields a list of threads as a nice-looking listing."""
+    yield (_SEPARATOR + "|                                THREAD LISTING    "
+           "                            |\r\n" + _SEPARATOR).encode()
+    for chunk in _post_rows(posts):
+        yield chunk
+
+
+@stats.timed("render.new_posts")
+def iter_new_posts(posts):
+    """Yields threads to be added below a listing already shown."""
+    yield _SEPARATOR.encode()
+    for chunk in _post_rows(posts):
+        yield chunk
+
+
+def _post_rows(posts):
+    """Yields a row of a thread listing for each of the given threads."""
+    format_time = _memoize_time(
+        lambda pub_time: time.strftime("%m/%d/%y %H:%M:%S",
+                                       time.localtime(pub_time))
+    )
     for post_id, pub_time, poster, subject, _ in posts:
         poster = poster[:16] + "..." if len(poster) > 19 else poster
         subject = subject[:24] + "..." if len(subject) > 27 else subject
-        time_text = time.strftime("%m/%d/%y %H:%M:%S",
-                                  time.localtime(pub_time))
-        string += "| #%-6d| %.17s | %-19s| %-27s|\r\n+======================" \
-                  "========================================================+" \
-                  "\r\n" % (post_id, time_text, scrub_input(poster),
-                            scrub_input(subject.strip()))
+        yield ("| #%-6d| %.17s | %-19s| %-27s|\r\n" %
+               (post_id, format_time(pub_time), scrub_input(poster),
+                scrub_input(subject.strip())) + _SEPARATOR).encode()
 
-    return string
 
+@stats.timed("render.thread")
+def iter_thread(posts, title=None):
+    """Yields a list of posts as a nice-looking listing. The title
+    defaults to the subject of the first post, which is only the thread's
+    subject on its first page.
+    """
+    yield _heading(scrub_input(posts[0][3] if title is None else title))
+    for chunk in _thread_rows(posts):
+        yield chunk
 
-def box_thread(posts):
-    """Formats a list of posts into a nice-looking listing."""
-    title = scrub_input(posts[0][3])
-    title = title[:73] + "..." if len(title) > 76 else title
-    if len(title) % 2 == 1:
-        title += " "
 
-    string = "+=============================================================" \
-             "=================+\r\n| " + ((76 - len(title)) // 2) * " " \
-             + "%s" % title + ((76 - len(title)) // 2) * " " + " |\r\n+=====" \
-             "==============================================================" \
-             "===========+\r\n"
+@stats.timed("render.new_replies")
+def iter_new_replies(posts):
+    """Yields posts to be added below a thread already shown."""
+    yield _SEPARATOR.encode()
+    for chunk in _thread_rows(posts):
+        yield chunk
+
 
+def _thread_rows(posts):
+    """Yields the boxed header and body of each of the given posts."""
+    format_time = _memoize_time(time.ctime)
     for post_id, post_time, name, _, body in posts:
-        body = scrub_input(body)
         name = name[:23] + "..." if len(name) > 26 else name
-        string += "| #%-9d | %-26s posted on %-26s |\r\n+===================="\
-                  "=========================================================="\
-                  "+\r\n" % (post_id, scrub_input(name), time.ctime(post_time))
+        yield ("| #%-9d | %-26s posted on %-26s |\r\n" %
+               (post_id, scrub_input(name), format_time(post_time)) +
+               _SEPARATOR).encode()
+        yield _body(body)
+
+
+@stats.timed("render.results")
+def iter_results(results):
+    """Yields a list of search results as a nice-looking listing."""
+    yield (_SEPARATOR + "|                                SEARCH RESULTS    "
+           "                            |\r\n" + _SEPARATOR).encode()
+
+    for thread, board, poster, excerpt in results:
+        board = board[:9] + "..." if len(board) > 12 else board
+        poster = poster[:13] + "..." if len(poster) > 16 else poster
+        excerpt = " ".join(scrub_input(excerpt).split())
+        excerpt = excerpt[:33] + "..." if len(excerpt) > 36 else excerpt
+        yield ("| #%-6d| %-12s| %-16s| %-36s|\r\n" %
+               (thread, scrub_input(board), scrub_input(poster), excerpt) +
+               _SEPARATOR).encode()
+
+
+@stats.timed("render.inbox")
+def iter_inbox(messages):
+    """Yields a list of private messages as a nice-looking inbox."""
+    yield (_SEPARATOR + "|                                    INBOX         "
+           "                            |\r\n" + _SEPARATOR).encode()
+
+    format_time = _memoize_time(
+        lambda timesent: time.strftime("%m/%d/%y", time.localtime(timesent))
+    )
+    for message_id, sender, message, timesent, read in messages:
+        sender = sender[:7] + "..." if len(sender) > 10 else sender
+        message = message[:28] + "..." if len(message) > 31 else message
+        message_status = "R" if read else "N"
+        yield ("| %1s | #%-4s | From %-10s on %-11s | %-31s |\r\n" %
+               (message_status, message_id, scrub_input(sender),
+                format_time(timesent), scrub_input(message)) +
+               _SEPARATOR).encode()
 
-        for line in textwrap.wrap(body, width=76):
-            string += "| %-76s |\r\n" % line
-        string += "+========================================================" \
-                  "======================+\r\n"
 
-    return string
+@stats.timed("render.message")
+def iter_message(message):
+    """Yields a private message as a box similar to a post's."""
+    sender, message = message
+    yield _heading("Message from %s" % scrub_input(sender))
+    yield _body(message)
 
 
-def box_inbox(messages):
-    """Formats a list of private messages into a nice-looking inbox."""
-    string = "+=============================================================" \
-             "=================+\r\n|                                    INB" \
-             "OX                                     |\r\n+=================" \
-             "=============================================================+" \
-             "\r\n"
+def box_boards(boards):
+    """Formats the given boards into a nice-looking listing."""
+    return b"".join(iter_boards(boards)).decode()
 
-    for message_id, sender, message, timesent, read in messages:
-        text_time = time.strftime("%m/%d/%y", time.localtime(timesent))
-        sender = sender[:7] + "..." if len(sender) > 10 else sender
-        message = message[:28] + "..." if len(message) > 31 else message
-        message_status = "R" if read else "N"
 
-        string += "| %1s | #%-4s | From %-10s on %-11s | %-31s |\r\n+=======" \
-                  "=========================================================" \
-                  "==============+\r\n" % (message_status, message_id,
-                                           scrub_input(sender), text_time,
-                                           scrub_input(message))
+def box_posts(posts):
+    """Formats a list of threads into a nice-looking listing."""
+    return b"".join(iter_posts(posts)).decode()
+
 
-    return string
+def box_thread(posts, title=None):
+    """Formats a list of posts into a nice-looking listing, under the
+    given title if it is not the first page of the thread.
+    """
+    return b"".join(iter_thread(posts, title)).decode()
 
 
-def box_message(message):
-    """Format a private message into a box similar to a post's."""
-    sender, message = message
-    title = "Message from %s" % scrub_input(sender)
-    title = title[:73] + "..." if len(title) > 76 else title
-    if len(title) % 2 == 1:
-        title += " "
+def box_results(results):
+    """Formats a list of search results into a nice-looking listing."""
+    return b"".join(iter_results(results)).decode()
+
 
-    string = "+=============================================================" \
-             "=================+\r\n| " + ((76 - len(title)) // 2) * " " \
-             + "%s" % title + ((76 - len(title)) // 2) * " " + " |\r\n+=====" \
-             "==============================================================" \
-             "===========+\r\n"
+def box_inbox(messages):
+    """Formats a list of private messages into a nice-looking inbox."""
+    return b"".join(iter_inbox(messages)).decode()
 
-    for line in textwrap.wrap(scrub_input(message), width=76):
-        string += "| %-76s |\r\n" % line
-    string += "+========================================================" \
-              "======================+\r\n"
 
-    return string
+def box_message(message):
+    """Format a private message into a box similar to a post's."""
+    return b"".join(iter_message(message)).decode()
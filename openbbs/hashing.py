@@ -0,0 +1,203 @@
+"""Password hashing. Key derivation is by far the most expensive thing a
+session does, so it is run on a dedicated, bounded pool of threads where
+a storm of logins cannot starve the rest of the server. The hash
+functions release the GIL, so threads suffice.
+
+The algorithm and cost parameters used for a password are stored with
+it as a string such as "pbkdf2_sha512$500000" or "scrypt$16384$8$1", so
+that the configured policy can be changed at any time.
+"""
+
+import binascii
+import collections
+import hashlib
+import logging
+import multiprocessing
+import threading
+import time
+
+from openbbs import stats
+
+_pool = None
+
+
+def policy(config):
+    """Returns the parameters that newly hashed passwords should use."""
+    if config.get("kdf") == "scrypt":
+        return "scrypt$%d$%d$%d" % (int(config.get("scrypt_n")),
+                                    int(config.get("scrypt_r")),
+                                    int(config.get("scrypt_p")))
+    return "pbkdf2_sha512$%d" % int(config.get("hash_iterations"))
+
+
+def derive(password, salt, parameters):
+    """Derives a hex-encoded key from the given password and salt, using
+    the algorithm and cost described by the parameters string.
+    """
+    algorithm = parameters.split("$")[0]
+    values = [int(value) for value in parameters.split("$")[1:]]
+    if algorithm == "pbkdf2_sha512":
+        key = hashlib.pbkdf2_hmac("sha512", password, salt, values[0])
+    elif algorithm == "scrypt":
+        cost, block_size, parallelism = values
+        key = hashlib.scrypt(password, salt=salt, n=cost, r=block_size,
+                             p=parallelism, dklen=64,
+                             maxmem=256 * cost * block_size * parallelism)
+    else:
+        raise ValueError("Unknown key derivation function \"%s\"." %
+                         algorithm)
+    return binascii.hexlify(key)
+
+
+def calibrate(algorithm, target):
+    """Finds the cost for the given algorithm at which deriving a key
+    takes roughly target seconds on this machine. Returns the matching
+    configuration options as a list of (option, value) pairs.
+    """
+    def measure(parameters):
+        started = time.time()
+        derive(b"calibration", b"salt" * 16, parameters)
+        return time.time() - started
+
+    if algorithm == "scrypt":
+        # Cost must be a power of two, and memory grows along with it.
+        cost = 2 ** 10
+        while cost < 2 ** 20 and \
+                measure("scrypt$%d$8$1" % (cost * 2)) <= target:
+            cost *= 2
+        return [("kdf", "scrypt"), ("scrypt_n", cost), ("scrypt_r", 8),
+                ("scrypt_p", 1)]
+
+    sample = 100000
+    iterations = int(sample * target / measure("pbkdf2_sha512$%d" % sample))
+    return [("kdf", "pbkdf2_sha512"),
+            ("hash_iterations", max(1000, iterations // 1000 * 1000))]
+
+
+class HashingBusy(Exception):
+    """Raised when a hash is refused because too many are queued."""
+
+
+class HashingPool(object):
+    """Runs hash functions on a fixed number of threads. Pending requests
+    are queued per client and served round-robin between clients, so one
+    address flooding the server with logins only delays itself. Requests
+    beyond the total or per-client queue limits are refused.
+    """
+    def __init__(self, threads, queue_limit, client_limit):
+        self.queue_limit = queue_limit
+        self.client_limit = client_limit
+        self.condition = threading.Condition()
+        self.pending = {}
+        self.rotation = collections.deque()
+        self.queued = 0
+        self.running = True
+        self.threads = [threading.Thread(target=self._work)
+                        for _ in range(threads)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, function, args, client=None):
+        """Runs function(*args) on a hashing thread on behalf of the
+        given client, and returns its result.
+        """
+        job = _HashJob(function, args)
+        with self.condition:
+            queue = self.pending.get(client)
+            if self.queued >= self.queue_limit or \
+               (queue is not None and len(queue) >= self.client_limit):
+                stats.increment("hashing.refused")
+                logging.warning("Refused to hash a password for %s, too "
+                                "many are queued.", client)
+                raise HashingBusy()
+            if queue is None:
+                queue = self.pending[client] = collections.deque()
+                self.rotation.append(client)
+            queue.append(job)
+            self.queued += 1
+            stats.set_value("hashing.queued", self.queued)
+            self.condition.notify()
+
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def close(self):
+        """Stops the hashing threads once the queue is empty."""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+
+    def _next_job(self):
+        with self.condition:
+            while self.running and not self.rotation:
+                self.condition.wait()
+            if not self.rotation:
+                return None
+            client = self.rotation.popleft()
+            queue = self.pending[client]
+            job = queue.popleft()
+            if queue:
+                self.rotation.append(client)
+            else:
+                del self.pending[client]
+            self.queued -= 1
+            stats.set_value("hashing.queued", self.queued)
+        return job
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                break
+            started = time.time()
+            stats.record("hashing.wait", started - job.submitted)
+            try:
+                job.result = job.function(*job.args)
+            except Exception as error:
+                job.error = error
+            stats.record("hashing.time", time.time() - started)
+            job.done.set()
+
+
+class _HashJob(object):
+    """A hash waiting to be run by the HashingPool."""
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.done = threading.Event()
+
+
+def start(config):
+    """Starts the process's hashing pool according to the configuration.
+    Until it is started, hashes are run on the calling thread.
+    """
+    global _pool
+    threads = int(config.get("hash_threads")) or multiprocessing.cpu_count()
+    _pool = HashingPool(threads,
+                        int(config.get("hash_queue_limit")),
+                        int(config.get("hash_client_limit")))
+
+
+def stop():
+    """Stops the process's hashing pool."""
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+
+
+def run(function, args, client=None):
+    """Runs function(*args) on the process's hashing pool on behalf of
+    the given client, or on the calling thread if there is no pool.
+    """
+    if _pool is None:
+        return function(*args)
+    return _pool.submit(function, args, client)
@@ -2,6 +2,91 @@
 
 import time
 
+from openbbs import ratelimit
+from openbbs.hashing import HashingBusy
+
+BUSY = "The server is busy, please try again in a moment."
+MENU = ("=======================\r\nPLEASE SELECT AN OPTION\r\n=============="
+        "=========\r\n[L]OGIN\t\tLogin to an existing account.\r\n"
+        "[R]EGISTER\tCreate a new account on this BBS."
+        "\r\n[A]NONYMOUS\tUse the BBS anonymously.\r\n"
+        "[Q]UIT\t\tExit the BBS.")
+
+
+# The prompts of each option, with whether their answers are secret.
+LOGIN = (("USERNAME: ", False), ("PASSWORD: ", True))
+REGISTRATION = LOGIN + (("CONFIRM PASSWORD: ", True),)
+
+
+def ask(user, questions):
+    """Sends the client each of the given prompts in turn, and returns
+    their answers.
+    """
+    answers = []
+    for question, secret in questions:
+        user.send(question, end="")
+        answers.append(user.receive(secret=secret))
+    return answers
+
+
+def login_user(user):
+    """Asks the client for their credentials and attempts to log them
+    in. Returns a (name, status) pair, or None if the login failed.
+    """
+    return check_login(user, *ask(user, LOGIN))
+
+
+def check_login(user, name, password):
+    """Attempts to log the client in with the credentials they gave.
+    Returns a (name, status) pair, or None if the login failed.
+    """
+    name = name.lower()
+    if not ratelimit.allow("login", user.ip_address, name):
+        user.send(ratelimit.LOGINS)
+        return None
+    try:
+        status, last_login, posts, messages = \
+            user.database.authenticate(name, password.encode())
+    except HashingBusy:
+        user.send(BUSY)
+        return None
+    if status and last_login:
+        user.send("Successfully logged in as %s." % name)
+        user.send("Last Login: %s." % time.ctime(last_login))
+        user.send("Posts since then: %d." % posts)
+        user.send("You have %d new messages." % messages)
+        return (name, status)
+    user.send("Invalid login credentials.")
+
+
+def register_user(user):
+    """Walks the client through the creation of a new account. Returns
+    a (name, status) pair, or None if the registration failed.
+    """
+    return create_account(user, *ask(user, REGISTRATION))
+
+
+def create_account(user, name, password, confirmation):
+    """Creates an account with the details the client gave. Returns a
+    (name, status) pair, or None if the registration failed.
+    """
+    name = name.lower()
+    if confirmation != password:
+        user.send("Passwords do not match.")
+        return None
+    if not ratelimit.allow("login", user.ip_address):
+        user.send(ratelimit.LOGINS)
+        return None
+    try:
+        status = user.database.create_user(name, password.encode())
+    except HashingBusy:
+        user.send(BUSY)
+        return None
+    if status:
+        user.send("Account successfully created: %s." % name)
+        return (name, status)
+    user.send("Account already exists, or could not be made.")
+
 
 # Theoretically, the return could be removed and tests would only need to be
 # tweaked a small bit to check for user.name and user.status rather than
@@ -11,45 +96,20 @@ def prompt(user):
     log into an existing account, create a new one, or choose to browse
     anonymously.
     """
-    user.send("=======================\r\nPLEASE SELECT AN OPTION\r\n========="
-              "==============\r\n[L]OGIN\t\tLogin to an existing account.\r\n"
-              "[R]EGISTER\tCreate a new account on this BBS."
-              "\r\n[A]NONYMOUS\tUse the BBS anonymously.\r\n"
-              "[Q]UIT\t\tExit the BBS.")
+    user.send(MENU)
     while True:
         user.send("--> ", end="")
         command = user.receive().lower()
         if command == "login" or command == "l":
-            user.send("USERNAME: ", end="")
-            name = user.receive().lower()
-            user.send("PASSWORD: ", end="")
-            password = user.receive().encode()
-            status, last_login = user.database.attempt_login(name, password)
-            if status and last_login:
-                user.send("Successfully logged in as %s." % name)
-                user.send("Last Login: %s." % time.ctime(last_login))
-                user.send("Posts since then: %d." %
-                          user.database.get_post_count(last_login))
-                user.send("You have %d new messages." %
-                          user.database.get_pm_count(name))
+            result = login_user(user)
+            if result:
+                name, status = result
                 break
-            else:
-                user.send("Invalid login credentials.")
         elif command == "register" or command == "r":
-            user.send("USERNAME: ", end="")
-            name = user.receive().lower()
-            user.send("PASSWORD: ", end="")
-            password = user.receive().encode()
-            user.send("CONFIRM PASSWORD: ", end="")
-            if user.receive().encode() != password:
-                user.send("Passwords do not match.")
-                continue
-            status = user.database.create_user(name, password)
-            if status:
-                user.send("Account successfully created: %s." % name)
+            result = register_user(user)
+            if result:
+                name, status = result
                 break
-            else:
-                user.send("Account already exists, or could not be made.")
         elif command == "anonymous" or command == "a":
             name = "Anonymous"
             status = "coward"
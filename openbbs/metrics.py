@@ -0,0 +1,141 @@
+"""Periodic export of the server's statistics to a file, either in the
+Prometheus text format or as JSON, so that they can be graphed without
+running a metrics service. A Prometheus file can be collected by, for
+example, node_exporter's textfile collector.
+
+Timings are exported as histograms of seconds, grouped by the first part
+of their names: "command.board" becomes openbbs_command_seconds with the
+label name="board".
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from openbbs import stats
+
+_exporter = None
+
+
+def _metric_name(name):
+    """Returns a statistic's name as a valid Prometheus metric name."""
+    return "openbbs_" + re.sub("[^a-zA-Z0-9_]", "_", name)
+
+
+def prometheus_text():
+    """Returns every statistic in the Prometheus text format."""
+    lines = ["%s %s" % (_metric_name(name), value)
+             for name, value in stats.snapshot()]
+    families = set()
+    for name, count, total, _, buckets in stats.timings():
+        family, _, label = name.partition(".")
+        metric = _metric_name(family) + "_seconds"
+        labels = 'name="%s",' % label if label else ""
+        if metric not in families:
+            families.add(metric)
+            lines.append("# TYPE %s histogram" % metric)
+        cumulative = 0
+        for bound, bucket in zip(stats.BOUNDS, buckets):
+            cumulative += bucket
+            lines.append('%s_bucket{%sle="%.10g"} %d' % (metric, labels, bound,
+                                                      cumulative))
+        lines.append('%s_bucket{%sle="+Inf"} %d' % (metric, labels, count))
+        labels = "{%s}" % labels.rstrip(",") if labels else ""
+        lines.append("%s_sum%s %r" % (metric, labels, total))
+        lines.append("%s_count%s %d" % (metric, labels, count))
+    return "\n".join(lines) + "\n"
+
+
+def json_text():
+    """Returns every statistic as a JSON document, with each timing
+    summarized in seconds.
+    """
+    timings = {}
+    for name, count, total, maximum, buckets in stats.timings():
+        timings[name] = {
+            "count": count,
+            "mean": total / count,
+            "p50": stats.percentile(buckets, maximum, 0.5),
+            "p95": stats.percentile(buckets, maximum, 0.95),
+            "p99": stats.percentile(buckets, maximum, 0.99),
+            "max": maximum
+        }
+    return json.dumps({"time": time.time(), "pid": os.getpid(),
+                       "values": dict(stats.snapshot()),
+                       "timings": timings}, indent=2, sort_keys=True)
+
+
+FORMATS = {"prometheus": prometheus_text, "json": json_text}
+
+
+def write(path, format_name):
+    """Writes every statistic to the given file in the given format. The
+    file is replaced whole, so readers never see half of it.
+    """
+    text = FORMATS[format_name]()
+    temporary = "%s.%d.tmp" % (path, os.getpid())
+    with open(temporary, "w") as output:
+        output.write(text)
+    os.rename(temporary, path)
+
+
+class Exporter(object):
+    """Thread which writes the statistics to a file at a fixed interval,
+    and once more when it is stopped.
+    """
+    def __init__(self, path, format_name, interval):
+        if format_name not in FORMATS:
+            raise ValueError("Unknown metrics format \"%s\"." % format_name)
+        self.path = path
+        self.format_name = format_name
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.export()
+
+    def export(self):
+        """Writes the statistics now, logging rather than raising if the
+        file cannot be written.
+        """
+        try:
+            write(self.path, self.format_name)
+        except (IOError, OSError) as error:
+            logging.warning("Could not write metrics to %s: %s", self.path,
+                            error)
+
+    def stop(self):
+        """Stops the thread, then writes the final statistics."""
+        self.stopped.set()
+        self.thread.join()
+        self.export()
+
+
+def start(config):
+    """Starts exporting the process's statistics as configured. Nothing
+    is exported if no metrics_file is set. Every worker process writes
+    its own file, named after its process ID.
+    """
+    global _exporter
+    path = config.get("metrics_file")
+    if not path:
+        return
+    if int(config.get("workers")) > 1:
+        path = "%s.%d" % (path, os.getpid())
+    _exporter = Exporter(path, config.get("metrics_format"),
+                         float(config.get("metrics_interval")))
+
+
+def stop():
+    """Stops exporting statistics, after writing them a last time."""
+    global _exporter
+    if _exporter is not None:
+        _exporter.stop()
+        _exporter = None
@@ -0,0 +1,133 @@
+"""In-process publish/subscribe hub, which pushes short notices of new
+posts and private messages to the sessions they concern, so that users
+need not poll for them.
+
+Every session has a Subscriber, following its user's inbox and the board
+or thread they are reading. Notices are queued per subscriber, and the
+session is woken to send them when it is waiting for input. Queues are
+bounded, so a session which is busy or not reading loses notices rather
+than holding memory. Only sessions in the same process are notified.
+"""
+
+import collections
+import threading
+
+from openbbs import stats
+from openbbs.formatters import iter_new_replies
+
+
+# A notice published to a topic. New replies carry the post itself, as
+# (post_id, time, name, subject, body), so that followers of its thread
+# can be shown it without a query.
+Notice = collections.namedtuple("Notice", ("topic", "text", "post"))
+
+
+def encode(notices, following=None):
+    """Encodes notices as lines set apart from the surrounding output.
+    New replies in the followed thread, if any, are shown in full.
+    """
+    chunks = []
+    for notice in notices:
+        if _in_full(notice, following):
+            chunks.append(b"\r\n")
+            chunks.extend(iter_new_replies([notice.post]))
+        else:
+            chunks.append(("\r\n* %s\r\n" % notice.text).encode())
+    return b"".join(chunks)
+
+
+def newest_post(notices, following=None):
+    """Returns the ID of the newest post that encode shows in full for
+    the given notices, or None if there is none, so that the session
+    can count it as seen.
+    """
+    shown = [notice.post[0] for notice in notices
+             if _in_full(notice, following)]
+    return max(shown) if shown else None
+
+
+def _in_full(notice, following):
+    return notice.post is not None and following is not None and \
+        notice.topic == ("thread", following)
+
+
+class Subscriber(object):
+    """A session's bounded queue of notices, and the topics it follows.
+    The wake function, if any, is called from the publishing thread
+    whenever a notice is queued.
+    """
+    def __init__(self, size, wake=None):
+        self.size = size
+        self.wake = wake
+        self.topics = frozenset()
+        self.notices = collections.deque()
+        self.lock = threading.Lock()
+
+    def push(self, notice):
+        """Queues a notice, or drops it if the queue is full."""
+        with self.lock:
+            if len(self.notices) >= self.size:
+                stats.increment("notifications.dropped")
+                return
+            self.notices.append(notice)
+        stats.increment("notifications.queued")
+        if self.wake is not None:
+            self.wake()
+
+    def pop_all(self):
+        """Removes and returns every queued notice, oldest first."""
+        with self.lock:
+            notices = list(self.notices)
+            self.notices.clear()
+        return notices
+
+
+class Hub(object):
+    """Map of topics to the subscribers following them."""
+    def __init__(self):
+        self.topics = {}
+        self.lock = threading.Lock()
+
+    def follow(self, subscriber, topics):
+        """Replaces the topics the given subscriber follows."""
+        topics = frozenset(topics)
+        with self.lock:
+            for topic in subscriber.topics - topics:
+                followers = self.topics[topic]
+                followers.discard(subscriber)
+                if not followers:
+                    del self.topics[topic]
+            for topic in topics - subscriber.topics:
+                self.topics.setdefault(topic, set()).add(subscriber)
+            subscriber.topics = topics
+
+    def publish(self, topic, text, origin=None, post=None):
+        """Queues a notice for every follower of the topic but origin,
+        the subscriber that caused it. Returns the number of followers
+        notified.
+        """
+        notice = Notice(topic, text, post)
+        with self.lock:
+            followers = [follower for follower in self.topics.get(topic, ())
+                         if follower is not origin]
+        for follower in followers:
+            follower.push(notice)
+        return len(followers)
+
+
+_hub = Hub()
+
+
+def follow(subscriber, topics):
+    """Makes the subscriber follow exactly the given topics."""
+    _hub.follow(subscriber, topics)
+
+
+def unfollow(subscriber):
+    """Stops the subscriber from following any topic."""
+    _hub.follow(subscriber, ())
+
+
+def publish(topic, text, origin=None, post=None):
+    """Notifies every follower of the topic but origin."""
+    return _hub.publish(topic, text, origin, post)
@@ -0,0 +1,109 @@
+"""Bounded pool of session threads for the threaded connection engine.
+Connections beyond the session limit wait in a short queue, or are
+turned away if the queue is full.
+"""
+
+import collections
+import logging
+import socket
+import threading
+
+from openbbs import stats
+
+
+class SessionPool(object):
+    """Runs the given handler for each submitted client on one of at
+    most max_sessions threads. Threads are created as they are needed
+    and reused afterwards.
+    """
+    def __init__(self, handler, config):
+        self.handler = handler
+        self.config = config
+        self.max_sessions = int(config.get("max_sessions"))
+        self.queue_size = int(config.get("queue_size"))
+
+        self.condition = threading.Condition()
+        self.waiting = collections.deque()
+        self.threads = 0
+        self.idle = 0
+        self.active = 0
+
+    def submit(self, client, ip_address):
+        """Hands a newly accepted client to the pool. Returns False if
+        the client was rejected.
+        """
+        with self.condition:
+            position = (self.active + len(self.waiting) + 1 -
+                        self.max_sessions)
+            if position > self.queue_size:
+                stats.increment("sessions.rejected")
+                logging.warning("Rejected %s, the server is full.",
+                                ip_address)
+                _notify(client, "The server is full, please try again later.")
+                client.close()
+                return False
+
+            self.waiting.append((client, ip_address))
+            if len(self.waiting) > self.idle and \
+               self.threads < self.max_sessions:
+                self._spawn_thread()
+            self.condition.notify()
+            self._update_stats()
+
+        if position > 0:
+            logging.info("Queued %s at position %d.", ip_address, position)
+            _notify(client, "The server is busy, you are #%d in line." %
+                    position)
+        return True
+
+    def _spawn_thread(self):
+        self.threads += 1
+        worker = threading.Thread(target=self._work, name="session idle")
+        worker.daemon = True
+        worker.start()
+
+    def _work(self):
+        while True:
+            with self.condition:
+                self.idle += 1
+                while not self.waiting:
+                    self.condition.wait()
+                self.idle -= 1
+                client, ip_address = self.waiting.popleft()
+                self.active += 1
+                self._update_stats()
+
+            # Shown in thread dumps.
+            thread = threading.current_thread()
+            thread.name = "session %s" % ip_address
+            try:
+                self.handler(client, ip_address, self.config)
+            except SystemExit:
+                # UserSession.close hangs up the thread with sys.exit.
+                pass
+            except Exception:
+                # The handler releases its session on the way out, but the
+                # error may have been raised before it had one.
+                logging.exception("Unhandled error in session for %s.",
+                                  ip_address)
+                client.close()
+            thread.name = "session idle"
+
+            with self.condition:
+                self.active -= 1
+                self._update_stats()
+
+    def _update_stats(self):
+        stats.set_value("sessions.active", self.active)
+        stats.set_value("sessions.queued", max(0, self.active +
+                                               len(self.waiting) -
+                                               self.max_sessions))
+        stats.set_value("sessions.threads", self.threads)
+
+
+def _notify(client, message):
+    """Sends a message directly to a client without a session."""
+    try:
+        client.send((message + "\r\n").encode())
+    except (OSError, socket.error):
+        pass
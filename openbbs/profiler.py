@@ -0,0 +1,161 @@
+"""On-demand profiling of a live server. For a bounded window, the stack
+of every thread is sampled at a fixed interval, and the samples are then
+written out as collapsed stacks, which flamegraph.pl and speedscope can
+draw, along with a summary of the most sampled functions.
+
+Samples of threads waiting for a client or for work are counted, but
+left out of both files, so that they show where the server is busy.
+Nothing runs unless a profile is taken, with the sysop "profile" command
+or by sending the process SIGUSR2.
+"""
+
+import collections
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+
+# Longest profile that can be asked for, in seconds.
+MAX_DURATION = 600
+
+# Innermost functions of threads blocked waiting for a client or for
+# work, as (file name, function name) pairs.
+IDLE = frozenset((
+    ("session.py", "receive"),
+    ("socket.py", "accept"),
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock")
+))
+
+_clock = getattr(time, "perf_counter", time.time)
+_lock = threading.Lock()
+_profiler = None
+
+
+def describe(code):
+    """Names a function as "name (file:line)"."""
+    return "%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename),
+                           code.co_firstlineno)
+
+
+class Profiler(object):
+    """Thread which samples the stacks of every other thread for the
+    given number of seconds, then writes the results to path with the
+    ".folded" and ".txt" extensions.
+    """
+    def __init__(self, duration, interval, path):
+        self.duration = duration
+        self.interval = interval
+        self.path = path
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.idle = 0
+        self.thread = threading.Thread(target=self._run, name="profiler")
+        self.thread.daemon = True
+
+    def _run(self):
+        global _profiler
+        try:
+            deadline = _clock() + self.duration
+            while _clock() < deadline:
+                self.sample()
+                time.sleep(self.interval)
+            self.write()
+            logging.info("Wrote profile to %s.folded.", self.path)
+        except (IOError, OSError) as error:
+            logging.warning("Could not write profile to %s: %s", self.path,
+                            error)
+        finally:
+            with _lock:
+                _profiler = None
+
+    def sample(self):
+        """Takes a single sample of every other thread's stack."""
+        own = threading.current_thread().ident
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            leaf = stack[0]
+            if (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE:
+                self.idle += 1
+            else:
+                self.stacks[tuple(stack)] += 1
+        self.samples += 1
+
+    def write(self):
+        """Writes the collapsed stacks and the summary."""
+        own = collections.Counter()
+        total = collections.Counter()
+        with open(self.path + ".folded", "w") as folded:
+            for stack, count in self.stacks.items():
+                folded.write("%s %d\n" % (";".join(
+                    describe(code) for code in reversed(stack)
+                ), count))
+                own[stack[0]] += count
+                for code in set(stack):
+                    total[code] += count
+
+        with open(self.path + ".txt", "w") as summary:
+            summary.write("%d samples over %gs, every %gms. %d busy and %d "
+                          "idle thread samples.\n" %
+                          (self.samples, self.duration, self.interval * 1000,
+                           sum(own.values()), self.idle))
+            for title, counts in (("SELF", own), ("TOTAL", total)):
+                summary.write("\n%8s  %s\n" % (title, "FUNCTION"))
+                for code, count in counts.most_common(40):
+                    summary.write("%8d  %s\n" % (count, describe(code)))
+
+
+def start(config, duration=None):
+    """Starts profiling every thread for the given number of seconds, or
+    for profile_duration. Returns the path that the results will be
+    written to, less its extension, or None if a profile is already
+    being taken.
+    """
+    global _profiler
+    if duration is None:
+        duration = float(config.get("profile_duration"))
+    duration = min(duration, MAX_DURATION)
+    with _lock:
+        if _profiler is not None:
+            return None
+        path = os.path.join(config.get("profile_directory"),
+                            "openbbs-%d-%s" % (os.getpid(),
+                                               time.strftime("%Y%m%d-%H%M%S")))
+        _profiler = Profiler(duration, float(config.get("profile_interval")),
+                             path)
+        _profiler.thread.start()
+    logging.info("Profiling for %g seconds.", duration)
+    return path
+
+
+def handle_signal(config):
+    """Profiles the process whenever it is sent SIGUSR2, if the platform
+    has it. Must be called from the main thread.
+    """
+    if hasattr(signal, "SIGUSR2"):
+        signal.signal(signal.SIGUSR2, lambda *_: start(config))
+
+
+def thread_dump():
+    """Returns the name and current stack of every thread, innermost
+    call last.
+    """
+    frames = sys._current_frames()
+    lines = []
+    for thread in sorted(threading.enumerate(), key=lambda thread:
+                         thread.name):
+        lines.append("Thread \"%s\" (%d):" % (thread.name, thread.ident))
+        frame = frames.get(thread.ident)
+        if frame is not None:
+            for entry in traceback.format_stack(frame):
+                lines.extend(entry.rstrip("\n").split("\n"))
+    return "\n".join(lines)
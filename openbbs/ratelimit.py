@@ -0,0 +1,128 @@
+"""Process-wide token-bucket rate limits. Each kind of action, such as
+connecting, logging in or running a command, has its own limiter, holding
+a bucket per address and per username. A bucket refills at a steady rate
+up to a burst size, and every action takes a token from it, so clients
+can act in short bursts but not keep up a flood.
+"""
+
+import threading
+import time
+
+from openbbs import stats
+
+# The kinds of limited action, each configured with <kind>_rate tokens per
+# second and a burst of <kind>_burst tokens. Listing and posting commands
+# cost a "listing" or "post" token on top of their "command" token.
+KINDS = ("connection", "login", "command", "listing", "post")
+
+CONNECTIONS = "You are connecting too often, please try again in a moment."
+LOGINS = "Too many login attempts, please try again in a moment."
+COMMANDS = "You are sending commands too quickly, please slow down."
+
+# Buckets are not pruned until a limiter holds at least this many.
+PRUNE_SIZE = 4096
+
+_limiters = {}
+
+
+class RateLimiter(object):
+    """Token buckets for any number of keys, sharing one rate and burst.
+    Buckets are stored as (tokens, updated) pairs, and full buckets are
+    dropped once there are many of them, as they are the same as new ones.
+    """
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.prune_size = PRUNE_SIZE
+        self.lock = threading.Lock()
+
+    def allow(self, keys, now=None):
+        """Takes a token from the bucket of each of the given keys. Returns
+        False, taking none, if any of them is empty.
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            levels = []
+            for key in keys:
+                tokens, updated = self.buckets.get(key, (self.burst, now))
+                tokens = min(self.burst,
+                             tokens + (now - updated) * self.rate)
+                if tokens < 1:
+                    break
+                levels.append((key, tokens))
+            else:
+                for key, tokens in levels:
+                    self.buckets[key] = (tokens - 1, now)
+                if len(self.buckets) > self.prune_size:
+                    self._prune(now)
+                return True
+        stats.increment("throttled.%s" % self.name)
+        return False
+
+    def refund(self, keys, now=None):
+        """Returns a token taken by allow to the bucket of each of the
+        given keys.
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            for key in keys:
+                tokens, updated = self.buckets.get(key, (self.burst, now))
+                self.buckets[key] = (min(self.burst, tokens + 1 +
+                                         (now - updated) * self.rate), now)
+
+    def _prune(self, now):
+        """Drops every bucket which has refilled completely."""
+        self.buckets = dict((key, (tokens, updated))
+                            for key, (tokens, updated) in self.buckets.items()
+                            if tokens + (now - updated) * self.rate <
+                            self.burst)
+        # Waits for twice as many buckets if few could be dropped.
+        self.prune_size = max(PRUNE_SIZE, len(self.buckets) * 2)
+
+
+def start(config):
+    """Creates the process's rate limiters according to the configuration.
+    Kinds of action with a rate of 0 are not limited.
+    """
+    limiters = {}
+    for kind in KINDS:
+        rate = float(config.get("%s_rate" % kind))
+        if rate > 0:
+            limiters[kind] = RateLimiter(kind, rate,
+                                         float(config.get("%s_burst" % kind)))
+    _limiters.clear()
+    _limiters.update(limiters)
+
+
+def stop():
+    """Discards the process's rate limiters."""
+    _limiters.clear()
+
+
+def allow(kind, ip_address, name=None):
+    """Returns whether the given address, and the given user if any, may
+    take an action of the given kind now. Actions are always allowed if
+    their kind is not limited.
+    """
+    limiter = _limiters.get(kind)
+    if limiter is None:
+        return True
+    return limiter.allow(_keys(ip_address, name))
+
+
+def refund(kind, ip_address, name=None):
+    """Gives back the token taken by an allowed action of the given kind,
+    for actions that did not go ahead after all.
+    """
+    limiter = _limiters.get(kind)
+    if limiter is not None:
+        limiter.refund(_keys(ip_address, name))
+
+
+def _keys(ip_address, name):
+    keys = [("ip", ip_address)]
+    if name:
+        keys.append(("name", name))
+    return keys
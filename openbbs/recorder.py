@@ -0,0 +1,98 @@
+"""Opt-in recording of every session's input, so that real traffic can be
+replayed against a test server with benchmarks/replay.py.
+
+Records are written as compact JSON arrays, one per line. A session's
+lines are timed in seconds from when it connected:
+
+    ["open",7,1700000000.25]
+    ["line",7,1.52,"board random"]
+    ["close",7,30.1]
+
+Passwords are never recorded, and are written as null instead. Anything
+else users type, including posts and private messages, is recorded.
+"""
+
+import itertools
+import json
+import os
+import threading
+import time
+
+_recorder = None
+
+
+class Recorder(object):
+    """Appends the records of every session in the process to a file."""
+    def __init__(self, path):
+        self.file = open(path, "a", buffering=1)
+        self.lock = threading.Lock()
+        self.numbers = itertools.count(1)
+
+    def write(self, record):
+        """Appends a single record."""
+        text = json.dumps(record, separators=(",", ":")) + "\n"
+        with self.lock:
+            if not self.file.closed:
+                self.file.write(text)
+
+    def session(self):
+        """Starts the recording of a new session."""
+        return Recording(self, next(self.numbers))
+
+    def close(self):
+        """Closes the file. Sessions still open are no longer recorded."""
+        with self.lock:
+            self.file.close()
+
+
+class Recording(object):
+    """The recording of a single session."""
+    def __init__(self, recorder, number):
+        self.recorder = recorder
+        self.number = number
+        self.started = time.time()
+        self.closed = False
+        recorder.write(["open", number, round(self.started, 3)])
+
+    def line(self, text):
+        """Records a line of input, or a secret one if text is None."""
+        self.recorder.write(["line", self.number,
+                             round(time.time() - self.started, 3), text])
+
+    def close(self):
+        """Records the end of the session, once."""
+        if not self.closed:
+            self.closed = True
+            self.recorder.write(["close", self.number,
+                                 round(time.time() - self.started, 3)])
+
+
+def start(config):
+    """Starts recording sessions if a record_file is configured. Every
+    worker process records to its own file, named after its process ID.
+    """
+    global _recorder
+    path = config.get("record_file")
+    if not path:
+        return
+    if int(config.get("workers")) > 1:
+        path = "%s.%d" % (path, os.getpid())
+    _recorder = Recorder(path)
+
+
+def stop():
+    """Stops recording sessions."""
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+        _recorder = None
+
+
+def session():
+    """Returns the Recording for a new session, or None if sessions are
+    not being recorded.
+    """
+    recorder = _recorder
+    if recorder is None:
+        return None
+    return recorder.session()
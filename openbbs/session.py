@@ -5,69 +5,226 @@ sessions for inbound connections.
 import logging
 import socket
 import sys
+import threading
+import time
 
+from openbbs import notifications, recorder, stats
 from openbbs.database import Database
 from openbbs.login import prompt
 from openbbs.shell import shell
+from openbbs.telnet import LineReader
+
+# Buffered output is sent once it reaches this many bytes, even if the
+# session has not yet asked for input.
+FLUSH_SIZE = 16384
 
 
 class UserSession(object):
     """Abstraction of Socket's client send/recv, encapsulates
     user-specific data such as the database instance and the user's
-    name.
+    name. Output is buffered until the session waits for input, so each
+    screen and its prompt go out together. Notices queued for the given
+    subscriber are sent while the session waits for input. Input is
+    recorded if sessions are being recorded.
     """
-    def __init__(self, client, database, ip_address):
+    def __init__(self, client, database, ip_address, output_timeout=None,
+                 max_line_length=4096, subscriber=None):
         self.client = client
         self.database = database
         self.ip_address = ip_address
+        self.input = LineReader(max_line_length)
+        self.output_timeout = output_timeout
+        self.output = []
+        self.output_size = 0
+        self.lock = threading.Lock()
+        self.waiting = False
+        self.subscriber = subscriber or notifications.Subscriber(0)
+        self.subscriber.wake = self.notify
+        self.recording = recorder.session()
+        self.closed = False
+        try:
+            # Writes are already coalesced, so Nagle would only delay them.
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except (OSError, socket.error):
+            pass
 
         self.name = ""
         self.status = ""
 
         self.current_board = "main"
         self.current_thread = None
+        self.thread_title = None
+        self.page = None
+        self.search = None
+        self.latest = None
+        self.following = None
 
     def send(self, message, end="\r\n"):
         """Friendlier wrapper for socket's client.send."""
+        self.write((message + end).encode())
+
+    def write(self, data):
+        """Buffers already encoded data, such as a cached screen."""
+        self.output.append(data)
+        self.output_size += len(data)
+        if self.output_size >= FLUSH_SIZE:
+            self.flush()
+
+    def stream(self, chunks, end="\r\n"):
+        """Sends a screen as it is generated, one encoded chunk at a
+        time, so that no more than FLUSH_SIZE bytes of it are held.
+        """
+        for chunk in chunks:
+            self.write(chunk)
+        self.write(end.encode())
+
+    def flush(self):
+        """Sends all buffered output. A client which has not accepted it
+        within output_timeout seconds has stopped reading, and is hung up
+        rather than left to hold the session forever.
+        """
+        if not self.output:
+            return
+        data = b"".join(self.output)
+        self.output = []
+        self.output_size = 0
         try:
-            self.client.send((message + end).encode())
+            with stats.timer("socket.send"):
+                self.client.settimeout(self.output_timeout)
+                self.client.sendall(data)
+                self.client.settimeout(None)
+            stats.increment("socket.bytes_sent", len(data))
+        except socket.timeout:
+            stats.increment("sessions.stalled")
+            logging.warning("%s stopped reading, hanging up.",
+                            self.ip_address)
+            self.close()
         except (OSError, socket.error):
-            logging.warning("Could not send \"%s\" to client.", message)
+            logging.warning("Could not send %d bytes to client.", len(data))
 
-    def receive(self):
-        """Friendlier wrapper for socket's client.recv."""
+    def receive(self, secret=False):
+        """Returns the client's next line of input. Lines that arrived
+        together are queued, and the socket is only read once they have
+        all been used. Time spent waiting for input is left out of the
+        timings of the command waiting for it. Secret lines, such as
+        passwords, are left out of the session's recording.
+        """
+        self.flush()
+        started = time.time()
+        while not self.input.lines:
+            with self.lock:
+                self.waiting = True
+            self.notify()
+            try:
+                data = self.client.recv(4096)
+            except (OSError, AttributeError):
+                logging.warning("Client connection has been interrupted.")
+                self.close()
+            finally:
+                with self.lock:
+                    self.waiting = False
+                stats.waited(time.time() - started)
+                started = time.time()
+            if not data:
+                line = self.input.finish()
+                if line is not None:
+                    return self._record(line.strip(), secret)
+                logging.info("%s has disconnected.", self.ip_address)
+                self.close()
+            stats.increment("socket.bytes_received", len(data))
+            replies = self.input.feed(data)
+            if replies:
+                self.write(replies)
+                self.flush()
+        return self._record(self.input.readline().strip(), secret)
+
+    def _record(self, line, secret):
+        if self.recording is not None:
+            self.recording.line(None if secret else line)
+        return line
+
+    def notify(self):
+        """Sends queued notices if the session is waiting for input, and
+        otherwise leaves them until it is. Called from publishing threads,
+        so the client is written to without blocking, and notices it is
+        not ready to accept are dropped.
+        """
+        with self.lock:
+            if not self.waiting:
+                return
+            notices = self.subscriber.pop_all()
+            if not notices:
+                return
+            data = notifications.encode(notices, self.following)
+            try:
+                sent = self.client.send(data, socket.MSG_DONTWAIT)
+            except (OSError, socket.error):
+                stats.increment("notifications.dropped", len(notices))
+                return
+            # Replies shown in full are not sent again on "refresh".
+            newest = notifications.newest_post(notices, self.following)
+            if newest is not None:
+                self.latest = max(self.latest or 0, newest)
+            if sent < len(data):
+                # Sent along with the session's next output.
+                self.output.append(data[sent:])
+                self.output_size += len(data) - sent
+
+    def release(self):
+        """Safe cleanup for all client and database instances owned by
+        the user's current thread. Only the first call has any effect.
+        """
+        if self.closed:
+            return
+        self.closed = True
         try:
-            return self.client.recv(1024).decode().strip()
-        except (OSError, UnicodeDecodeError, AttributeError):
-            logging.warning("Client connection has been interrupted.")
-            self.close()
+            notifications.unfollow(self.subscriber)
+            if self.recording is not None:
+                self.recording.close()
+            self.flush()
+        finally:
+            # Flushing hangs up a stalled client, unwinding through here.
+            self.client.close()
+            self.database.close()
+            logging.info("Connection to %s has been closed.",
+                         self.ip_address)
 
     def close(self):
-        """Safe cleanup for all client and database instances owned by
-        the user's current thread. Also hangs up the thread.
+        """Releases everything owned by the session, then hangs up the
+        thread.
         """
-        self.client.close()
-        self.database.close()
-        logging.info("Connection to %s has been closed.", self.ip_address)
+        self.release()
         sys.exit(0)
 
 
-def handle(client, ip_address, config):
+def handle(client, ip_address, config, pool=None):
     """Primary BBS functionality. Creates an environment for the current
     connection thread, then passes the client off to a shell instance.
+    The session's database connection is borrowed from the given
+    connection pool, if any.
     """
-    user = UserSession(client, Database(config), ip_address)
-
-    user.send(config.get("motd"))
-    user.send("There are currently %d posts." % user.database.get_post_count())
-    user.name, user.status = prompt(user)
+    subscriber = notifications.Subscriber(int(config.get("notice_queue_size")))
+    user = UserSession(client, Database(config, pool=pool, client=ip_address,
+                                        subscriber=subscriber),
+                       ip_address,
+                       float(config.get("output_timeout")) or None,
+                       int(config.get("max_line_length")), subscriber)
 
-    banned = user.database.check_banned(user.name, ip_address)
-    if banned:
-        user.send("%s Reason: %s" % (config.get("banned"), banned))
-        logging.info("%s attempted to login, but is banned.", user.name)
-    else:
-        logging.info("%s logged in as %s.", ip_address, user.name)
-        shell(user, config)
+    try:
+        user.send(config.get("motd"))
+        user.send("There are currently %d posts." %
+                  user.database.get_post_count())
+        user.name, user.status = prompt(user)
 
-    user.close()
+        banned = user.database.check_banned(user.name, ip_address)
+        if banned:
+            user.send("%s Reason: %s" % (config.get("banned"), banned))
+            logging.info("%s attempted to login, but is banned.", user.name)
+        else:
+            logging.info("%s logged in as %s.", ip_address, user.name)
+            shell(user, config)
+    finally:
+        # Returns the pooled connection and unfollows every topic even
+        # if a command failed, so that errors cannot leak either.
+        user.release()
+    sys.exit(0)
@@ -1,11 +1,60 @@
 """Interactive shell for communication between the client and BBS."""
 
+import ipaddress
 import logging
 
-from openbbs import __version__
-from openbbs.command import CommandInterpreter
-from openbbs.formatters import (box_boards, box_inbox, box_message,
-                                box_posts, box_thread)
+from openbbs import (__version__, bans, cache, notifications, profiler,
+                     ratelimit, stats)
+from openbbs.command import CommandInterpreter, interactive
+from openbbs.database import SearchUnavailable
+from openbbs.formatters import (box_boards, iter_inbox, iter_message,
+                                iter_new_posts, iter_new_replies, iter_posts,
+                                iter_results, iter_thread)
+
+
+_screens = {}
+
+# Commands which cost a token of another kind as well as a command token.
+EXPENSIVE_COMMANDS = {
+    "board": "listing", "b": "listing",
+    "thread": "listing", "t": "listing",
+    "refresh": "listing", "re": "listing",
+    "follow": "listing", "f": "listing",
+    "next": "listing", "n": "listing",
+    "prev": "listing", "pr": "listing",
+    "page": "listing", "pa": "listing",
+    "inbox": "listing", "i": "listing",
+    "search": "listing", "se": "listing",
+    "post": "post", "p": "post",
+    "send": "post", "s": "post"
+}
+
+
+def render_screens(config):
+    """Renders the screens which cannot change while the server is
+    running, so that sending one is a single write.
+    """
+    _screens.clear()
+    _screens["boards"] = encode(box_boards(config.get("boards").split(",")))
+    _screens["rules"] = encode(config.get("rules", ""))
+    for status in ("coward", "user", "sysop"):
+        _screens["help", status] = encode(help_text(status))
+
+
+def encode(message, end="\r\n"):
+    """Encodes a message the way UserSession.send would."""
+    return (message + end).encode()
+
+
+def send_screen(user, name, render):
+    """Sends a screen prepared by render_screens, or renders it with the
+    given function if it has not been prepared.
+    """
+    data = _screens.get(name)
+    if data is None:
+        user.send(render())
+    else:
+        user.write(data)
 
 
 def handle_bogus_input(user, parameters):
@@ -13,31 +62,48 @@ def handle_bogus_input(user, parameters):
     user.send("Unknown command: \"%s\"" % parameters[0])
 
 
+def help_text(status):
+    """Returns the list of commands available to users of the given
+    status.
+    """
+    text = ("==================\r\nAVAILABLE COMMANDS\r\n=================="
+            "\r\n[R]ULES\t\tPrint the rules of the BBS.\r\n"
+            "[B]OARD\t\tChange to a specified board.\r\n"
+            "[T]HREAD\tOpen a given thread number.\r\n"
+            "[RE]FRESH\tShow new posts, or all with \"refresh all\".\r\n"
+            "[F]OLLOW\tShow new replies to this thread as they are posted.\r\n"
+            "[N]EXT\t\tShow the next page of the listing.\r\n"
+            "[PR]EV\t\tShow the previous page of the listing.\r\n"
+            "[PA]GE\t\tShow the first page, or the page at a post ID.\r\n"
+            "[P]OST\t\tMake a post or reply.\r\n"
+            "[SE]ARCH\tSearch the posts of this board, or of every board.\r\n"
+            "[IN]FO\t\tPrint information about this BBS software.\r\n"
+            "[Q]UIT\t\tExit the BBS.")
+    if status != "coward":
+        text += ("\r\n[I]NBOX\t\tGet private messages.\r\n"
+                 "[M]ORE\t\tRead the full message.\r\n"
+                 "[S]END\t\tSend a private message.")
+    if status == "sysop":
+        text += ("\r\n[D]ELETE\tDelete a post\r\n"
+                 "[BA]N\t\tBan a username, address or CIDR range.\r\n"
+                 "[U]NBAN\t\tUnban a username, address or range.\r\n"
+                 "[O]P\t\tGive a user operator privileges.\r\n"
+                 "[DE]OP\t\tRevoke operator privileges from a user.\r\n"
+                 "[ST]ATS\t\tShow server load statistics and timings.\r\n"
+                 "[PROF]ILE\tProfile the server, for a number of seconds.\r\n"
+                 "[TH]READS\tShow what every server thread is doing.")
+    return text
+
+
 def send_help_text(user, _):
     """Sends the user a list of available commands."""
-    user.send("==================\r\nAVAILABLE COMMANDS\r\n=================="
-              "\r\n[R]ULES\t\tPrint the rules of the BBS.\r\n"
-              "[B]OARD\t\tChange to a specified board.\r\n"
-              "[T]HREAD\tOpen a given thread number.\r\n"
-              "[RE]FRESH\tRefresh the current listing.\r\n"
-              "[P]OST\t\tMake a post or reply.\r\n"
-              "[IN]FO\t\tPrint information about this BBS software.\r\n"
-              "[Q]UIT\t\tExit the BBS.")
-    if user.status != "coward":
-        user.send("[I]NBOX\t\tGet private messages.\r\n"
-                  "[M]ORE\t\tRead the full message.\r\n"
-                  "[S]END\t\tSend a private message.")
-    if user.status == "sysop":
-        user.send("[D]ELETE\tDelete a post\r\n"
-                  "[BA]N\t\tBan a username.\r\n"
-                  "[U]NBAN\t\tUnban a username.\r\n"
-                  "[O]P\t\tGive a user operator privileges.\r\n"
-                  "[DE]OP\t\tRevoke operator privileges from a user.")
+    status = user.status if user.status in ("coward", "sysop") else "user"
+    send_screen(user, ("help", status), lambda: help_text(status))
 
 
 def send_rules(user, _, config):
     """Sends the user the configuration-defined rules."""
-    user.send(config.get("rules", ""))
+    send_screen(user, "rules", lambda: config.get("rules", ""))
 
 
 def send_server_info(user, _):
@@ -46,27 +112,106 @@ def send_server_info(user, _):
               "General Public License Version 3+." % __version__)
 
 
-def change_board(user, parameters, boards):
+def send_listing(user, page_size=None, after=None, before=None):
+    """Sends the user a page of the current board or thread, following or
+    preceding the given post ID, and remembers which posts it spans.
+    Returns False if there were no posts to show. Rendered pages are
+    cached until their board next changes, or streamed to the user as
+    they are rendered if there is no cache.
+    """
+    if not cache.enabled():
+        posts = user.database.get_posts(user.current_board,
+                                        user.current_thread, limit=page_size,
+                                        after=after, before=before)
+        if not posts:
+            return False
+        if user.current_thread and user.thread_title is None:
+            user.thread_title = posts[0][3]
+        user.page = (posts[0][0], posts[-1][0])
+        user.latest = max(user.latest or 0, *user.page)
+        user.stream(render_listing(user, posts))
+        return True
+
+    key = (user.current_board, user.current_thread, page_size, after, before,
+           user.database.get_board_version(user.current_board))
+    entry = cache.get(key)
+    if entry is None:
+        posts = user.database.get_posts(user.current_board,
+                                        user.current_thread, limit=page_size,
+                                        after=after, before=before)
+        if posts:
+            entry = ((posts[0][0], posts[-1][0]), posts[0][3],
+                     b"".join(render_listing(user, posts)) + b"\r\n")
+        else:
+            entry = (None, None, b"")
+        cache.put(key, entry, len(entry[2]))
+
+    page, subject, data = entry
+    if page is None:
+        return False
+    if user.current_thread and user.thread_title is None:
+        user.thread_title = subject
+    user.page = page
+    user.latest = max(user.latest or 0, *page)
+    user.write(data)
+    return True
+
+
+def send_new_posts(user, page_size=None):
+    """Sends the user only the posts of their current board or thread
+    which are newer than any they have been sent, oldest first and up to
+    a page of them. Returns False if there were none.
+    """
+    posts = user.database.get_posts(user.current_board, user.current_thread,
+                                    limit=page_size, since=user.latest or 0)
+    if not posts:
+        return False
+    user.latest = max(post[0] for post in posts)
+    if user.current_thread:
+        user.stream(iter_new_replies(posts))
+    else:
+        user.stream(iter_new_posts(posts))
+    return True
+
+
+def render_listing(user, posts):
+    """Returns a generator of the given page of the user's current board
+    or thread.
+    """
+    if user.current_thread:
+        return iter_thread(posts, user.thread_title)
+    return iter_posts(posts)
+
+
+@interactive
+def change_board(user, parameters, boards, page_size=None):
     """Changes the user's current board, if valid."""
     if len(parameters) > 1:
         board = parameters[1]
     else:
         user.send("Leave empty to return to the overboard.\r\nBOARD: ", end="")
-        board = user.receive().lower()
+        board = (yield).lower()
 
     if board in (board.split(":")[0].lower() for board in boards):
-        user.send(box_posts(user.database.get_posts(board)))
-        user.send("Board successfully changed to \"%s\"." % board)
         user.current_board = board.lower()
+        user.current_thread = None
+        user.page = None
+        user.latest = None
+        send_listing(user, page_size)
+        user.send("Board successfully changed to \"%s\"." % board)
     elif board == "":
         user.current_board = "main"
-        user.send(box_boards(boards))
+        user.current_thread = None
+        user.page = None
+        user.latest = None
+        send_screen(user, "boards", lambda: box_boards(boards))
         user.send("Successfully returned to the overboard.")
     else:
         user.send("Board \"%s\" does not exist on this BBS." % board)
 
 
-def change_thread(user, parameters):
+@interactive
+def change_thread(user, parameters, page_size=None):
     """Changes the user's current thread, if valid."""
     if user.current_board == "main":
         user.send("There are no threads here.")
@@ -76,20 +221,23 @@ def change_thread(user, parameters):
         else:
             user.send("Leave empty to return to the thread listing.\r\nTHREAD "
                       "NUMBER: ", end="")
-            thread = user.receive()
+            thread = (yield)
 
         if thread == "":
             user.current_thread = None
-            user.send(box_posts(user.database.get_posts(user.current_board)))
+            user.page = None
+            user.latest = None
+            send_listing(user, page_size)
             user.send("Returned to the %s home." % user.current_board)
         else:
-            posts = user.database.get_posts(user.current_board, thread)
-            if posts:
-                user.current_thread = thread
-                user.send(box_thread(posts))
+            user.current_thread = thread
+            user.thread_title = None
+            user.latest = None
+            if send_listing(user, page_size):
                 user.send("Current thread changed to %s." % thread)
             else:
                 user.current_thread = None
+                user.page = None
                 user.send("Thread %s does not exist." % thread)
 
 
@@ -100,27 +248,29 @@ def get_inbox(user, _):
         if len(messages) == 0:
             user.send("Your inbox is empty.")
         else:
-            user.send(box_inbox(messages))
+            user.stream(iter_inbox(messages))
     else:
         user.send("You can't do that!")
 
 
+@interactive
 def get_more(user, parameters):
     if user.status != "coward":
         if len(parameters) > 1:
             message_id = parameters[1]
         else:
             user.send("MESSAGE ID: ", end="")
-            message_id = user.receive()
+            message_id = (yield)
         message = user.database.get_specific_pm(user.name, message_id)
         if message:
-            user.send(box_message(message))
+            user.stream(iter_message(message))
         else:
             user.send("Message does not exist, or does not belong to you.")
     else:
         user.send("You can't do that!")
 
 
+@interactive
 def make_post(user, _):
     """Makes a post in the database, if possible."""
     if user.current_board == "main":
@@ -128,33 +278,133 @@ def make_post(user, _):
     else:
         if user.current_thread:
             user.send("REPLY: ", end="")
-            body = user.receive()
+            body = (yield)
             user.database.make_post(user.name, None, body, user.current_board,
                                     reply=user.current_thread)
             user.send("Successfully posted.")
         else:
             user.send("SUBJECT: ", end="")
-            subject = user.receive()
+            subject = (yield)
             user.send("BODY: ", end="")
-            body = user.receive()
+            body = (yield)
             user.database.make_post(user.name, subject, body,
                                     user.current_board)
             user.send("Successfully posted.")
 
 
-def refresh_all(user, _, boards):
+def refresh_all(user, parameters, boards, page_size=None):
     """Gets the latest posts or threads, depending on where the user is
-    in the BBS.
+    in the BBS. Once a listing has been seen, only newer posts are sent,
+    unless the whole first page is asked for with "refresh all".
     """
-    if user.current_thread:
-        user.send(box_thread(user.database.get_posts(user.current_board,
-                                                     user.current_thread)))
-    elif user.current_board == "main":
-        user.send(box_boards(boards))
+    if user.current_board == "main":
+        send_screen(user, "boards", lambda: box_boards(boards))
+    elif user.latest is None or (parameters and len(parameters) > 1 and
+                                 parameters[1] == "all"):
+        user.page = None
+        send_listing(user, page_size)
+    elif not send_new_posts(user, page_size):
+        user.send("There are no new posts.")
+
+
+def follow_thread(user, _, page_size=None):
+    """Starts or stops following the current thread. While it is being
+    followed, new replies are sent to the user in full as they are
+    posted, instead of as notices.
+    """
+    if not user.current_thread:
+        user.send("You can only follow a thread.")
+    elif user.following == user.current_thread:
+        user.following = None
+        user.send("Stopped following thread %s." % user.current_thread)
+    else:
+        user.following = user.current_thread
+        send_new_posts(user, page_size)
+        user.send("Following thread %s, new replies will be shown as they "
+                  "are posted." % user.current_thread)
+
+
+def next_page(user, _, page_size=None):
+    """Sends the page of the current listing following the one the user
+    last saw.
+    """
+    if user.current_board == "main":
+        user.send("There are no posts here.")
+    elif not send_listing(user, page_size,
+                          after=user.page[1] if user.page else None):
+        user.send("There are no more posts.")
+
+
+def previous_page(user, _, page_size=None):
+    """Sends the page of the current listing preceding the one the user
+    last saw.
+    """
+    if user.current_board == "main":
+        user.send("There are no posts here.")
+    elif user.page is None or \
+            not send_listing(user, page_size, before=user.page[0]):
+        user.send("You are on the first page.")
+
+
+def jump_to_page(user, parameters, page_size=None):
+    """Sends the first page of the current listing, or the page starting
+    at a given post ID.
+    """
+    if user.current_board == "main":
+        user.send("There are no posts here.")
+    elif len(parameters) > 1:
+        try:
+            target = int(parameters[1])
+        except ValueError:
+            user.send("Invalid post number.")
+        else:
+            # Threads are listed oldest first and boards newest first.
+            after = target - 1 if user.current_thread else target + 1
+            if not send_listing(user, page_size, after=after):
+                user.send("There are no more posts.")
+    elif not send_listing(user, page_size):
+        user.send("There are no posts here.")
+
+
+@interactive
+def search_posts(user, parameters, page_size=None):
+    """Searches the posts of the current board, or of every board from the
+    overboard, and sends the user a page of the best matches. Searching
+    for nothing sends the next page of the last search.
+    """
+    if len(parameters) > 1:
+        terms = " ".join(parameters[1:])
+    else:
+        user.send("Leave empty for more results.\r\nSEARCH: ", end="")
+        terms = (yield).lower()
+
+    if terms.strip():
+        board = None if user.current_board == "main" else user.current_board
+        offset = 0
+    elif user.search is not None:
+        terms, board, offset = user.search
+    else:
+        user.send("There is no search to continue.")
+        return
+
+    try:
+        results = user.database.search_posts(terms, board, limit=page_size,
+                                             offset=offset)
+    except SearchUnavailable:
+        user.send("Search is not available on this BBS.")
+        return
+    if results:
+        user.search = (terms, board, offset + len(results))
+        user.stream(iter_results(results))
+    elif offset:
+        user.search = None
+        user.send("There are no more results.")
     else:
-        user.send(box_posts(user.database.get_posts(user.current_board)))
+        user.search = None
+        user.send("No posts matched \"%s\"." % terms)
 
 
+@interactive
 def send_message(user, parameters):
     """Sends a private message to a user, if possible."""
     if user.status != "coward":
@@ -162,12 +412,12 @@ def send_message(user, parameters):
             receiver = parameters[1].lower()
         else:
             user.send("RECEIVER: ", end="")
-            receiver = user.receive().lower()
+            receiver = (yield).lower()
         if len(parameters) > 2:
             message = parameters[2]
         else:
             user.send("MESSAGE: ", end="")
-            message = user.receive()
+            message = (yield)
         if user.database.send_pm(user.name, receiver, message):
             user.send("Message successfully sent.")
         else:
@@ -176,6 +426,7 @@ def send_message(user, parameters):
         user.send("You can't do that!")
 
 
+@interactive
 def delete_post(user, parameters):
     """Deletes a post if the user has that capability."""
     if user.status == "sysop":
@@ -188,7 +439,7 @@ def delete_post(user, parameters):
         else:
             user.send("POST ID: ", end="")
             try:
-                target = int(user.receive())
+                target = int((yield))
             except ValueError:
                 user.send("Invalid post number.")
                 target = None
@@ -199,39 +450,54 @@ def delete_post(user, parameters):
         user.send("You can't do that!")
 
 
+def ban_target(target):
+    """Returns the keyword arguments that ban or unban the given target,
+    which is either a username or an address or CIDR range.
+    """
+    try:
+        address = bans.as_text(target)
+        return {"ip_address": str(ipaddress.ip_network(address, strict=False))
+                if "/" in target else str(ipaddress.ip_address(address))}
+    except ValueError:
+        return {"name": target}
+
+
+@interactive
 def ban_user(user, parameters):
-    """Bans a user if the user has that capability."""
+    """Bans a user, address or range if the user has that capability."""
     if user.status == "sysop":
         if len(parameters) > 1:
             target = parameters[1]
         else:
             user.send("USER: ", end="")
-            target = user.receive()
+            target = (yield)
         if len(parameters) > 2:
             reason = parameters[2]
         else:
             user.send("REASON: ", end="")
-            reason = user.receive()
-        user.database.ban_user(reason, username=target)
+            reason = (yield)
+        user.database.ban_user(reason, **ban_target(target))
         user.send("User %s successfully banned." % target)
     else:
         user.send("You can't do that!")
 
 
+@interactive
 def unban_user(user, parameters):
-    """Unbans a user if the user has that capability."""
+    """Unbans a user, address or range if the user has that capability."""
     if user.status == "sysop":
         if len(parameters) > 1:
             target = parameters[1]
         else:
             user.send("USER: ", end="")
-            target = user.receive()
-        user.database.unban_user(username=target)
+            target = (yield)
+        user.database.unban_user(**ban_target(target))
         user.send("User %s successfully unbanned." % target)
     else:
         user.send("You can't do that!")
 
 
+@interactive
 def op_user(user, parameters):
     """Op's a user if the user has that capability."""
     if user.status == "sysop":
@@ -239,13 +505,14 @@ def op_user(user, parameters):
             target = parameters[1]
         else:
             user.send("USER: ", end="")
-            target = user.receive()
+            target = (yield)
         user.database.make_op(target)
         user.send("User %s successfully sysop'd." % target)
     else:
         user.send("You can't do that!")
 
 
+@interactive
 def deop_user(user, parameters):
     """Deop's a user if the user has that capability."""
     if user.status == "sysop":
@@ -253,47 +520,181 @@ def deop_user(user, parameters):
             target = parameters[1]
         else:
             user.send("USER: ", end="")
-            target = user.receive()
+            target = (yield)
         user.database.remove_op(target)
         user.send("User %s successfully deop'd." % target)
     else:
         user.send("You can't do that!")
 
 
-def shell(user, config):
-    """Handles basic commands from the currently connected client."""
+def stats_text(prefix=""):
+    """Returns the server's counters, followed by a table of its timings
+    in milliseconds, limited to those whose names start with prefix.
+    """
+    lines = ["%-32s %s" % (name, value) for name, value in stats.snapshot()
+             if name.startswith(prefix)]
+    timings = [timing for timing in stats.timings()
+               if timing[0].startswith(prefix)]
+    if timings:
+        if lines:
+            lines.append("")
+        lines.append("%-26s %7s %8s %8s %8s %8s %8s" %
+                     ("TIMING (MS)", "COUNT", "MEAN", "P50", "P95", "P99",
+                      "MAX"))
+        for name, count, total, maximum, buckets in timings:
+            lines.append("%-26s %7d %8.1f %8.1f %8.1f %8.1f %8.1f" % (
+                name[:26], count, total / count * 1000,
+                stats.percentile(buckets, maximum, 0.5) * 1000,
+                stats.percentile(buckets, maximum, 0.95) * 1000,
+                stats.percentile(buckets, maximum, 0.99) * 1000,
+                maximum * 1000
+            ))
+    return "\r\n".join(lines)
+
+
+def send_stats(user, parameters):
+    """Sends the user the server's statistics if they are a sysop,
+    optionally only those whose names start with the given prefix, such
+    as "command" or "query".
+    """
+    if user.status == "sysop":
+        prefix = parameters[1] if parameters and len(parameters) > 1 else ""
+        text = stats_text(prefix)
+        if text:
+            user.send(text)
+        else:
+            user.send("No statistics have been recorded.")
+    else:
+        user.send("You can't do that!")
+
+
+def profile_server(user, parameters, config):
+    """Profiles the server for the given number of seconds, or for the
+    configured profile_duration, if the user is a sysop.
+    """
+    if user.status == "sysop":
+        try:
+            duration = float(parameters[1]) if len(parameters) > 1 else None
+        except ValueError:
+            duration = 0
+        if duration is not None and not 0 < duration <= profiler.MAX_DURATION:
+            user.send("Profiles last up to %d seconds." %
+                      profiler.MAX_DURATION)
+            return
+        path = profiler.start(config, duration)
+        if path is None:
+            user.send("The server is already being profiled.")
+        else:
+            user.send("Profiling, the results will be written to %s.folded "
+                      "and %s.txt." % (path, path))
+    else:
+        user.send("You can't do that!")
+
+
+def send_thread_dump(user, _):
+    """Sends the user the current stack of every thread, if they are a
+    sysop.
+    """
+    if user.status == "sysop":
+        user.send(profiler.thread_dump().replace("\n", "\r\n"))
+    else:
+        user.send("You can't do that!")
+
+
+def check_rate(user, command):
+    """Returns whether the user may run the given command now, telling
+    them to slow down if not. Anonymous users share a name, so they are
+    only limited by address. A command refused for its listing or post
+    token does not cost a command token either.
+    """
+    name = None if user.status == "coward" else user.name
+    kind = EXPENSIVE_COMMANDS.get(command)
+    if ratelimit.allow("command", user.ip_address, name):
+        if kind is None or ratelimit.allow(kind, user.ip_address, name):
+            return True
+        ratelimit.refund("command", user.ip_address, name)
+    user.send(ratelimit.COMMANDS)
+    return False
+
+
+def create_interpreter(user, config):
+    """Builds the command interpreter for the given user's shell."""
     boards = config.get("boards").split(",")
+    page_size = int(config.get("page_size"))
 
-    command = ["DEFAULT", "NULL"]
     command_interpreter = CommandInterpreter(handle_bogus_input, (), (user,))
     command_interpreter.add(("help", "h"), send_help_text, ())
     command_interpreter.add(("rules", "r"), send_rules, (config,))
     command_interpreter.add(("info", "in"), send_server_info, ())
-    command_interpreter.add(("board", "b"), change_board, (boards,))
-    command_interpreter.add(("thread", "t"), change_thread, ())
+    command_interpreter.add(("board", "b"), change_board,
+                            (boards, page_size))
+    command_interpreter.add(("thread", "t"), change_thread, (page_size,))
     command_interpreter.add(("inbox", "i"), get_inbox, ())
     command_interpreter.add(("more", "m"), get_more, ())
-    command_interpreter.add(("refresh", "re"), refresh_all, (boards,))
+    command_interpreter.add(("follow", "f"), follow_thread, (page_size,))
+    command_interpreter.add(("refresh", "re"), refresh_all,
+                            (boards, page_size))
+    command_interpreter.add(("next", "n"), next_page, (page_size,))
+    command_interpreter.add(("prev", "pr"), previous_page, (page_size,))
+    command_interpreter.add(("page", "pa"), jump_to_page, (page_size,))
     command_interpreter.add(("post", "p"), make_post, ())
+    command_interpreter.add(("search", "se"), search_posts, (page_size,))
     command_interpreter.add(("send", "s"), send_message, ())
     command_interpreter.add(("delete", "d"), delete_post, ())
     command_interpreter.add(("ban", "ba"), ban_user, ())
     command_interpreter.add(("unban", "u"), unban_user, ())
     command_interpreter.add(("op", "o"), op_user, ())
     command_interpreter.add(("deop", "de"), deop_user, ())
+    command_interpreter.add(("stats", "st"), send_stats, ())
+    command_interpreter.add(("profile", "prof"), profile_server, (config,))
+    command_interpreter.add(("threads", "th"), send_thread_dump, ())
+    return command_interpreter
+
 
-    user.send(box_boards(boards))
+def send_greeting(user, config):
+    """Sends the board listing shown when a shell is first opened."""
+    send_screen(user, "boards",
+                lambda: box_boards(config.get("boards").split(",")))
     user.send("Enter \"[H]ELP\" to see available commands.")
 
+
+def follow_topics(user):
+    """Subscribes the user's session to notices of new messages in their
+    inbox, and of new posts where they are reading. Leaving a followed
+    thread stops following it.
+    """
+    if user.following != user.current_thread:
+        user.following = None
+    topics = []
+    if user.status != "coward":
+        topics.append(("inbox", user.name))
+    if user.current_thread:
+        topics.append(("thread", str(user.current_thread)))
+    elif user.current_board != "main":
+        topics.append(("board", user.current_board))
+    notifications.follow(user.subscriber, topics)
+
+
+def send_prompt(user, config):
+    """Sends the shell prompt for the user's current location."""
+    user.send("[%s@%s %s]$ " % (user.name, config.get("name"),
+                                user.current_board), end="")
+
+
+def shell(user, config):
+    """Handles basic commands from the currently connected client."""
+    command_interpreter = create_interpreter(user, config)
+    send_greeting(user, config)
+
     while True:
-        user.send("[%s@%s %s]$ " % (user.name, config.get("name"),
-                                    user.current_board), end="")
+        follow_topics(user)
+        send_prompt(user, config)
         command = user.receive().lower().split(" ")
         logging.info("\"%s\" command received from %s.", " ".join(command),
                      user.name)
         if command[0] == "quit" or command[0] == "q":
             break
-        else:
+        elif check_rate(user, command[0]):
             command_interpreter.call(command)
 
     user.send(config.get("quit"))
@@ -0,0 +1,155 @@
+"""Process-wide server statistics. Counters are cheap to update from any
+thread, and are shown to sysops through the "stats" shell command.
+
+Timings are kept as histograms with exponentially growing buckets, so
+that percentiles can be estimated in constant memory.
+"""
+
+import bisect
+import contextlib
+import functools
+import inspect
+import threading
+import time
+
+# Upper bounds of the timing buckets, in seconds, from 0.1ms to about 3.5
+# minutes. Slower timings fall into one last, unbounded bucket.
+BOUNDS = tuple(0.0001 * 2 ** power for power in range(22))
+
+_clock = getattr(time, "perf_counter", time.time)
+_lock = threading.Lock()
+_local = threading.local()
+_values = {}
+_timings = {}
+
+
+def increment(name, amount=1):
+    """Adds the given amount to the named counter."""
+    with _lock:
+        _values[name] = _values.get(name, 0) + amount
+
+
+def set_value(name, value):
+    """Sets the named gauge to the given value."""
+    with _lock:
+        _values[name] = value
+
+
+def record(name, seconds):
+    """Records a single timing for the named operation."""
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = _timings[name] = [0, 0.0, 0.0, [0] * (len(BOUNDS) + 1)]
+        timing[0] += 1
+        timing[1] += seconds
+        timing[2] = max(timing[2], seconds)
+        timing[3][bisect.bisect_left(BOUNDS, seconds)] += 1
+
+
+def waited(seconds):
+    """Records that the calling thread spent the given time waiting for a
+    client, which is left out of the timings it is taking.
+    """
+    _local.waited = getattr(_local, "waited", 0.0) + seconds
+
+
+@contextlib.contextmanager
+def timer(name):
+    """Records the time spent in a with block under the given name, less
+    any time spent waiting for a client.
+    """
+    waited_before = getattr(_local, "waited", 0.0)
+    started = _clock()
+    try:
+        yield
+    finally:
+        record(name, _clock() - started -
+               (getattr(_local, "waited", 0.0) - waited_before))
+
+
+def timed(name):
+    """Decorator which records the time spent in each call of a function
+    under the given name. For generator functions, only the time spent
+    producing items is recorded, not the time their consumer holds them.
+    """
+    def decorator(function):
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                generator = function(*args, **kwargs)
+                spent = 0.0
+                try:
+                    while True:
+                        started = _clock()
+                        try:
+                            item = next(generator)
+                        except StopIteration:
+                            return
+                        finally:
+                            spent += _clock() - started
+                        yield item
+                finally:
+                    record(name, spent)
+        else:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with timer(name):
+                    return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def percentile(buckets, maximum, fraction):
+    """Estimates the given fraction's percentile, in seconds, from a
+    timing's buckets and its maximum.
+    """
+    rank = fraction * sum(buckets)
+    seen = 0
+    for index, count in enumerate(buckets):
+        if count and seen + count >= rank:
+            lower = BOUNDS[index - 1] if index else 0.0
+            upper = BOUNDS[index] if index < len(BOUNDS) else maximum
+            return min(lower + (upper - lower) * (rank - seen) / count,
+                       maximum)
+        seen += count
+    return 0.0
+
+
+def get_timing(name):
+    """Returns the (count, total, maximum) of the named operation's
+    timings, in seconds.
+    """
+    with _lock:
+        return tuple(_timings.get(name, (0, 0.0, 0.0))[:3])
+
+
+def get(name):
+    """Returns the current value of the named counter or gauge."""
+    with _lock:
+        return _values.get(name, 0)
+
+
+def snapshot():
+    """Returns a sorted list of (name, value) pairs for every counter and
+    gauge that has been recorded.
+    """
+    with _lock:
+        return sorted(_values.items())
+
+
+def timings():
+    """Returns a sorted list of (name, count, total, maximum, buckets)
+    tuples for every timing that has been recorded.
+    """
+    with _lock:
+        return sorted((name, count, total, maximum, tuple(buckets))
+                      for name, (count, total, maximum, buckets)
+                      in _timings.items())
+
+
+def reset():
+    """Clears all statistics."""
+    with _lock:
+        _values.clear()
+        _timings.clear()
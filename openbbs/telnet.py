@@ -0,0 +1,125 @@
+"""Line-framed input for telnet clients. Bytes received from a client are
+stripped of telnet negotiation, decoded incrementally and split into
+lines, so that a line may arrive across several packets and several
+lines may arrive in one.
+"""
+
+import codecs
+import collections
+import re
+
+from openbbs import stats
+
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+
+# IAC as a byte string, as bytes are str on Python 2.
+_IAC_BYTE = bytes(bytearray((IAC,)))
+
+_DATA, _COMMAND, _OPTION, _SUBNEGOTIATION, _SUBNEGOTIATION_IAC = range(5)
+
+# Telnet ends lines with CR LF or CR NUL, but bare LF and CR are common.
+_LINE_END = re.compile("\r[\n\0]?|\n")
+
+
+class LineReader(object):
+    """Turns a client's raw input into a queue of lines. Every option the
+    client offers or asks for is refused, lines are cut short at
+    max_length characters and invalid UTF-8 is replaced rather than
+    fatal.
+    """
+    def __init__(self, max_length):
+        self.max_length = max_length
+        self.lines = collections.deque()
+        self.partial = ""
+        self.after_cr = False
+        self.state = _DATA
+        self.verb = None
+        self.decoder = codecs.getincrementaldecoder("utf-8")("replace")
+
+    def feed(self, data):
+        """Queues any lines completed by the given bytes. Returns the
+        bytes that should be sent back to answer telnet negotiation.
+        """
+        data, replies = self._strip_telnet(data)
+        text = self.decoder.decode(data)
+        if not text:
+            return replies
+        if self.after_cr and text[0] in ("\n", "\0"):
+            text = text[1:]
+        self.after_cr = False
+        if not text:
+            return replies
+
+        parts = _LINE_END.split(text)
+        self.partial = self._limit(self.partial + parts[0])
+        if len(parts) > 1:
+            self.lines.append(self.partial)
+            self.lines.extend(self._limit(line) for line in parts[1:-1])
+            self.partial = self._limit(parts[-1])
+            self.after_cr = text.endswith("\r")
+        return replies
+
+    def readline(self):
+        """Returns the oldest complete line, or None if there are none."""
+        if self.lines:
+            return self.lines.popleft()
+        return None
+
+    def finish(self):
+        """Returns the unterminated line left over once the client has
+        stopped sending, or None if there is none.
+        """
+        line = self.partial + self.decoder.decode(b"", True)
+        self.partial = ""
+        return line or None
+
+    def _limit(self, line):
+        if len(line) > self.max_length:
+            stats.increment("input.truncated")
+            return line[:self.max_length]
+        return line
+
+    def _strip_telnet(self, data):
+        """Removes negotiation from the given bytes, returning the
+        remaining data and the replies refusing any requested options.
+        """
+        if self.state == _DATA and _IAC_BYTE not in data:
+            return data, b""
+
+        output = bytearray()
+        replies = bytearray()
+        for byte in bytearray(data):
+            if self.state == _DATA:
+                if byte == IAC:
+                    self.state = _COMMAND
+                else:
+                    output.append(byte)
+            elif self.state == _COMMAND:
+                if byte == IAC:
+                    output.append(IAC)
+                    self.state = _DATA
+                elif byte in (WILL, WONT, DO, DONT):
+                    self.verb = byte
+                    self.state = _OPTION
+                elif byte == SB:
+                    self.state = _SUBNEGOTIATION
+                else:
+                    self.state = _DATA
+            elif self.state == _OPTION:
+                if self.verb == DO:
+                    replies.extend((IAC, WONT, byte))
+                elif self.verb == WILL:
+                    replies.extend((IAC, DONT, byte))
+                self.state = _DATA
+            elif self.state == _SUBNEGOTIATION:
+                if byte == IAC:
+                    self.state = _SUBNEGOTIATION_IAC
+            else:
+                self.state = _DATA if byte == SE else _SUBNEGOTIATION
+        return bytes(output), bytes(replies)
@@ -26,7 +26,8 @@ setup(
     download_url="https://github.com/TsarFox/openbbs",
     packages=["openbbs"],
     include_package_data=True,
-    install_requires=["python-daemon>=2.1.1"],
+    install_requires=["python-daemon>=2.1.1",
+                      "ipaddress>=1.0.16; python_version < '3.3'"],
     extras_require={},
     tests_require=["tox"],
     entry_points={"console_scripts": ["openbbs-server = openbbs.core:main"]},
@@ -47,6 +48,8 @@ setup(
         "Programming Language :: Python :: 3.3",
         "Programming Language :: Python :: 3.4",
         "Programming Language :: Python :: 3.5",
+        "Programming Language :: Python :: 3.6",
+        "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: Implementation :: Jython",
         "Programming Language :: Python :: Implementation :: PyPy",
         "Topic :: Communications :: BBS",
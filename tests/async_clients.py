@@ -0,0 +1,111 @@
+"""Scripted clients of the asyncio engine. Kept apart from test_aio, as
+they cannot even be compiled before Python 3.5, and the engine itself
+requires Python 3.7.
+"""
+
+import asyncio
+import concurrent.futures
+import socket
+
+from openbbs.aio import AsyncUserSession, handle
+from openbbs.database import ConnectionPool
+
+
+def run_client(config, messages, admission=None, keep_open=False):
+    """Serves a single scripted client and returns everything it was
+    sent before the connection was closed. Unless keep_open is set, the
+    client stops sending once its messages are written.
+    """
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+    pool = ConnectionPool(config, 2)
+
+    async def scenario():
+        server = await asyncio.start_server(
+            lambda reader, writer: handle(reader, writer, config, executor,
+                                          pool, admission),
+            "127.0.0.1", 0
+        )
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(messages)
+        if not keep_open:
+            writer.write_eof()
+        received = await asyncio.wait_for(reader.read(), 10)
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return received
+
+    try:
+        return asyncio.run(scenario()).decode()
+    finally:
+        executor.shutdown()
+        pool.close()
+
+
+def run_beside_idle_clients(config, messages, idle):
+    """Serves a scripted client from a two thread executor, while the
+    given number of other clients sit idle at a prompt, and returns
+    everything the scripted client was sent.
+    """
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+    pool = ConnectionPool(config, 2)
+
+    async def scenario():
+        server = await asyncio.start_server(
+            lambda reader, writer: handle(reader, writer, config, executor,
+                                          pool),
+            "127.0.0.1", 0
+        )
+        port = server.sockets[0].getsockname()[1]
+        idlers = []
+        for _ in range(idle):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"l\r\n")
+            await reader.readuntil(b"USERNAME: ")
+            idlers.append(writer)
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(messages)
+        writer.write_eof()
+        received = await asyncio.wait_for(reader.read(), 10)
+        for idler in idlers + [writer]:
+            idler.close()
+        server.close()
+        await server.wait_closed()
+        return received
+
+    try:
+        return asyncio.run(scenario()).decode()
+    finally:
+        executor.shutdown()
+        pool.close()
+
+
+def accepted_no_delay(config):
+    """Accepts a connection on a socket bound the way core.bind_server
+    binds one, without a protocol, and returns the TCP_NODELAY option of
+    the accepted socket once a session has been made for it.
+    """
+    options = []
+
+    def accept(reader, writer):
+        AsyncUserSession(reader, writer, "", config, None, None)
+        options.append(writer.get_extra_info("socket").getsockopt(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY
+        ))
+        writer.close()
+
+    async def scenario():
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(("127.0.0.1", 0))
+        server = await asyncio.start_server(accept, sock=listener)
+        reader, writer = await asyncio.open_connection(
+            *listener.getsockname()
+        )
+        await asyncio.wait_for(reader.read(), 10)
+        writer.close()
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(scenario())
+    return options[0]
@@ -1,5 +1,9 @@
 """Shared dummy objects for unittests."""
 
+from openbbs.database import SearchUnavailable
+from openbbs.notifications import Subscriber
+from openbbs.hashing import HashingBusy
+
 
 class DummyUser(object):
     def __init__(self, *args):
@@ -7,15 +11,28 @@ class DummyUser(object):
         self.messages = args
         self.database = DummyDatabase()
         self.name = "DummyUser"
+        self.ip_address = "127.0.0.1"
         self.status = "sysop"
         self.current_board = "main"
         self.current_thread = None
+        self.thread_title = None
+        self.page = None
+        self.search = None
+        self.latest = None
+        self.following = None
+        self.subscriber = Subscriber(16)
         self.last_message = ""
 
     def send(self, message, end="\r\n"):
         self.last_message = message + end
 
-    def receive(self, *args):
+    def write(self, data):
+        self.last_message = data.decode()
+
+    def stream(self, chunks, end="\r\n"):
+        self.last_message = b"".join(chunks).decode() + end
+
+    def receive(self, *args, **kwargs):
         self.counter += 1
         return self.messages[self.counter]
 
@@ -32,8 +49,19 @@ class DummyClient(object):
     def send(self, *args, **kwargs):
         pass
 
+    def sendall(self, *args, **kwargs):
+        pass
+
+    def settimeout(self, *args):
+        pass
+
+    def setsockopt(self, *args):
+        pass
+
     def recv(self, *args):
         self.counter += 1
+        if self.counter >= len(self.messages):
+            return b""
         return self.messages[self.counter]
 
     def close(self):
@@ -49,11 +77,17 @@ class DummyDatabase(object):
         return status
 
     def attempt_login(self, name, password):
+        return self.authenticate(name, password)[:2]
+
+    def authenticate(self, name, password):
+        if name == "busy":
+            raise HashingBusy()
         if name == "a" and password.decode() == "a":
-            status = "user"
-        else:
-            status = None
-        return (status, 1)
+            return ("user", 1, 1, 1)
+        return (None, None, None, None)
+
+    def get_board_version(self, board):
+        return 0
 
     def get_post_count(self, time=None):
         return 1
@@ -61,9 +95,12 @@ class DummyDatabase(object):
     def get_pm_count(self, *args):
         return 1
 
-    def get_posts(self, board, thread=None):
-        if thread == "2":
+    def get_posts(self, board, thread=None, limit=None, after=None,
+                  before=None, since=None):
+        if thread == "2" or after == 1 or before == 1:
             posts = None
+        elif since is not None:
+            posts = ((2, 2, "b", "b", "b"),) if since < 2 else ()
         else:
             posts = ((1, 1, "a", "a", "a"),)
         return posts
@@ -71,6 +108,14 @@ class DummyDatabase(object):
     def make_post(self, *args, **kwargs):
         pass
 
+    def search_posts(self, terms, board=None, limit=None, offset=0):
+        self.searched = (terms, board, limit, offset)
+        if terms == "unavailable":
+            raise SearchUnavailable()
+        if terms != "gentoo" or offset:
+            return []
+        return [(1, "technology", "a", "Install Gentoo")]
+
     def send_pm(self, sender, receiver, message):
         if receiver == "meme2":
             sent = False
@@ -81,11 +126,11 @@ class DummyDatabase(object):
     def delete_post(self, target):
         pass
 
-    def ban_user(self, reason, username=None):
-        pass
+    def ban_user(self, reason, name=None, ip_address=None):
+        self.banned = (name, ip_address)
 
-    def unban_user(self, username):
-        pass
+    def unban_user(self, name=None, ip_address=None):
+        self.unbanned = (name, ip_address)
 
     def get_pms(self, name):
         if name == "DummyUserEmpty":
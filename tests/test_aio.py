@@ -0,0 +1,128 @@
+import logging
+import os
+import sys
+import tempfile
+import unittest
+
+from openbbs import stats
+from openbbs.config import load_config
+from openbbs.database import initialize_database
+from tests.dummy_objects import DummyUser
+
+# The asyncio engine requires Python 3.7.
+ASYNCIO = sys.version_info >= (3, 7)
+if ASYNCIO:
+    import asyncio
+    from openbbs.aio import Admission
+    from tests.async_clients import (accepted_no_delay, run_client,
+                                     run_beside_idle_clients)
+
+logging.disable(logging.CRITICAL)
+
+
+@unittest.skipUnless(ASYNCIO, "The asyncio engine requires Python 3.7.")
+class AsyncSessionTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.config = dict(load_config("inexistent.ini"))
+        self.config["database"] = os.path.join(self.directory, "test.db")
+        initialize_database(self.config)
+
+    def tearDown(self):
+        if os.path.exists(self.config["database"]):
+            os.remove(self.config["database"])
+        os.rmdir(self.directory)
+
+    def test_anonymous_session(self):
+        received = run_client(self.config, b"anonymous\r\nhelp\r\nquit\r\n")
+        self.assertIn(self.config["motd"], received)
+        self.assertIn("There are currently 0 posts.", received)
+        self.assertIn("AVAILABLE COMMANDS", received)
+        self.assertTrue(received.endswith(self.config["quit"] + "\r\n"))
+
+    def test_quit_from_login(self):
+        received = run_client(self.config, b"bogus\r\nquit\r\n")
+        self.assertIn("Invalid command \"bogus\".", received)
+        self.assertNotIn(self.config["quit"], received)
+
+    def test_command_prompts(self):
+        received = run_client(self.config, b"a\r\nboard\r\nrandom\r\n"
+                                           b"post\r\nHi\r\nThere\r\nq\r\n")
+        self.assertIn("Board successfully changed to \"random\".", received)
+        self.assertIn("Successfully posted.", received)
+
+    def test_login_and_register(self):
+        received = run_client(self.config, b"r\r\nfoo\r\nbar\r\nbar\r\n"
+                                           b"q\r\n")
+        self.assertIn("Account successfully created: foo.", received)
+        received = run_client(self.config, b"l\r\nFoo\r\nbar\r\nq\r\n")
+        self.assertIn("Successfully logged in as foo.", received)
+
+    def test_idle_prompts_hold_no_threads(self):
+        received = run_beside_idle_clients(
+            self.config, b"a\r\nb\r\nrandom\r\npost\r\nHi\r\nThere\r\n"
+                         b"q\r\n", 3
+        )
+        self.assertIn("There are currently 0 posts.", received)
+        self.assertIn("Successfully posted.", received)
+
+    def test_input_timeout(self):
+        self.config["input_timeout"] = 0.1
+        received = run_client(self.config, b"a\r\nb\r\nrandom\r\npost\r\n",
+                              keep_open=True)
+        self.assertTrue(received.endswith("SUBJECT: "))
+
+    def test_disconnect_mid_command(self):
+        received = run_client(self.config, b"a\r\nb\r\nrandom\r\npost\r\n")
+        self.assertTrue(received.endswith("SUBJECT: "))
+
+    def test_reject_when_full(self):
+        self.config["max_sessions"] = 0
+        self.config["queue_size"] = 0
+        received = run_client(self.config, b"", Admission(self.config))
+        self.assertEqual(received,
+                         "The server is full, please try again later.\r\n")
+
+    def test_release_skips_cancelled_waiters(self):
+        self.config["max_sessions"] = 1
+        admission = Admission(self.config)
+        loop = asyncio.new_event_loop()
+        try:
+            users = [DummyUser() for _ in range(4)]
+            for user in users:
+                user.loop = loop
+            tasks = [loop.create_task(admission.acquire(user))
+                     for user in users[:3]]
+            loop.run_until_complete(asyncio.sleep(0))
+            self.assertEqual(len(admission.waiting), 2)
+            admission.waiting[0].cancel()
+            admission.release()
+            loop.run_until_complete(asyncio.gather(*tasks,
+                                                   return_exceptions=True))
+            self.assertTrue(tasks[1].cancelled())
+            self.assertIsNone(tasks[2].result())
+            self.assertEqual((admission.active, len(admission.waiting)),
+                             (1, 0))
+
+            waiting = loop.create_task(admission.acquire(users[3]))
+            loop.run_until_complete(asyncio.sleep(0))
+            admission.waiting[0].cancel()
+            admission.release()
+            loop.run_until_complete(asyncio.gather(waiting,
+                                                   return_exceptions=True))
+            self.assertEqual((admission.active, len(admission.waiting)),
+                             (0, 0))
+        finally:
+            loop.close()
+
+    def test_drop_stalled_client(self):
+        stats.reset()
+        self.config["output_limit"] = -1
+        try:
+            run_client(self.config, b"anonymous\r\nquit\r\n")
+        except ConnectionResetError:
+            pass
+        self.assertEqual(stats.get("sessions.stalled"), 1)
+
+    def test_no_delay(self):
+        self.assertTrue(accepted_no_delay(self.config))
@@ -0,0 +1,79 @@
+import os
+import socket
+import tempfile
+import unittest
+
+from openbbs import bans, stats
+from openbbs.bans import BanRegistry
+from openbbs.config import load_config
+from openbbs.core import refuse_banned
+from openbbs.database import Database, connect
+
+
+class BanRegistryTest(unittest.TestCase):
+    def setUp(self):
+        stats.reset()
+        self.directory = tempfile.mkdtemp()
+        self.config = dict(load_config("inexistent.ini"))
+        self.config["database"] = os.path.join(self.directory, "test.db")
+        self.database = Database(self.config)
+
+    def tearDown(self):
+        bans.stop()
+        self.database.close()
+        os.remove(self.config["database"])
+        os.rmdir(self.directory)
+
+    def test_registry(self):
+        self.database.ban_user("Spam.", name="jakob")
+        self.database.ban_user("Proxy.", ip_address="10.0.0.1")
+        self.database.ban_user("Range.", ip_address="192.168.0.0/16")
+        self.database.ban_user("Range.", ip_address="2001:db8::/32")
+        registry = BanRegistry()
+        registry.update(self.database.cursor)
+        self.assertEqual(registry.check("jakob", "127.0.0.1"), "Spam.")
+        self.assertEqual(registry.check("a", "10.0.0.1"), "Proxy.")
+        self.assertIsNone(registry.check("a", "10.0.0.2"))
+        self.assertEqual(registry.check(ip_address="192.168.4.20"), "Range.")
+        self.assertEqual(registry.check(ip_address="::ffff:192.168.4.20"),
+                         "Range.")
+        self.assertEqual(registry.check(ip_address="2001:db8::1"), "Range.")
+        self.assertIsNone(registry.check(ip_address="192.169.0.1"))
+        self.assertIsNone(registry.check(ip_address="bogus"))
+
+    def test_reload_on_change(self):
+        registry = BanRegistry()
+        registry.update(self.database.cursor)
+        version = registry.version
+        registry.update(self.database.cursor)
+        self.assertEqual(registry.version, version)
+        self.database.ban_user("Range.", ip_address="10.0.0.0/8")
+        registry.update(self.database.cursor)
+        self.assertEqual(registry.check(ip_address="10.2.3.4"), "Range.")
+        self.database.unban_user(ip_address="10.0.0.0/8")
+        registry.update(self.database.cursor)
+        self.assertIsNone(registry.check(ip_address="10.2.3.4"))
+
+    def test_process_registry(self):
+        self.assertIsNone(bans.check_address("10.0.0.1"))
+        bans.start(connect(self.config, check_same_thread=False))
+        self.database.ban_user("Proxy.", ip_address="10.0.0.1")
+        self.assertEqual(bans.check_address("10.0.0.1"), "Proxy.")
+        self.assertEqual(self.database.check_banned("", "10.0.0.1"), "Proxy.")
+        self.assertEqual(stats.get("sessions.banned"), 1)
+        # Bans made by other processes are noticed once the interval passes.
+        other = connect(self.config)
+        other.execute("INSERT INTO bans (ip, reason) VALUES ('10.0.0.2', "
+                      "'Other.');")
+        other.commit()
+        other.close()
+        bans._refreshed -= bans.REFRESH_INTERVAL
+        self.assertEqual(bans.check_address("10.0.0.2"), "Other.")
+
+    def test_refuse_banned(self):
+        client, peer = socket.socketpair()
+        refuse_banned(client, "10.0.0.1", "Proxy.", self.config)
+        self.assertEqual(peer.recv(1024).decode(),
+                         "%s Reason: Proxy.\r\n" % self.config["banned"])
+        self.assertEqual(peer.recv(1024), b"")
+        peer.close()
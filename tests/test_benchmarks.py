@@ -0,0 +1,50 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from openbbs.config import load_config
+from openbbs.database import Database
+
+# The benchmarks measure memory with tracemalloc, new in Python 3.4.
+BENCHMARKS = sys.version_info >= (3, 4)
+if BENCHMARKS:
+    from benchmarks import micro
+    from benchmarks.queries import explain, seed
+
+
+@unittest.skipUnless(BENCHMARKS, "The benchmarks require Python 3.4.")
+class MicroBenchmarkTest(unittest.TestCase):
+    def test_run_every_benchmark(self):
+        results = dict(micro.run([20], 0, None, 1))
+        self.assertEqual(sorted(results), [
+            "attempt_login/20", "box_inbox/20", "box_posts/20",
+            "box_thread/20", "check_banned/20", "get_pms/20",
+            "get_posts(board)/20", "get_posts(thread)/20", "make_post/20",
+            "scrub_input/20"
+        ])
+        for result in results.values():
+            self.assertGreaterEqual(result["calls"], 5)
+
+
+@unittest.skipUnless(BENCHMARKS, "The benchmarks require Python 3.4.")
+class QueryBenchmarkTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        config = dict(load_config("inexistent.ini"))
+        config["database"] = os.path.join(self.directory, "benchmark.db")
+        self.database = Database(config)
+        seed(self.database, 20, 10, 20, 2)
+
+    def tearDown(self):
+        self.database.close()
+        shutil.rmtree(self.directory)
+
+    def test_explain_queries_run(self):
+        plan = explain(self.database, self.database.get_pm_count, ("user1",))
+        self.assertIn("unread", plan)
+        self.assertNotIn("pms", plan)
+        plan = explain(self.database, self.database.get_posts, ("random", 1))
+        self.assertIn("posts_reply", plan)
+        self.assertNotIn("posts_board", plan)
@@ -0,0 +1,51 @@
+import unittest
+
+from openbbs import cache, stats
+from openbbs.cache import RenderCache
+
+
+class RenderCacheTest(unittest.TestCase):
+    def setUp(self):
+        stats.reset()
+
+    def test_get_and_put(self):
+        render_cache = RenderCache(100)
+        self.assertIsNone(render_cache.get("a"))
+        render_cache.put("a", b"screen", 6)
+        self.assertEqual(render_cache.get("a"), b"screen")
+        self.assertEqual(stats.get("cache.hits"), 1)
+        self.assertEqual(stats.get("cache.misses"), 1)
+
+    def test_least_recently_used_eviction(self):
+        render_cache = RenderCache(10)
+        render_cache.put("a", b"aaaa", 4)
+        render_cache.put("b", b"bbbb", 4)
+        render_cache.get("a")
+        render_cache.put("c", b"cccc", 4)
+        self.assertEqual(render_cache.get("a"), b"aaaa")
+        self.assertIsNone(render_cache.get("b"))
+        self.assertEqual(render_cache.size, 8)
+        self.assertEqual(stats.get("cache.evictions"), 1)
+
+    def test_oversized_values_are_not_cached(self):
+        render_cache = RenderCache(10)
+        render_cache.put("a", b"a" * 11, 11)
+        self.assertIsNone(render_cache.get("a"))
+        self.assertEqual(render_cache.size, 0)
+
+    def test_replace_value(self):
+        render_cache = RenderCache(10)
+        render_cache.put("a", b"aaaa", 4)
+        render_cache.put("a", b"aa", 2)
+        self.assertEqual(render_cache.size, 2)
+
+    def test_module_cache(self):
+        cache.put("a", b"a", 1)
+        self.assertIsNone(cache.get("a"))
+        cache.start({"cache_size": 10})
+        try:
+            cache.put("a", b"a", 1)
+            self.assertEqual(cache.get("a"), b"a")
+        finally:
+            cache.stop()
+        self.assertIsNone(cache.get("a"))
@@ -1,6 +1,7 @@
 import unittest
 
-from openbbs.command import CommandInterpreter
+from openbbs.command import CommandInterpreter, interactive
+from tests.dummy_objects import DummyUser
 
 
 class CommandInterpereterTest(unittest.TestCase):
@@ -18,6 +19,29 @@ class CommandInterpereterTest(unittest.TestCase):
         command_interpreter.add(("a",), lambda x, _: x, ())
         self.assertEqual(command_interpreter.call(("a",)), "f")
 
+    def test_lookup(self):
+        command_interpreter = CommandInterpreter(lambda x, _: None, (), ("f",))
+        function = lambda x, _, y: y
+        command_interpreter.add(("a", "b"), function, ("Foo!",))
+        self.assertEqual(command_interpreter.lookup(("b",)),
+                         (function, ("f", ("b",), "Foo!"), "command.a"))
+
+    def test_interactive(self):
+        @interactive
+        def echo(user, _):
+            user.send("ECHO: ", end="")
+            user.send((yield))
+
+        dummy_user = DummyUser("Foo!")
+        command_interpreter = CommandInterpreter(lambda _: None, (),
+                                                 (dummy_user,))
+        command_interpreter.add(("echo",), echo, ())
+        command_interpreter.call(("echo",))
+        self.assertEqual(dummy_user.last_message, "Foo!\r\n")
+        steps = echo.steps(dummy_user, ("echo",))
+        next(steps)
+        self.assertEqual(dummy_user.last_message, "ECHO: ")
+
     def test_throw_type_errors(self):
         command_interpreter = CommandInterpreter(lambda _: None, (), ())
         with self.assertRaises(TypeError):
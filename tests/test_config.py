@@ -1,7 +1,7 @@
 import os
 import unittest
 
-from openbbs.config import load_config
+from openbbs.config import get_boolean, load_config
 
 
 class ConfigurationCreationTest(unittest.TestCase):
@@ -15,3 +15,9 @@ class ConfigurationCreationTest(unittest.TestCase):
         config = load_config("temporary.ini")
         self.assertEqual(config.get("host"), "192.168.1.12")
         os.remove("temporary.ini")
+
+    def test_get_boolean(self):
+        self.assertTrue(get_boolean({"a": "Yes"}, "a"))
+        self.assertTrue(get_boolean({"a": True}, "a"))
+        self.assertFalse(get_boolean({"a": "off"}, "a"))
+        self.assertFalse(get_boolean({}, "a"))
@@ -5,7 +5,7 @@ import time
 import unittest
 
 from openbbs.config import load_config
-from openbbs.core import spawn_server
+from openbbs.core import bind_server, spawn_server
 
 logging.disable(logging.CRITICAL)
 
@@ -34,3 +34,14 @@ class ServerSpawnTest(unittest.TestCase):
         config["host"] = "999.999.999.999"
         with self.assertRaises(SystemExit):
             spawn_server(config, True)
+
+    def test_bind_with_reuse_port(self):
+        config = dict(load_config("inexistent.conf"))
+        config["host"] = "127.0.0.1"
+        config["port"] = 0
+        first = bind_server(config, reuse_port=True)
+        config["port"] = first.getsockname()[1]
+        second = bind_server(config, reuse_port=True)
+        self.assertEqual(first.getsockname(), second.getsockname())
+        first.close()
+        second.close()
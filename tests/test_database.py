@@ -1,9 +1,15 @@
+import hashlib
 import os
+import sqlite3
+import threading
 import time
 import unittest
 
+from openbbs import database, stats
 from openbbs.config import load_config
-from openbbs.database import Database
+from openbbs.database import (MIGRATIONS, ConnectionPool, Database, Writer,
+                              initialize_database, migrate, rebuild_counters,
+                              rebuild_search_index)
 
 
 class DatabaseCreationTest(unittest.TestCase):
@@ -35,6 +41,55 @@ class DatabaseCreationTest(unittest.TestCase):
                                      "type='table' AND name='pms';")
         self.assertTrue(self.database.cursor.fetchone())
 
+    def test_database_migration(self):
+        self.database.cursor.execute("PRAGMA user_version;")
+        self.assertEqual(self.database.cursor.fetchone()[0], len(MIGRATIONS))
+        self.database.cursor.execute("EXPLAIN QUERY PLAN SELECT reason FROM "
+                                     "bans WHERE username = ? OR ip = ?;",
+                                     ("jakob", "127.0.0.1"))
+        plan = " ".join(row[-1] for row in self.database.cursor.fetchall())
+        self.assertIn("bans_username", plan)
+        self.assertIn("bans_ip", plan)
+
+    def test_failed_migration_is_rolled_back(self):
+        connection = sqlite3.connect(":memory:")
+        migrations = database.MIGRATIONS
+        database.MIGRATIONS = (("CREATE TABLE first (a);",
+                                "INSERT INTO first VALUES (1);",
+                                "CREATE TABLE first (a);"),)
+        try:
+            with self.assertRaises(sqlite3.Error):
+                migrate(connection, {})
+        finally:
+            database.MIGRATIONS = migrations
+        self.assertEqual(connection.execute("SELECT name FROM sqlite_master;")
+                         .fetchall(), [])
+        self.assertEqual(connection.execute("PRAGMA user_version;")
+                         .fetchone()[0], 0)
+        connection.close()
+
+    def test_upgrade_existing_database(self):
+        self.database.close()
+        os.remove("./database.db")
+        connection = sqlite3.connect("./database.db")
+        connection.execute("CREATE TABLE users (user_id INTEGER PRIMARY KEY "
+                           "AUTOINCREMENT NOT NULL, username TEXT NOT NULL, "
+                           "user_status TEXT NOT NULL, password TEXT NOT "
+                           "NULL, salt TEXT NOT NULL, last_login INTEGER NOT "
+                           "NULL);")
+        for _ in range(2):
+            connection.execute("INSERT INTO users (username, user_status, "
+                               "password, salt, last_login) VALUES ('jakob', "
+                               "'user', 'a', 'a', 0);")
+        connection.commit()
+        connection.close()
+
+        self.database = Database(load_config("inexistent.ini"))
+        self.database.cursor.execute("SELECT COUNT(*), kdf FROM users;")
+        self.assertEqual(self.database.cursor.fetchone(),
+                         (1, "pbkdf2_sha512$500000"))
+        self.assertFalse(self.database.create_user("jakob", b"memes"))
+
     def test_database_closure(self):
         self.database.close()
         with self.assertRaises(TypeError):
@@ -67,6 +122,19 @@ class DatabaseAccountTest(unittest.TestCase):
         self.assertEqual(self.database.attempt_login("kakob", b"nenes"),
                          (None, None))
 
+    def test_authenticate_summary(self):
+        self.database.create_user("jakob", b"memes")
+        self.database.make_post("a", "a", "a", "technology")
+        self.database.send_pm("a", "jakob", "Hello!")
+        self.database.cursor.execute("UPDATE users SET last_login = 0;")
+        self.database.connection.commit()
+        status, last_login, posts, messages = \
+            self.database.authenticate("jakob", b"memes")
+        self.assertTrue(status)
+        self.assertEqual((last_login, posts, messages), (0, 1, 1))
+        self.assertEqual(self.database.authenticate("jakob", b"nenes"),
+                         (None, None, None, None))
+
     def test_login_new_op(self):
         self.database.create_user("jakob", b"memes")
         self.database.config["operators"] = "jakob"
@@ -98,6 +166,42 @@ class DatabaseAccountTest(unittest.TestCase):
         self.assertEqual(self.database.cursor.fetchone()[0], "user")
 
 
+class DatabaseRehashTest(unittest.TestCase):
+    def setUp(self):
+        self.config = dict(load_config("inexistent.ini"))
+        self.config["hash_iterations"] = 1000
+        self.config["operators"] = ""
+        if os.path.exists("./database.db"):
+            os.rename("./database.db", "./database.old.db")
+        self.database = Database(self.config)
+        self.database.create_user("jakob", b"memes")
+
+    def tearDown(self):
+        self.database.close()
+        os.remove("./database.db")
+        if os.path.exists("./database.old.db"):
+            os.rename("./database.old.db", "./database.db")
+
+    def get_kdf(self):
+        self.database.cursor.execute("SELECT kdf FROM users WHERE username "
+                                     "= 'jakob';")
+        return self.database.cursor.fetchone()[0]
+
+    @unittest.skipUnless(hasattr(hashlib, "scrypt"), "scrypt unavailable")
+    def test_rehash_on_login(self):
+        self.assertEqual(self.get_kdf(), "pbkdf2_sha512$1000")
+        self.config["kdf"] = "scrypt"
+        self.config["scrypt_n"] = 1024
+        self.assertEqual(self.database.attempt_login("jakob", b"nenes"),
+                         (None, None))
+        self.assertEqual(self.get_kdf(), "pbkdf2_sha512$1000")
+        self.assertEqual(self.database.attempt_login("jakob", b"memes")[0],
+                         "user")
+        self.assertEqual(self.get_kdf(), "scrypt$1024$8$1")
+        self.assertEqual(self.database.attempt_login("jakob", b"memes")[0],
+                         "user")
+
+
 class DatabasePostTest(unittest.TestCase):
     def setUp(self):
         config = load_config("inexistent.ini")
@@ -118,6 +222,55 @@ class DatabasePostTest(unittest.TestCase):
         self.assertTrue(self.database.get_posts("technology"))
         self.database.make_post("a", "a", "a", "technology")
         self.assertTrue(self.database.get_posts("technology", "1"))
+        self.assertFalse(self.database.get_posts("random", "1"))
+
+    def test_get_board_pages(self):
+        for number in range(4):
+            self.database.make_post("a", str(number), "a", "technology")
+        first = self.database.get_posts("technology", limit=2)
+        self.assertEqual([post[0] for post in first], [5, 4])
+        second = self.database.get_posts("technology", limit=2,
+                                         after=first[-1][0])
+        self.assertEqual([post[0] for post in second], [3, 2])
+        previous = self.database.get_posts("technology", limit=2,
+                                           before=second[0][0])
+        self.assertEqual(previous, first)
+
+    def test_get_thread_pages(self):
+        for number in range(3):
+            self.database.make_post("a", None, str(number), "technology",
+                                    reply=1)
+        self.database.make_post("b", "Other", "Other", "technology")
+        first = self.database.get_posts("technology", "1", limit=2)
+        self.assertEqual([post[0] for post in first], [1, 2])
+        second = self.database.get_posts("technology", "1", limit=2,
+                                         after=first[-1][0])
+        self.assertEqual([post[0] for post in second], [3, 4])
+        self.assertFalse(self.database.get_posts("technology", "1", limit=2,
+                                                 after=second[-1][0]))
+        self.assertEqual(self.database.get_posts("technology", "1", limit=2,
+                                                 before=second[0][0]), first)
+
+    def test_get_new_posts(self):
+        for number in range(4):
+            self.database.make_post("a", str(number), "a", "technology")
+        self.database.make_post("a", None, "a", "technology", reply=1)
+        posts = self.database.get_posts("technology", limit=2, since=2)
+        self.assertEqual([post[0] for post in posts], [4, 3])
+        posts = self.database.get_posts("technology", "1", since=1)
+        self.assertEqual([post[0] for post in posts], [6])
+        self.assertFalse(self.database.get_posts("technology", since=6))
+
+    def test_board_version(self):
+        version = self.database.get_board_version("technology")
+        self.assertEqual(self.database.get_board_version("random"), 0)
+        self.database.make_post("a", "a", "a", "technology")
+        self.assertEqual(self.database.get_board_version("technology"),
+                         version + 1)
+        self.database.delete_post(1)
+        self.assertEqual(self.database.get_board_version("technology"),
+                         version + 2)
+        self.assertEqual(self.database.get_board_version("random"), 0)
 
     def test_get_total_post_count(self):
         self.assertEqual(self.database.get_post_count(), 1)
@@ -131,6 +284,110 @@ class DatabasePostTest(unittest.TestCase):
         self.assertEqual(self.database.get_post_count("technology"), 0)
 
 
+class DatabaseCounterTest(unittest.TestCase):
+    def setUp(self):
+        self.config = dict(load_config("inexistent.ini"))
+        self.config["hash_iterations"] = 1000
+        self.config["operators"] = ""
+        if os.path.exists("./database.db"):
+            os.rename("./database.db", "./database.old.db")
+        self.database = Database(self.config)
+        self.database.create_user("jakob", b"memes")
+
+    def tearDown(self):
+        self.database.close()
+        os.remove("./database.db")
+        if os.path.exists("./database.old.db"):
+            os.rename("./database.old.db", "./database.db")
+
+    def test_post_counter(self):
+        self.assertEqual(self.database.get_post_count(), 0)
+        self.database.make_post("a", "a", "a", "technology")
+        self.database.make_post("a", "a", "a", "technology")
+        self.database.delete_post(1)
+        self.assertEqual(self.database.get_post_count(), 1)
+
+    def test_unread_counter(self):
+        for _ in range(3):
+            self.database.send_pm("a", "jakob", "Hello!")
+        self.assertEqual(self.database.get_pm_count("jakob"), 3)
+        self.database.get_specific_pm("jakob", 1)
+        self.database.get_specific_pm("jakob", 1)
+        self.assertEqual(self.database.get_pm_count("jakob"), 2)
+        self.database.get_pms("jakob")
+        self.assertEqual(self.database.get_pm_count("jakob"), 0)
+        self.assertEqual(self.database.get_pm_count("kakob"), 0)
+
+    def test_posts_since_login(self):
+        self.database.make_post("a", "a", "a", "technology")
+        self.assertEqual(self.database.authenticate("jakob", b"memes")[2], 1)
+        self.assertEqual(self.database.authenticate("jakob", b"memes")[2], 0)
+
+    def test_rebuild_counters(self):
+        self.database.make_post("a", "a", "a", "technology")
+        self.database.send_pm("a", "jakob", "Hello!")
+        self.assertEqual(rebuild_counters(self.database.cursor), [])
+        self.database.cursor.execute("UPDATE counters SET value = 5;")
+        self.database.cursor.execute("DELETE FROM unread;")
+        self.assertEqual(rebuild_counters(self.database.cursor),
+                         [("posts", 5, 1), ("unread:jakob", 0, 1)])
+        self.assertEqual(self.database.get_post_count(), 1)
+        self.assertEqual(self.database.get_pm_count("jakob"), 1)
+
+
+class DatabaseSearchTest(unittest.TestCase):
+    def setUp(self):
+        self.config = dict(load_config("inexistent.ini"))
+        self.config["operators"] = ""
+        if os.path.exists("./database.db"):
+            os.rename("./database.db", "./database.old.db")
+        self.database = Database(self.config)
+        self.database.make_post("jakob", "Install Gentoo", "Compile it all.",
+                                "technology")
+        self.database.make_post("kakob", None, "Gentoo, gentoo and gentoo.",
+                                "technology", reply=1)
+        self.database.make_post("jakob", "Cats", "Gentoo is a penguin.",
+                                "random")
+
+    def tearDown(self):
+        self.database.close()
+        os.remove("./database.db")
+        if os.path.exists("./database.old.db"):
+            os.rename("./database.old.db", "./database.db")
+
+    def test_ranked_results(self):
+        results = self.database.search_posts("gentoo")
+        self.assertEqual([result[:3] for result in results],
+                         [(1, "technology", "kakob"),
+                          (1, "technology", "jakob"),
+                          (3, "random", "jakob")])
+        self.assertEqual(self.database.search_posts("gentoo penguin"),
+                         [(3, "random", "jakob", "Gentoo is a penguin.")])
+
+    def test_board_and_pages(self):
+        results = self.database.search_posts("gentoo", "technology", limit=1)
+        self.assertEqual(results[0][2], "kakob")
+        results = self.database.search_posts("gentoo", "technology", limit=1,
+                                             offset=1)
+        self.assertEqual(results[0][2], "jakob")
+        self.assertEqual(self.database.search_posts("gentoo", "technology",
+                                                    offset=2), [])
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(self.database.search_posts('"gentoo OR ('), [])
+        self.assertEqual(self.database.search_posts("   "), [])
+
+    def test_deleted_posts_are_not_found(self):
+        self.database.delete_post(3)
+        self.assertEqual(self.database.search_posts("penguin"), [])
+
+    def test_rebuild_search_index(self):
+        self.database.cursor.execute("DROP TABLE posts_search;")
+        self.database.connection.commit()
+        self.assertEqual(rebuild_search_index(self.config), 3)
+        self.assertEqual(len(self.database.search_posts("gentoo")), 3)
+
+
 class DatabasePMTest(unittest.TestCase):
     def setUp(self):
         self.config = load_config("inexistent.ini")
@@ -157,3 +414,161 @@ class DatabasePMTest(unittest.TestCase):
         time.sleep(1)
         self.database = Database(self.config)
         self.assertFalse(self.database.get_pms("jakob"))
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.config = load_config("inexistent.ini")
+        if os.path.exists("./database.db"):
+            os.rename("./database.db", "./database.old.db")
+        initialize_database(self.config)
+        self.pool = ConnectionPool(self.config, 2)
+
+    def tearDown(self):
+        self.pool.close()
+        os.remove("./database.db")
+        if os.path.exists("./database.old.db"):
+            os.rename("./database.old.db", "./database.db")
+
+    def test_reuse_connections(self):
+        database = Database(self.config, pool=self.pool)
+        connection = database.connection
+        database.close()
+        database = Database(self.config, pool=self.pool)
+        self.assertIs(database.connection, connection)
+        database.close()
+        self.assertEqual(self.pool.opened, 1)
+
+    def test_bounded_size(self):
+        first = self.pool.acquire()
+        second = self.pool.acquire()
+        self.assertIsNot(first, second)
+        self.assertEqual(self.pool.opened, 2)
+        waiter = threading.Thread(target=lambda: self.pool.release(
+            self.pool.acquire()))
+        waiter.start()
+        waiter.join(0.1)
+        self.assertTrue(waiter.is_alive())
+        self.pool.release(first)
+        waiter.join(5)
+        self.assertFalse(waiter.is_alive())
+        self.pool.release(second)
+        self.assertEqual(self.pool.opened, 2)
+
+    def test_pooled_operations(self):
+        database = Database(self.config, pool=self.pool)
+        database.make_post("jakob", "Hello!", "Test!", "technology")
+        database.close()
+        database = Database(self.config, pool=self.pool)
+        self.assertEqual(database.get_post_count(), 1)
+        database.close()
+
+
+class WriterTest(unittest.TestCase):
+    def setUp(self):
+        self.config = dict(load_config("inexistent.ini"))
+        self.config["commit_interval"] = 0.2
+        if os.path.exists("./database.db"):
+            os.rename("./database.db", "./database.old.db")
+        initialize_database(self.config)
+        self.writer = Writer(self.config)
+        stats.reset()
+
+    def tearDown(self):
+        self.writer.close()
+        os.remove("./database.db")
+        if os.path.exists("./database.old.db"):
+            os.rename("./database.old.db", "./database.db")
+
+    def insert(self, cursor, number):
+        cursor.execute("INSERT INTO bans (username, reason) VALUES (?, "
+                       "'Test.');", (str(number),))
+        return number
+
+    def test_purges_old_messages(self):
+        self.writer.close()
+        self.config["max_message_age"] = 60
+        self.config["purge_interval"] = 0.05
+        self.writer = Writer(self.config)
+
+        def send(cursor, sent, read):
+            cursor.execute("INSERT INTO pms (sender, receiver, message, "
+                           "time, read) VALUES ('a', 'b', 'Hi', ?, ?);",
+                           (sent, read))
+
+        self.writer.execute(send, 0, 1)
+        self.writer.execute(send, 0, 0)
+        self.writer.execute(send, int(time.time()), 1)
+        time.sleep(0.3)
+        connection = sqlite3.connect("./database.db")
+        try:
+            kept = connection.execute("SELECT time != 0, read FROM pms "
+                                      "ORDER BY message_id;").fetchall()
+        finally:
+            connection.close()
+        self.assertEqual(kept, [(0, 0), (1, 1)])
+
+    def test_group_commit(self):
+        results = []
+        threads = [threading.Thread(target=lambda number: results.append(
+            self.writer.execute(self.insert, number)), args=(number,))
+                   for number in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), list(range(10)))
+        self.assertEqual(stats.get("database.writes"), 10)
+        self.assertLess(stats.get("database.commits"), 10)
+
+    def test_failed_write_is_isolated(self):
+        def fail(cursor):
+            self.insert(cursor, "failed")
+            raise ValueError("Test failure.")
+
+        errors = []
+
+        def attempt():
+            try:
+                self.writer.execute(fail)
+            except ValueError as error:
+                errors.append(error)
+
+        failing = threading.Thread(target=attempt)
+        failing.start()
+        self.writer.execute(self.insert, 1)
+        failing.join()
+        self.assertEqual(len(errors), 1)
+
+        database = Database(self.config)
+        database.cursor.execute("SELECT username FROM bans;")
+        self.assertEqual(database.cursor.fetchall(), [("1",)])
+        database.close()
+
+    def test_failed_batch(self):
+        def end_transaction(cursor):
+            self.insert(cursor, "failed")
+            cursor.execute("COMMIT;")
+
+        with self.assertRaises(sqlite3.Error):
+            self.writer.execute(end_transaction)
+        self.assertEqual(self.writer.execute(self.insert, 1), 1)
+
+    def test_unexpected_error_fails_batch(self):
+        def fail(*args):
+            raise RuntimeError("Test failure.")
+
+        increment = stats.increment
+        stats.increment = fail
+        try:
+            with self.assertRaises(RuntimeError):
+                self.writer.execute(self.insert, 1)
+        finally:
+            stats.increment = increment
+        self.assertEqual(self.writer.execute(self.insert, 2), 2)
+
+    def test_wal_journal(self):
+        database = Database(self.config)
+        database.cursor.execute("PRAGMA journal_mode;")
+        self.assertEqual(database.cursor.fetchone()[0], "wal")
+        database.close()
@@ -1,7 +1,9 @@
+import textwrap
 import unittest
 
-from openbbs.formatters import (box_boards, box_inbox, box_message, box_posts,
-                                box_thread, scrub_input)
+from openbbs.formatters import (_wrap, box_boards, box_inbox, box_message,
+                                box_posts, box_thread, iter_new_posts,
+                                iter_new_replies, iter_thread, scrub_input)
 
 
 class FormattersTest(unittest.TestCase):
@@ -14,6 +16,41 @@ class FormattersTest(unittest.TestCase):
     def test_box_thread(self):
         self.assertTrue(box_thread(((1, 1, "a", "a", "a"),),))
 
+    def test_box_boards_layout(self):
+        separator = "+" + "=" * 78 + "+\r\n"
+        self.assertEqual(box_boards(("a:b",)),
+                         separator + "|" + " " * 32 + "BOARD LISTING" +
+                         " " * 33 + "|\r\n" + separator + "| a" + " " * 17 +
+                         " | " + " " * 54 + "b |\r\n" + separator)
+
+    def test_box_thread_title(self):
+        posts = ((2, 1, "a", None, "a"),)
+        self.assertIn("| " + " " * 37 + "Hi" + " " * 37 + " |",
+                      box_thread(posts, "Hi"))
+
+    def test_iter_thread_chunks(self):
+        posts = ((1, 1, "a", "a", "a"), (2, 1, "b", None, "b"))
+        chunks = list(iter_thread(posts))
+        self.assertEqual(len(chunks), 5)
+        self.assertTrue(all(isinstance(chunk, bytes) for chunk in chunks))
+        self.assertEqual(b"".join(chunks).decode(), box_thread(posts))
+
+    def test_new_rows_continue_listings(self):
+        separator = "+" + "=" * 78 + "+\r\n"
+        posts = ((1, 1, "a", "a", "a"), (2, 1, "b", "b", "b"))
+        new_posts = b"".join(iter_new_posts(posts[1:])).decode()
+        self.assertEqual(box_posts(posts[:1]) + new_posts[len(separator):],
+                         box_posts(posts))
+        new_replies = b"".join(iter_new_replies(posts[1:])).decode()
+        self.assertEqual(box_thread(posts[:1]) +
+                         new_replies[len(separator):], box_thread(posts))
+
+    def test_wrap_matches_textwrap(self):
+        for text in ("", "word " * 40, ("word " * 40).strip(),
+                     "a" * 80 + " b", "well-known  spacing\tand tabs",
+                     " ".join("x" * length for length in range(1, 30))):
+            self.assertEqual(_wrap(text), textwrap.wrap(text, width=76))
+
     def test_box_inbox(self):
         self.assertTrue(box_inbox(((1, "a", "a", 1, "a"),),))
 
@@ -0,0 +1,106 @@
+import hashlib
+import threading
+import unittest
+
+from openbbs import hashing, stats
+from openbbs.hashing import HashingBusy, HashingPool
+
+
+class HashingPoolTest(unittest.TestCase):
+    def setUp(self):
+        stats.reset()
+        self.release = threading.Event()
+        self.order = []
+        self.pool = HashingPool(1, 4, 2)
+
+    def tearDown(self):
+        self.release.set()
+        self.pool.close()
+
+    def blocking_hash(self, name):
+        self.release.wait()
+        self.order.append(name)
+        return name
+
+    def submit(self, name, client):
+        thread = threading.Thread(target=self.pool.submit,
+                                  args=(self.blocking_hash, (name,), client))
+        thread.start()
+        return thread
+
+    def wait_queued(self, count):
+        while stats.get("hashing.queued") != count:
+            threading.Event().wait(0.01)
+
+    def test_result(self):
+        self.release.set()
+        self.assertEqual(self.pool.submit(self.blocking_hash, ("a",)), "a")
+        self.assertEqual(stats.get_timing("hashing.time")[0], 1)
+        self.assertEqual(stats.get_timing("hashing.wait")[0], 1)
+
+    def test_round_robin_between_clients(self):
+        threads = [self.submit("first", "a")]
+        self.wait_queued(0)
+        threads.append(self.submit("a1", "a"))
+        self.wait_queued(1)
+        threads.append(self.submit("a2", "a"))
+        self.wait_queued(2)
+        threads.append(self.submit("b1", "b"))
+        self.wait_queued(3)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.order, ["first", "a1", "b1", "a2"])
+
+    def test_limits(self):
+        threads = [self.submit("first", "a")]
+        self.wait_queued(0)
+        threads += [self.submit("a1", "a"), self.submit("a2", "a")]
+        self.wait_queued(2)
+        with self.assertRaises(HashingBusy):
+            self.pool.submit(self.blocking_hash, ("a3",), "a")
+        threads += [self.submit("b1", "b"), self.submit("c1", "c")]
+        self.wait_queued(4)
+        with self.assertRaises(HashingBusy):
+            self.pool.submit(self.blocking_hash, ("d1",), "d")
+        self.assertEqual(stats.get("hashing.refused"), 2)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+
+    def test_run_without_pool(self):
+        self.assertEqual(hashing.run(len, ("abc",), "a"), 3)
+
+
+class KeyDerivationTest(unittest.TestCase):
+    def test_policy(self):
+        config = {"kdf": "pbkdf2_sha512", "hash_iterations": "1000"}
+        self.assertEqual(hashing.policy(config), "pbkdf2_sha512$1000")
+        config = {"kdf": "scrypt", "scrypt_n": "1024", "scrypt_r": "8",
+                  "scrypt_p": "1"}
+        self.assertEqual(hashing.policy(config), "scrypt$1024$8$1")
+
+    def test_derive(self):
+        pbkdf2 = hashing.derive(b"a", b"salt", "pbkdf2_sha512$1000")
+        self.assertEqual(len(pbkdf2), 128)
+        self.assertEqual(pbkdf2, hashing.derive(b"a", b"salt",
+                                                "pbkdf2_sha512$1000"))
+        with self.assertRaises(ValueError):
+            hashing.derive(b"a", b"salt", "md5$1")
+
+    @unittest.skipUnless(hasattr(hashlib, "scrypt"), "scrypt unavailable")
+    def test_derive_scrypt(self):
+        pbkdf2 = hashing.derive(b"a", b"salt", "pbkdf2_sha512$1000")
+        scrypt = hashing.derive(b"a", b"salt", "scrypt$1024$8$1")
+        self.assertEqual(len(scrypt), 128)
+        self.assertNotEqual(pbkdf2, scrypt)
+
+    @unittest.skipUnless(hasattr(hashlib, "scrypt"), "scrypt unavailable")
+    def test_calibrate_scrypt(self):
+        self.assertEqual(dict(hashing.calibrate("scrypt", 0))["scrypt_n"],
+                         1024)
+
+    def test_calibrate(self):
+        settings = dict(hashing.calibrate("pbkdf2_sha512", 0.01))
+        self.assertEqual(settings["kdf"], "pbkdf2_sha512")
+        self.assertGreaterEqual(settings["hash_iterations"], 1000)
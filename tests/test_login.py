@@ -13,6 +13,11 @@ class LoginPromptTest(unittest.TestCase):
         dummy_user = DummyUser("login", "a", "b", "quit")
         self.assertEqual(prompt(dummy_user), (None, None))
 
+    def test_login_while_busy(self):
+        dummy_user = DummyUser("login", "busy", "a", "quit")
+        self.assertEqual(prompt(dummy_user), (None, None))
+        self.assertEqual(dummy_user.counter, 3)
+
     def test_register_user(self):
         dummy_user = DummyUser("register", "a", "a", "a")
         self.assertEqual(prompt(dummy_user), ("a", "user"))
@@ -0,0 +1,79 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from openbbs import metrics, stats
+from openbbs.metrics import Exporter, json_text, prometheus_text
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        stats.reset()
+        stats.increment("sessions.accepted", 3)
+        stats.record("command.board", 0.00005)
+        stats.record("command.board", 0.0003)
+        stats.record("query.get_posts", 1000)
+
+    def test_prometheus_text(self):
+        lines = prometheus_text().splitlines()
+        self.assertIn("openbbs_sessions_accepted 3", lines)
+        self.assertEqual(lines.count("# TYPE openbbs_command_seconds "
+                                     "histogram"), 1)
+        self.assertIn('openbbs_command_seconds_bucket{name="board",'
+                      'le="0.0001"} 1', lines)
+        self.assertIn('openbbs_command_seconds_bucket{name="board",'
+                      'le="0.0004"} 2', lines)
+        self.assertIn('openbbs_command_seconds_bucket{name="board",'
+                      'le="+Inf"} 2', lines)
+        self.assertIn('openbbs_command_seconds_count{name="board"} 2', lines)
+        self.assertIn('openbbs_query_seconds_bucket{name="get_posts",'
+                      'le="+Inf"} 1', lines)
+        self.assertIn('openbbs_query_seconds_sum{name="get_posts"} 1000.0',
+                      lines)
+
+    def test_json_text(self):
+        document = json.loads(json_text())
+        self.assertEqual(document["values"], {"sessions.accepted": 3})
+        timing = document["timings"]["command.board"]
+        self.assertEqual(timing["count"], 2)
+        self.assertEqual(timing["max"], 0.0003)
+        self.assertLessEqual(timing["p50"], timing["p99"])
+
+    def test_unknown_format(self):
+        self.assertRaises(ValueError, Exporter, "metrics", "xml", 60)
+
+
+class ExportTest(unittest.TestCase):
+    def setUp(self):
+        stats.reset()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "metrics.prom")
+
+    def tearDown(self):
+        metrics.stop()
+        shutil.rmtree(self.directory)
+
+    def test_disabled(self):
+        metrics.start({"metrics_file": "", "workers": 1})
+        metrics.stop()
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_written_on_stop(self):
+        metrics.start({"metrics_file": self.path, "workers": 1,
+                       "metrics_format": "json", "metrics_interval": 60})
+        stats.increment("sessions.accepted")
+        metrics.stop()
+        self.assertEqual(os.listdir(self.directory), ["metrics.prom"])
+        with open(self.path) as metrics_file:
+            self.assertEqual(json.load(metrics_file)["values"],
+                             {"sessions.accepted": 1})
+
+    def test_file_per_worker(self):
+        metrics.start({"metrics_file": self.path, "workers": 2,
+                       "metrics_format": "prometheus",
+                       "metrics_interval": 60})
+        metrics.stop()
+        self.assertEqual(os.listdir(self.directory),
+                         ["metrics.prom.%d" % os.getpid()])
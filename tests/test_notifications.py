@@ -0,0 +1,188 @@
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from openbbs import notifications, stats
+from openbbs.config import load_config
+from openbbs.database import Database
+from openbbs.formatters import iter_new_replies
+from openbbs.notifications import (Hub, Notice, Subscriber, encode,
+                                   newest_post)
+from openbbs.session import UserSession
+from openbbs.shell import follow_topics
+from tests.dummy_objects import DummyDatabase, DummyUser
+
+
+def texts(subscriber):
+    """Returns the text of every notice queued for the subscriber."""
+    return [notice.text for notice in subscriber.pop_all()]
+
+
+class HubTest(unittest.TestCase):
+    def setUp(self):
+        stats.reset()
+        self.hub = Hub()
+
+    def test_publish_to_followers(self):
+        first, second = Subscriber(4), Subscriber(4)
+        self.hub.follow(first, [("board", "random")])
+        self.hub.follow(second, [("board", "random"), ("inbox", "jakob")])
+        self.assertEqual(self.hub.publish(("board", "random"), "a"), 2)
+        self.assertEqual(self.hub.publish(("inbox", "jakob"), "b"), 1)
+        self.assertEqual(self.hub.publish(("inbox", "kakob"), "c"), 0)
+        self.assertEqual(texts(first), ["a"])
+        self.assertEqual(texts(second), ["a", "b"])
+        self.assertEqual(texts(second), [])
+
+    def test_origin_is_not_notified(self):
+        first, second = Subscriber(4), Subscriber(4)
+        self.hub.follow(first, [("thread", "1")])
+        self.hub.follow(second, [("thread", "1")])
+        self.hub.publish(("thread", "1"), "a", origin=first)
+        self.assertEqual(texts(first), [])
+        self.assertEqual(texts(second), ["a"])
+
+    def test_follow_replaces_topics(self):
+        subscriber = Subscriber(4)
+        self.hub.follow(subscriber, [("board", "random")])
+        self.hub.follow(subscriber, [("thread", "1")])
+        self.hub.publish(("board", "random"), "a")
+        self.hub.publish(("thread", "1"), "b")
+        self.assertEqual(texts(subscriber), ["b"])
+        self.hub.follow(subscriber, ())
+        self.assertEqual(self.hub.topics, {})
+
+    def test_bounded_queue(self):
+        woken = []
+        subscriber = Subscriber(2, lambda: woken.append(True))
+        for notice in ("a", "b", "c"):
+            subscriber.push(notice)
+        self.assertEqual(subscriber.pop_all(), ["a", "b"])
+        self.assertEqual(len(woken), 2)
+        self.assertEqual(stats.get("notifications.dropped"), 1)
+
+
+class EncodeTest(unittest.TestCase):
+    def test_notices(self):
+        notice = Notice(("inbox", "jakob"), "New message from a.", None)
+        self.assertEqual(encode([notice, notice], "1"),
+                         b"\r\n* New message from a.\r\n" * 2)
+
+    def test_followed_replies(self):
+        post = (2, 0, "b", None, "Hello")
+        notice = Notice(("thread", "1"), "New reply in #1 by b.", post)
+        self.assertEqual(encode([notice]),
+                         b"\r\n* New reply in #1 by b.\r\n")
+        self.assertEqual(encode([notice], "1"),
+                         b"\r\n" + b"".join(iter_new_replies([post])))
+
+    def test_newest_post(self):
+        notices = [Notice(("thread", "1"), "", (number, 0, "b", None, ""))
+                   for number in (3, 2)]
+        notices.append(Notice(("inbox", "jakob"), "", None))
+        self.assertEqual(newest_post(notices, "1"), 3)
+        self.assertIsNone(newest_post(notices, "2"))
+        self.assertIsNone(newest_post(notices))
+
+
+class SessionNotificationTest(unittest.TestCase):
+    def setUp(self):
+        self.client, self.peer = socket.socketpair()
+        self.peer.settimeout(1)
+        self.user = UserSession(self.client, DummyDatabase(), "", 1, 4096,
+                                Subscriber(4))
+        notifications.follow(self.user.subscriber, [("inbox", "jakob")])
+
+    def tearDown(self):
+        notifications.unfollow(self.user.subscriber)
+        self.client.close()
+        self.peer.close()
+
+    def test_notice_while_waiting(self):
+        lines = []
+        reader = threading.Thread(target=lambda:
+                                  lines.append(self.user.receive()))
+        reader.start()
+        for _ in range(100):
+            if self.user.waiting:
+                break
+            time.sleep(0.01)
+        notifications.publish(("inbox", "jakob"), "New message from a.")
+        self.assertEqual(self.peer.recv(1024),
+                         b"\r\n* New message from a.\r\n")
+        self.peer.send(b"b\r\n")
+        reader.join(1)
+        self.assertEqual(lines, ["b"])
+
+    def test_followed_reply_is_seen(self):
+        self.user.following = "1"
+        self.user.latest = 1
+        notifications.follow(self.user.subscriber, [("thread", "1")])
+        notifications.publish(("thread", "1"), "New reply in #1 by b.",
+                              post=(2, 0, "b", None, "Hello"))
+        self.peer.send(b"b\r\n")
+        self.assertEqual(self.user.receive(), "b")
+        self.assertIn(b"Hello", self.peer.recv(1024))
+        self.assertEqual(self.user.latest, 2)
+
+    def test_notice_while_busy(self):
+        notifications.publish(("inbox", "jakob"), "New message from a.")
+        self.user.send("output")
+        self.peer.send(b"b\r\n")
+        self.assertEqual(self.user.receive(), "b")
+        self.assertEqual(self.peer.recv(1024),
+                         b"output\r\n\r\n* New message from a.\r\n")
+
+
+class PublishTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.config = dict(load_config("inexistent.ini"))
+        self.config["database"] = os.path.join(self.directory, "test.db")
+        self.config["hash_iterations"] = 1000
+        self.config["operators"] = ""
+        self.subscriber = Subscriber(4)
+        self.database = Database(self.config)
+        self.database.create_user("jakob", b"memes")
+
+    def tearDown(self):
+        notifications.unfollow(self.subscriber)
+        self.database.close()
+        os.remove(self.config["database"])
+        os.rmdir(self.directory)
+
+    def test_follow_topics(self):
+        user = DummyUser()
+        user.name, user.status = "jakob", "user"
+        user.current_board = "technology"
+        follow_topics(user)
+        self.assertEqual(user.subscriber.topics,
+                         {("inbox", "jakob"), ("board", "technology")})
+        user.current_thread = "1"
+        user.status = "coward"
+        follow_topics(user)
+        self.assertEqual(user.subscriber.topics, {("thread", "1")})
+        notifications.unfollow(user.subscriber)
+
+    def test_posts_and_messages(self):
+        notifications.follow(self.subscriber,
+                             [("inbox", "jakob"), ("board", "technology"),
+                              ("thread", "1")])
+        self.assertEqual(self.database.make_post("a", "Hi", "Hi",
+                                                 "technology"), 1)
+        self.database.make_post("b", None, "Hello", "technology", reply="1")
+        self.database.send_pm("c", "jakob", "Hey")
+        self.database.send_pm("c", "nobody", "Hey")
+        self.assertEqual(texts(self.subscriber),
+                         ["New thread #1 on technology by a.",
+                          "New reply in #1 by b.",
+                          "New message from c."])
+
+    def test_own_posts(self):
+        notifications.follow(self.subscriber, [("board", "technology")])
+        self.database.subscriber = self.subscriber
+        self.database.make_post("a", "Hi", "Hi", "technology")
+        self.assertEqual(self.subscriber.pop_all(), [])
@@ -0,0 +1,71 @@
+import socket
+import threading
+import time
+import unittest
+
+from openbbs import stats
+from openbbs.pool import SessionPool
+
+
+class SessionPoolTest(unittest.TestCase):
+    def setUp(self):
+        stats.reset()
+        self.release = threading.Event()
+        self.handled = []
+        self.pool = SessionPool(self.handler,
+                                {"max_sessions": 2, "queue_size": 1})
+        self.pairs = []
+
+    def tearDown(self):
+        self.release.set()
+        for server_side, client_side in self.pairs:
+            server_side.close()
+            client_side.close()
+
+    def handler(self, client, ip_address, config):
+        self.release.wait()
+        self.handled.append(ip_address)
+
+    def submit(self, ip_address):
+        pair = socket.socketpair()
+        self.pairs.append(pair)
+        return self.pool.submit(pair[0], ip_address), pair[1]
+
+    def wait_for(self, condition):
+        deadline = time.time() + 5
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_admission_control(self):
+        self.assertTrue(self.submit("a")[0])
+        self.assertTrue(self.submit("b")[0])
+        self.wait_for(lambda: stats.get("sessions.active") == 2)
+
+        admitted, queued_client = self.submit("c")
+        self.assertTrue(admitted)
+        self.assertEqual(queued_client.recv(1024),
+                         b"The server is busy, you are #1 in line.\r\n")
+        self.assertEqual(stats.get("sessions.queued"), 1)
+
+        admitted, rejected_client = self.submit("d")
+        self.assertFalse(admitted)
+        self.assertTrue(rejected_client.recv(1024).startswith(
+            b"The server is full"))
+        self.assertEqual(stats.get("sessions.rejected"), 1)
+
+        self.release.set()
+        self.wait_for(lambda: len(self.handled) == 3)
+        self.assertEqual(sorted(self.handled), ["a", "b", "c"])
+        self.assertEqual(self.pool.threads, 2)
+
+    def test_survives_session_exit(self):
+        self.pool.handler = lambda *args: exit(0)
+        self.submit("a")
+        self.wait_for(lambda: stats.get("sessions.active") == 0 and
+                      self.pool.idle == 1)
+        self.assertEqual(self.pool.threads, 1)
+        self.pool.handler = self.handler
+        self.release.set()
+        self.submit("b")
+        self.wait_for(lambda: self.handled)
+        self.assertEqual(self.handled, ["b"])
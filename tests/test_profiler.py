@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from openbbs import profiler
+from openbbs.profiler import Profiler, thread_dump
+from openbbs.shell import profile_server, send_thread_dump
+from tests.dummy_objects import DummyUser
+
+
+def spin(stopped):
+    while not stopped.is_set():
+        sum(range(1000))
+
+
+class ProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.config = {"profile_directory": self.directory,
+                       "profile_duration": 0.2, "profile_interval": 0.005}
+        self.stopped = threading.Event()
+        self.threads = [threading.Thread(target=spin, args=(self.stopped,),
+                                         name="spinning"),
+                        threading.Thread(target=self.stopped.wait,
+                                         name="waiting")]
+        for thread in self.threads:
+            thread.start()
+
+    def tearDown(self):
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+        shutil.rmtree(self.directory)
+
+    def test_profile(self):
+        path = os.path.join(self.directory, "profile")
+        sampler = Profiler(0.2, 0.005, path)
+        sampler.thread.start()
+        sampler.thread.join()
+        self.assertGreater(sampler.samples, 0)
+        self.assertGreater(sampler.idle, 0)
+        with open(path + ".folded") as folded:
+            stacks = folded.read().splitlines()
+        spinning = [stack for stack in stacks if "spin (" in stack]
+        self.assertTrue(spinning)
+        self.assertTrue(all(int(stack.rsplit(" ", 1)[1]) > 0
+                            for stack in spinning))
+        leaves = [stack.rsplit(" ", 1)[0].split(";")[-1] for stack in stacks]
+        self.assertFalse([leaf for leaf in leaves
+                          if leaf.startswith("wait (threading.py")])
+        with open(path + ".txt") as summary:
+            self.assertIn("spin (test_profiler.py", summary.read())
+
+    def test_one_profile_at_a_time(self):
+        path = profiler.start(self.config)
+        sampler = profiler._profiler
+        self.assertTrue(path.startswith(self.directory))
+        self.assertIsNone(profiler.start(self.config))
+        sampler.thread.join()
+        self.assertTrue(os.path.exists(path + ".folded"))
+        self.assertEqual(sampler.duration, 0.2)
+
+    def test_thread_dump(self):
+        dump = thread_dump()
+        self.assertIn("Thread \"spinning\"", dump)
+        self.assertIn("in spin", dump)
+
+    def test_commands(self):
+        user = DummyUser()
+        send_thread_dump(user, ("threads",))
+        self.assertIn("Thread \"waiting\"", user.last_message)
+        profile_server(user, ("profile", "forever"), self.config)
+        self.assertEqual(user.last_message,
+                         "Profiles last up to 600 seconds.\r\n")
+        user.status = "user"
+        profile_server(user, ("profile",), self.config)
+        self.assertEqual(user.last_message, "You can't do that!\r\n")
+        send_thread_dump(user, ("threads",))
+        self.assertEqual(user.last_message, "You can't do that!\r\n")
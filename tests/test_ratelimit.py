@@ -0,0 +1,116 @@
+import unittest
+
+from openbbs import ratelimit, stats
+from openbbs.login import login_user
+from openbbs.ratelimit import RateLimiter
+from openbbs.shell import check_rate
+from tests.dummy_objects import DummyUser
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        stats.reset()
+
+    def test_burst_and_refill(self):
+        limiter = RateLimiter("command", 2, 3)
+        for _ in range(3):
+            self.assertTrue(limiter.allow(["a"], now=100))
+        self.assertFalse(limiter.allow(["a"], now=100))
+        self.assertTrue(limiter.allow(["a"], now=100.5))
+        self.assertFalse(limiter.allow(["a"], now=100.5))
+        self.assertEqual(stats.get("throttled.command"), 2)
+
+    def test_refill_is_capped_by_burst(self):
+        limiter = RateLimiter("command", 1, 2)
+        self.assertTrue(limiter.allow(["a"], now=0))
+        for _ in range(2):
+            self.assertTrue(limiter.allow(["a"], now=1000))
+        self.assertFalse(limiter.allow(["a"], now=1000))
+
+    def test_keys_are_independent(self):
+        limiter = RateLimiter("login", 1, 1)
+        self.assertTrue(limiter.allow(["a"], now=0))
+        self.assertTrue(limiter.allow(["b"], now=0))
+        self.assertFalse(limiter.allow(["a"], now=0))
+
+    def test_empty_bucket_takes_no_tokens(self):
+        limiter = RateLimiter("login", 1, 1)
+        self.assertTrue(limiter.allow(["name"], now=0))
+        self.assertFalse(limiter.allow(["address", "name"], now=0))
+        self.assertTrue(limiter.allow(["address"], now=0))
+
+    def test_refund(self):
+        limiter = RateLimiter("command", 1, 2)
+        self.assertTrue(limiter.allow(["a", "b"], now=0))
+        self.assertTrue(limiter.allow(["a"], now=0))
+        limiter.refund(["a", "b"], now=0)
+        self.assertTrue(limiter.allow(["a"], now=0))
+        self.assertFalse(limiter.allow(["a"], now=0))
+        self.assertEqual(limiter.buckets["b"], (2, 0))
+
+    def test_full_buckets_are_pruned(self):
+        limiter = RateLimiter("connection", 1, 1)
+        limiter.prune_size = 2
+        limiter.allow(["a"], now=0)
+        limiter.allow(["b"], now=0)
+        limiter.allow(["c"], now=10)
+        self.assertEqual(list(limiter.buckets), ["c"])
+
+
+class RateLimitTest(unittest.TestCase):
+    def setUp(self):
+        stats.reset()
+        ratelimit.start({"connection_rate": 0, "connection_burst": 0,
+                         "login_rate": 0.001, "login_burst": 1,
+                         "command_rate": 0.001, "command_burst": 3,
+                         "listing_rate": 0.001, "listing_burst": 1,
+                         "post_rate": 0, "post_burst": 0})
+
+    def tearDown(self):
+        ratelimit.stop()
+
+    def test_disabled_limits(self):
+        for _ in range(100):
+            self.assertTrue(ratelimit.allow("connection", "127.0.0.1"))
+
+    def test_stopped_limits(self):
+        ratelimit.stop()
+        for _ in range(100):
+            self.assertTrue(ratelimit.allow("login", "127.0.0.1"))
+
+    def test_address_and_name(self):
+        self.assertTrue(ratelimit.allow("login", "127.0.0.1", "a"))
+        self.assertFalse(ratelimit.allow("login", "127.0.0.2", "a"))
+        self.assertFalse(ratelimit.allow("login", "127.0.0.1", "b"))
+        self.assertTrue(ratelimit.allow("login", "127.0.0.2", "b"))
+
+    def test_expensive_commands(self):
+        user = DummyUser()
+        self.assertTrue(check_rate(user, "board"))
+        self.assertFalse(check_rate(user, "refresh"))
+        self.assertEqual(user.last_message, ratelimit.COMMANDS + "\r\n")
+        # The refused refresh gave its command token back.
+        self.assertTrue(check_rate(user, "help"))
+        self.assertTrue(check_rate(user, "help"))
+        self.assertFalse(check_rate(user, "help"))
+        self.assertEqual(stats.get("throttled.listing"), 1)
+        self.assertEqual(stats.get("throttled.command"), 1)
+
+    def test_anonymous_users_are_limited_by_address(self):
+        user = DummyUser()
+        user.name, user.status = "Anonymous", "coward"
+        other = DummyUser()
+        other.name, other.status = "Anonymous", "coward"
+        other.ip_address = "127.0.0.2"
+        self.assertTrue(check_rate(user, "help"))
+        self.assertTrue(check_rate(other, "help"))
+        self.assertTrue(check_rate(user, "help"))
+        self.assertTrue(check_rate(user, "help"))
+        self.assertFalse(check_rate(user, "help"))
+        self.assertTrue(check_rate(other, "help"))
+
+    def test_login_attempts(self):
+        self.assertEqual(login_user(DummyUser("a", "b")), None)
+        user = DummyUser("a", "a")
+        self.assertIsNone(login_user(user))
+        self.assertEqual(user.last_message, ratelimit.LOGINS + "\r\n")
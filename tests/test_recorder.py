@@ -0,0 +1,69 @@
+import json
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+from openbbs import recorder
+from openbbs.session import UserSession
+from tests.dummy_objects import DummyDatabase
+
+
+def read_records(path):
+    with open(path) as records:
+        return [json.loads(record) for record in records]
+
+
+class RecorderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "sessions.log")
+
+    def tearDown(self):
+        recorder.stop()
+        shutil.rmtree(self.directory)
+
+    def test_disabled(self):
+        recorder.start({"record_file": "", "workers": 1})
+        self.assertIsNone(recorder.session())
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_records(self):
+        recorder.start({"record_file": self.path, "workers": 1})
+        first, second = recorder.session(), recorder.session()
+        first.line("board random")
+        second.line(None)
+        first.close()
+        first.close()
+        recorder.stop()
+        records = read_records(self.path)
+        self.assertEqual([record[:2] for record in records],
+                         [["open", 1], ["open", 2], ["line", 1],
+                          ["line", 2], ["close", 1]])
+        self.assertEqual(records[2][3], "board random")
+        self.assertIsNone(records[3][3])
+        self.assertLess(records[2][2], 1)
+
+    def test_file_per_worker(self):
+        recorder.start({"record_file": self.path, "workers": 4})
+        recorder.session()
+        recorder.stop()
+        self.assertEqual(os.listdir(self.directory),
+                         ["sessions.log.%d" % os.getpid()])
+
+    def test_session_input(self):
+        recorder.start({"record_file": self.path, "workers": 1})
+        client, peer = socket.socketpair()
+        user = UserSession(client, DummyDatabase(), "127.0.0.1")
+        peer.send(b"l\r\njakob\r\nhunter2\r\n")
+        self.assertEqual(user.receive(), "l")
+        self.assertEqual(user.receive(), "jakob")
+        self.assertEqual(user.receive(secret=True), "hunter2")
+        self.assertRaises(SystemExit, user.close)
+        peer.close()
+        recorder.stop()
+        records = read_records(self.path)
+        self.assertEqual([record[-1] for record in records[1:-1]],
+                         ["l", "jakob", None])
+        self.assertEqual(records[-1][0], "close")
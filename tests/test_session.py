@@ -1,7 +1,12 @@
+import os
+import socket
+import tempfile
 import unittest
 
+from openbbs import notifications, session, stats
 from openbbs.config import load_config
-from openbbs.session import UserSession, handle
+from openbbs.database import ConnectionPool, initialize_database
+from openbbs.session import FLUSH_SIZE, UserSession, handle
 from tests.dummy_objects import (DummyClient, DummyDatabase)
 
 
@@ -15,9 +20,88 @@ class UserEncapsulationTest(unittest.TestCase):
             user.close()
 
 
+class BufferedOutputTest(unittest.TestCase):
+    def setUp(self):
+        self.client, self.peer = socket.socketpair()
+        self.peer.settimeout(1)
+
+    def tearDown(self):
+        self.client.close()
+        self.peer.close()
+
+    def test_output_waits_for_input(self):
+        user = UserSession(self.client, DummyDatabase(), "")
+        user.send("a")
+        user.send("b", end="")
+        self.assertEqual(user.output_size, 4)
+        self.peer.send(b"c\r\n")
+        self.assertEqual(user.receive(), "c")
+        self.assertEqual(self.peer.recv(1024), b"a\r\nb")
+
+    def test_pipelined_input(self):
+        user = UserSession(self.client, DummyDatabase(), "")
+        self.peer.send(b"a\r\nb\r\nc")
+        self.peer.close()
+        self.assertEqual([user.receive() for _ in range(3)], ["a", "b", "c"])
+        with self.assertRaises(SystemExit):
+            user.receive()
+
+    def test_large_output_is_flushed(self):
+        user = UserSession(self.client, DummyDatabase(), "")
+        user.stream(iter([b"a" * FLUSH_SIZE, b"b"]))
+        self.assertEqual(user.output_size, 3)
+
+    def test_stalled_client_is_hung_up(self):
+        stats.reset()
+        self.client.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        user = UserSession(self.client, DummyDatabase(), "", 0.1)
+        with self.assertRaises(SystemExit):
+            for _ in range(1024):
+                user.write(b"a" * FLUSH_SIZE)
+        self.assertEqual(stats.get("sessions.stalled"), 1)
+
+    def test_no_delay(self):
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+        client = socket.create_connection(server.getsockname())
+        try:
+            UserSession(client, DummyDatabase(), "")
+            self.assertTrue(client.getsockopt(socket.IPPROTO_TCP,
+                                              socket.TCP_NODELAY))
+        finally:
+            client.close()
+            server.close()
+
+
 class ClientHandler(unittest.TestCase):
     def test_handler(self):
         config = load_config("./inexistent.ini")
         client = DummyClient(b"quit")
         with self.assertRaises(SystemExit):
             handle(client, "", config)
+
+    def test_handler_cleans_up_after_errors(self):
+        directory = tempfile.mkdtemp()
+        config = dict(load_config("./inexistent.ini"))
+        config["database"] = os.path.join(directory, "test.db")
+        initialize_database(config)
+        pool = ConnectionPool(config, 1)
+        sessions = []
+
+        def failing_shell(user, config):
+            sessions.append(user)
+            notifications.follow(user.subscriber, [("board", "main")])
+            raise RuntimeError("Command failed.")
+
+        shell, session.shell = session.shell, failing_shell
+        try:
+            with self.assertRaises(RuntimeError):
+                handle(DummyClient(b"anonymous"), "", config, pool)
+            self.assertEqual(sessions[0].subscriber.topics, frozenset())
+            self.assertEqual(pool.idle.qsize(), 1)
+        finally:
+            session.shell = shell
+            pool.close()
+            os.remove(config["database"])
+            os.rmdir(directory)
@@ -1,10 +1,18 @@
+import os
+import tempfile
 import unittest
 
+from openbbs import cache, stats
+from openbbs import shell as shell_module
 from openbbs.config import load_config
+from openbbs.database import Database
 from openbbs.shell import (ban_user, change_board, change_thread, delete_post,
-                           deop_user, get_inbox, get_more, handle_bogus_input,
-                           make_post, op_user, refresh_all, send_help_text,
-                           send_message, send_rules, send_server_info, shell,
+                           deop_user, follow_thread, follow_topics, get_inbox,
+                           get_more, handle_bogus_input, jump_to_page,
+                           make_post, next_page, op_user,
+                           previous_page, refresh_all, render_screens,
+                           search_posts, send_help_text, send_message,
+                           send_rules, send_server_info, send_stats, shell,
                            unban_user)
 from tests.dummy_objects import DummyUser
 
@@ -20,8 +28,21 @@ class AuxiliaryCommandsTest(unittest.TestCase):
 
     def test_send_help_text(self):
         send_help_text(self.dummy_user, None)
-        self.assertEqual(self.dummy_user.last_message[:24],
-                         "[D]ELETE\tDelete a post\r\n")
+        self.assertIn("[D]ELETE\tDelete a post\r\n",
+                      self.dummy_user.last_message)
+        self.dummy_user.status = "coward"
+        send_help_text(self.dummy_user, None)
+        self.assertNotIn("[I]NBOX", self.dummy_user.last_message)
+
+    def test_render_screens(self):
+        config = dict(load_config("./inexistent.ini"))
+        config["rules"] = "Be nice."
+        render_screens(config)
+        try:
+            send_rules(self.dummy_user, None, {})
+            self.assertEqual(self.dummy_user.last_message, "Be nice.\r\n")
+        finally:
+            shell_module._screens.clear()
 
     def test_send_rules(self):
         config = load_config("./inexistent.ini")
@@ -93,6 +114,162 @@ class NavigationCommandsTest(unittest.TestCase):
         refresh_all(self.dummy_user, None, ["random:a"])
         self.assertTrue(self.dummy_user.last_message)
 
+    def test_change_board_starts_first_page(self):
+        self.dummy_user.page = (5, 8)
+        change_board(self.dummy_user, (None, "random"), ("random:a",), 10)
+        self.assertEqual(self.dummy_user.page, (1, 1))
+
+    def test_next_page(self):
+        self.dummy_user.current_board = "random"
+        next_page(self.dummy_user, None, 10)
+        self.assertEqual(self.dummy_user.page, (1, 1))
+        next_page(self.dummy_user, None, 10)
+        self.assertEqual(self.dummy_user.last_message,
+                         "There are no more posts.\r\n")
+
+    def test_previous_page(self):
+        self.dummy_user.current_board = "random"
+        previous_page(self.dummy_user, None, 10)
+        self.assertEqual(self.dummy_user.last_message,
+                         "You are on the first page.\r\n")
+        self.dummy_user.page = (1, 1)
+        previous_page(self.dummy_user, None, 10)
+        self.assertEqual(self.dummy_user.last_message,
+                         "You are on the first page.\r\n")
+
+    def test_jump_to_page(self):
+        self.dummy_user.current_board = "random"
+        jump_to_page(self.dummy_user, (None, "a"), 10)
+        self.assertEqual(self.dummy_user.last_message,
+                         "Invalid post number.\r\n")
+        jump_to_page(self.dummy_user, (None,), 10)
+        self.assertEqual(self.dummy_user.page, (1, 1))
+
+    def test_cached_listing(self):
+        config = dict(load_config("./inexistent.ini"))
+        config["cache_size"] = 65536
+        cache.start(config)
+        try:
+            self.dummy_user.current_board = "random"
+            refresh_all(self.dummy_user, None, ["random:a"], 10)
+            listing = self.dummy_user.last_message
+            self.dummy_user.database.get_posts = None
+            refresh_all(self.dummy_user, ("refresh", "all"), ["random:a"], 10)
+            self.assertEqual(self.dummy_user.last_message, listing)
+            self.assertEqual(self.dummy_user.page, (1, 1))
+        finally:
+            cache.stop()
+
+    def test_cached_thread_from_another_board(self):
+        directory = tempfile.mkdtemp()
+        config = dict(load_config("./inexistent.ini"))
+        config["database"] = os.path.join(directory, "test.db")
+        config["cache_size"] = 65536
+        cache.start(config)
+        database = Database(config)
+        try:
+            thread = database.make_post("a", "Hi", "There", "technology")
+            self.dummy_user.database = database
+            self.dummy_user.current_board = "random"
+            change_thread(self.dummy_user, (None, str(thread)), 10)
+            self.assertEqual(self.dummy_user.last_message,
+                             "Thread %d does not exist.\r\n" % thread)
+            self.dummy_user.current_board = "technology"
+            change_thread(self.dummy_user, (None, str(thread)), 10)
+            database.make_post("b", "", "General Kenobi", "technology",
+                               thread)
+            refresh_all(self.dummy_user, ("refresh", "all"), [], 10)
+            self.assertIn("General Kenobi", self.dummy_user.last_message)
+        finally:
+            cache.stop()
+            database.close()
+            os.remove(config["database"])
+            os.rmdir(directory)
+
+    def test_refresh_new_posts(self):
+        self.dummy_user.current_board = "random"
+        refresh_all(self.dummy_user, ("refresh",), ["random:a"], 10)
+        self.assertIn("THREAD LISTING", self.dummy_user.last_message)
+        self.assertEqual(self.dummy_user.latest, 1)
+        refresh_all(self.dummy_user, ("refresh",), ["random:a"], 10)
+        self.assertNotIn("THREAD LISTING", self.dummy_user.last_message)
+        self.assertIn("| #2 ", self.dummy_user.last_message)
+        self.assertEqual(self.dummy_user.latest, 2)
+        refresh_all(self.dummy_user, ("refresh",), ["random:a"], 10)
+        self.assertEqual(self.dummy_user.last_message,
+                         "There are no new posts.\r\n")
+        refresh_all(self.dummy_user, ("refresh", "all"), ["random:a"], 10)
+        self.assertIn("THREAD LISTING", self.dummy_user.last_message)
+
+    def test_changing_listing_forgets_latest(self):
+        change_board(self.dummy_user, (None, "random"), ["random:a"], 10)
+        self.assertEqual(self.dummy_user.latest, 1)
+        change_thread(self.dummy_user, (None, "2"), 10)
+        self.assertIsNone(self.dummy_user.latest)
+
+    def test_follow_thread(self):
+        follow_thread(self.dummy_user, None, 10)
+        self.assertEqual(self.dummy_user.last_message,
+                         "You can only follow a thread.\r\n")
+        self.dummy_user.current_board = "random"
+        self.dummy_user.current_thread = "1"
+        follow_thread(self.dummy_user, None, 10)
+        self.assertEqual(self.dummy_user.following, "1")
+        self.assertEqual(self.dummy_user.latest, 2)
+        follow_thread(self.dummy_user, None, 10)
+        self.assertIsNone(self.dummy_user.following)
+        follow_thread(self.dummy_user, None, 10)
+        self.dummy_user.current_thread = None
+        follow_topics(self.dummy_user)
+        self.assertIsNone(self.dummy_user.following)
+
+    def test_paging_on_overboard(self):
+        next_page(self.dummy_user, None, 10)
+        self.assertEqual(self.dummy_user.last_message,
+                         "There are no posts here.\r\n")
+
+
+class SearchCommandTest(unittest.TestCase):
+    def setUp(self):
+        self.dummy_user = DummyUser()
+
+    def test_search_with_params(self):
+        search_posts(self.dummy_user, ("search", "gentoo"), 20)
+        self.assertIn("SEARCH RESULTS", self.dummy_user.last_message)
+        self.assertIn("Install Gentoo", self.dummy_user.last_message)
+        self.assertEqual(self.dummy_user.database.searched,
+                         ("gentoo", None, 20, 0))
+
+    def test_search_current_board(self):
+        self.dummy_user.current_board = "technology"
+        self.dummy_user.messages = ("gentoo",)
+        search_posts(self.dummy_user, ("search",), 20)
+        self.assertEqual(self.dummy_user.database.searched,
+                         ("gentoo", "technology", 20, 0))
+
+    def test_search_more_results(self):
+        search_posts(self.dummy_user, ("search", "gentoo"), 20)
+        self.dummy_user.messages = ("",)
+        search_posts(self.dummy_user, ("search",), 20)
+        self.assertEqual(self.dummy_user.database.searched,
+                         ("gentoo", None, 20, 1))
+        self.assertEqual(self.dummy_user.last_message,
+                         "There are no more results.\r\n")
+        self.dummy_user.counter = -1
+        search_posts(self.dummy_user, ("search",), 20)
+        self.assertEqual(self.dummy_user.last_message,
+                         "There is no search to continue.\r\n")
+
+    def test_search_without_results(self):
+        search_posts(self.dummy_user, ("search", "nothing"), 20)
+        self.assertEqual(self.dummy_user.last_message,
+                         "No posts matched \"nothing\".\r\n")
+
+    def test_search_unavailable(self):
+        search_posts(self.dummy_user, ("search", "unavailable"), 20)
+        self.assertEqual(self.dummy_user.last_message,
+                         "Search is not available on this BBS.\r\n")
+
 
 class PrivateMessagingCommandsTest(unittest.TestCase):
     def setUp(self):
@@ -213,6 +390,18 @@ class AdministrationCommandsTest(unittest.TestCase):
         self.assertEqual(self.dummy_user.last_message,
                          "User meme successfully banned.\r\n")
 
+    def test_ban_address(self):
+        ban_user(self.dummy_user, (None, "10.0.0.1", "no"))
+        self.assertEqual(self.dummy_user.database.banned, (None, "10.0.0.1"))
+        ban_user(self.dummy_user, (None, "10.1.2.3/16", "no"))
+        self.assertEqual(self.dummy_user.database.banned,
+                         (None, "10.1.0.0/16"))
+        ban_user(self.dummy_user, (None, "meme", "no"))
+        self.assertEqual(self.dummy_user.database.banned, ("meme", None))
+        unban_user(self.dummy_user, (None, "10.1.0.0/16"))
+        self.assertEqual(self.dummy_user.database.unbanned,
+                         (None, "10.1.0.0/16"))
+
     def test_ban_user_fail_on_not_sysop(self):
         self.dummy_user.status = "coward"
         ban_user(self.dummy_user, (None, "meme", "no"))
@@ -270,6 +459,30 @@ class AdministrationCommandsTest(unittest.TestCase):
         self.assertEqual(self.dummy_user.last_message,
                          "You can't do that!\r\n")
 
+    def test_send_stats(self):
+        stats.reset()
+        stats.increment("sessions.rejected")
+        send_stats(self.dummy_user, None)
+        self.assertEqual(self.dummy_user.last_message,
+                         "%-32s 1\r\n" % "sessions.rejected")
+
+    def test_send_stats_timings(self):
+        stats.reset()
+        stats.increment("sessions.rejected")
+        stats.record("query.get_posts", 0.002)
+        stats.record("command.board", 0.001)
+        send_stats(self.dummy_user, (None, "query"))
+        lines = self.dummy_user.last_message.split("\r\n")
+        self.assertTrue(lines[0].startswith("TIMING (MS)"))
+        self.assertEqual(lines[1].split()[:3], ["query.get_posts", "1", "2.0"])
+        self.assertEqual(len(lines), 3)
+
+    def test_send_stats_fail_on_not_sysop(self):
+        self.dummy_user.status = "user"
+        send_stats(self.dummy_user, None)
+        self.assertEqual(self.dummy_user.last_message,
+                         "You can't do that!\r\n")
+
 
 class CommandInterpreterTest(unittest.TestCase):
     def test_accept_commands(self):
@@ -0,0 +1,61 @@
+import unittest
+
+from openbbs import stats
+
+
+class StatisticsTest(unittest.TestCase):
+    def setUp(self):
+        stats.reset()
+
+    def test_counters(self):
+        stats.increment("a")
+        stats.increment("a", 2)
+        self.assertEqual(stats.get("a"), 3)
+        self.assertEqual(stats.get("b"), 0)
+
+    def test_gauges(self):
+        stats.set_value("b", 5)
+        stats.set_value("b", 2)
+        self.assertEqual(stats.snapshot(), [("b", 2)])
+
+    def test_timings(self):
+        stats.record("a", 0.5)
+        stats.record("a", 1.5)
+        self.assertEqual(stats.get_timing("a"), (2, 2.0, 1.5))
+        self.assertEqual(stats.snapshot(), [])
+        (name, count, total, maximum, buckets), = stats.timings()
+        self.assertEqual((name, count, total, maximum), ("a", 2, 2.0, 1.5))
+        self.assertEqual(sum(buckets), 2)
+
+    def test_percentiles(self):
+        for milliseconds in range(1, 101):
+            stats.record("a", milliseconds / 1000.0)
+        _, _, _, maximum, buckets = stats.timings()[0]
+        for fraction in (0.5, 0.95, 0.99):
+            actual = fraction / 10
+            estimate = stats.percentile(buckets, maximum, fraction)
+            # Estimates are within a bucket, which spans a factor of two.
+            self.assertTrue(actual / 2 <= estimate <= actual * 2)
+        self.assertEqual(stats.percentile(buckets, maximum, 1), 0.1)
+        self.assertEqual(stats.percentile([0] * len(buckets), 0, 0.5), 0)
+
+    def test_timer_leaves_out_waiting(self):
+        with stats.timer("a"):
+            stats.waited(10)
+        self.assertLess(stats.get_timing("a")[1], 1)
+
+    def test_timed_function(self):
+        timed = stats.timed("a")(lambda value: value * 2)
+        self.assertEqual(timed(2), 4)
+        self.assertEqual(stats.get_timing("a")[0], 1)
+
+    def test_timed_generator(self):
+        @stats.timed("a")
+        def generate():
+            yield 1
+            yield 2
+        self.assertEqual(list(generate()), [1, 2])
+        partial = generate()
+        next(partial)
+        partial.close()
+        self.assertEqual(stats.get_timing("a")[0], 2)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import unittest
+
+from openbbs import stats
+from openbbs.telnet import DO, DONT, IAC, SB, SE, WILL, WONT, LineReader
+
+
+def octets(*values):
+    return bytes(bytearray(values))
+
+
+class LineFramingTest(unittest.TestCase):
+    def setUp(self):
+        self.reader = LineReader(16)
+
+    def test_pipelined_lines(self):
+        self.reader.feed(b"login\r\njakob\r\nmemes\r\n")
+        self.assertEqual(list(self.reader.lines), ["login", "jakob", "memes"])
+
+    def test_line_across_packets(self):
+        self.reader.feed(b"hel")
+        self.assertIsNone(self.reader.readline())
+        self.reader.feed(b"lo\r")
+        self.reader.feed(b"\nworld\n")
+        self.assertEqual(self.reader.readline(), "hello")
+        self.assertEqual(self.reader.readline(), "world")
+        self.assertIsNone(self.reader.readline())
+
+    def test_line_endings(self):
+        self.reader.feed(b"a\rb\r\x00c\nd\r\n")
+        self.assertEqual(list(self.reader.lines), ["a", "b", "c", "d"])
+
+    def test_split_multibyte_character(self):
+        data = "café\r\n".encode("utf-8")
+        self.reader.feed(data[:4])
+        self.reader.feed(data[4:])
+        self.assertEqual(self.reader.readline(), "café")
+
+    def test_invalid_utf8(self):
+        self.reader.feed(b"a\xfeb\r\n")
+        self.assertEqual(self.reader.readline(), "a�b")
+
+    def test_maximum_length(self):
+        stats.reset()
+        self.reader.feed(b"a" * 10)
+        self.reader.feed(b"a" * 10 + b"\r\nb\r\n")
+        self.assertEqual(list(self.reader.lines), ["a" * 16, "b"])
+        self.assertTrue(stats.get("input.truncated"))
+
+    def test_finish(self):
+        self.reader.feed(b"quit")
+        self.assertEqual(self.reader.finish(), "quit")
+        self.assertIsNone(self.reader.finish())
+
+
+class NegotiationTest(unittest.TestCase):
+    def setUp(self):
+        self.reader = LineReader(4096)
+
+    def test_refuse_options(self):
+        replies = self.reader.feed(octets(IAC, DO, 1, IAC, WILL, 31,
+                                          IAC, WONT, 3, IAC, DONT, 5))
+        self.assertEqual(replies, octets(IAC, WONT, 1, IAC, DONT, 31))
+        self.assertIsNone(self.reader.readline())
+
+    def test_strip_negotiation_from_lines(self):
+        self.reader.feed(b"he" + octets(IAC, DO, 1) + b"llo" +
+                         octets(IAC, SB, 24, 0) + b"xterm" +
+                         octets(IAC, SE) + b"\r\n")
+        self.assertEqual(self.reader.readline(), "hello")
+
+    def test_command_across_packets(self):
+        self.reader.feed(b"a" + octets(IAC))
+        self.assertEqual(self.reader.feed(octets(DO)), b"")
+        self.assertEqual(self.reader.feed(octets(1) + b"b\r\n"),
+                         octets(IAC, WONT, 1))
+        self.assertEqual(self.reader.readline(), "ab")
+
+    def test_escaped_iac(self):
+        self.reader.feed(octets(IAC, IAC) + b"\r\n")
+        self.assertEqual(self.reader.readline(), "�")